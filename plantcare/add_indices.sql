@@ -5,12 +5,26 @@ CREATE INDEX IF NOT EXISTS idx_tanaman_nama ON tanaman(nama);
 CREATE INDEX IF NOT EXISTS idx_tanaman_jenis ON tanaman(jenis);
 CREATE INDEX IF NOT EXISTS idx_tanaman_lokasi ON tanaman(lokasi);
 CREATE INDEX IF NOT EXISTS idx_tanaman_created_at ON tanaman(created_at);
+-- Keyset pagination GET /tanaman?cursor=... (ORDER BY created_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_tanaman_created_at_id ON tanaman(created_at DESC, id DESC);
 
 -- Indeks untuk tabel jadwal
 CREATE INDEX IF NOT EXISTS idx_jadwal_tanaman ON jadwal(nama_tanaman);
 CREATE INDEX IF NOT EXISTS idx_jadwal_tanggal ON jadwal(tanggal);
 CREATE INDEX IF NOT EXISTS idx_jadwal_kegiatan ON jadwal(kegiatan);
 CREATE INDEX IF NOT EXISTS idx_jadwal_tanaman_tanggal ON jadwal(nama_tanaman, tanggal);
+-- Keyset pagination GET /jadwal?cursor=... (ORDER BY tanggal ASC, id ASC)
+CREATE INDEX IF NOT EXISTS idx_jadwal_tanggal_id ON jadwal(tanggal, id);
+
+-- Trigram indexes for substring search (GET /tanaman?search=, GET /jadwal?search=).
+-- B-tree indexes cannot serve ILIKE '%term%'; GIN gin_trgm_ops indexes can,
+-- and pg_trgm also provides word_similarity() for ?sort=relevance.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_tanaman_nama_trgm ON tanaman USING gin (nama gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_tanaman_jenis_trgm ON tanaman USING gin (jenis gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_tanaman_lokasi_trgm ON tanaman USING gin (lokasi gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_jadwal_nama_tanaman_trgm ON jadwal USING gin (nama_tanaman gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_jadwal_kegiatan_trgm ON jadwal USING gin (kegiatan gin_trgm_ops);
 
 -- CRITICAL: Index untuk login performance
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
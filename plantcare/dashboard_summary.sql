@@ -0,0 +1,198 @@
+-- Trigger-maintained aggregates for GET /dashboard
+--
+-- The dashboard reads row totals, today's schedule count and the plant
+-- counts per jenis from these tables instead of running COUNT(*) and
+-- GROUP BY over tanaman/jadwal. Statement-level triggers with
+-- transition tables keep them exact in the writing transaction, with one
+-- update per statement, including bulk INSERTs and COPY imports.
+-- Schedules are counted per date, so "today" is looked up with
+-- CURRENT_DATE at read time and rolls over at midnight by itself.
+--
+-- Run after db_setup.sql; safe to re-run. refresh_dashboard_summary()
+-- rebuilds every aggregate from the base tables.
+
+CREATE TABLE IF NOT EXISTS dashboard_totals (
+    table_name VARCHAR(50) PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS tanaman_jenis_counts (
+    jenis VARCHAR(100),
+    jumlah BIGINT NOT NULL DEFAULT 0
+);
+-- One row per jenis, NULL included (kept distinct from '')
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tanaman_jenis_counts_key
+    ON tanaman_jenis_counts ((jenis IS NULL), (COALESCE(jenis, '')));
+
+CREATE TABLE IF NOT EXISTS jadwal_date_counts (
+    tanggal DATE PRIMARY KEY,
+    jumlah BIGINT NOT NULL DEFAULT 0
+);
+
+
+CREATE OR REPLACE FUNCTION refresh_dashboard_summary() RETURNS void AS $$
+BEGIN
+    -- Block writers while recounting so no delta is lost
+    LOCK TABLE tanaman, jadwal IN SHARE MODE;
+
+    DELETE FROM dashboard_totals;
+    INSERT INTO dashboard_totals (table_name, row_count)
+    SELECT 'tanaman', COUNT(*) FROM tanaman
+    UNION ALL
+    SELECT 'jadwal', COUNT(*) FROM jadwal;
+
+    DELETE FROM tanaman_jenis_counts;
+    INSERT INTO tanaman_jenis_counts (jenis, jumlah)
+    SELECT jenis, COUNT(*) FROM tanaman GROUP BY jenis;
+
+    DELETE FROM jadwal_date_counts;
+    INSERT INTO jadwal_date_counts (tanggal, jumlah)
+    SELECT tanggal, COUNT(*) FROM jadwal WHERE tanggal IS NOT NULL GROUP BY tanggal;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- tanaman: total and per-jenis counts
+--
+-- Each trigger names only the transition tables of its own event (INSERT:
+-- new_rows, DELETE: old_rows, UPDATE: both), and PL/pgSQL fails on any
+-- statement mentioning one that is not there, so every branch reads only
+-- the tables its trigger declares. Upserts are sorted so concurrent
+-- writers lock counter rows in the same order.
+CREATE OR REPLACE FUNCTION tanaman_summary_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE dashboard_totals SET row_count = 0 WHERE table_name = 'tanaman';
+        DELETE FROM tanaman_jenis_counts;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        UPDATE dashboard_totals SET row_count = row_count + (SELECT COUNT(*) FROM new_rows)
+        WHERE table_name = 'tanaman';
+
+        INSERT INTO tanaman_jenis_counts AS c (jenis, jumlah)
+        SELECT jenis, COUNT(*) FROM new_rows
+        GROUP BY jenis
+        ORDER BY jenis IS NULL, COALESCE(jenis, '')
+        ON CONFLICT ((jenis IS NULL), (COALESCE(jenis, '')))
+        DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE dashboard_totals SET row_count = row_count - (SELECT COUNT(*) FROM old_rows)
+        WHERE table_name = 'tanaman';
+
+        INSERT INTO tanaman_jenis_counts AS c (jenis, jumlah)
+        SELECT jenis, -COUNT(*) FROM old_rows
+        GROUP BY jenis
+        ORDER BY jenis IS NULL, COALESCE(jenis, '')
+        ON CONFLICT ((jenis IS NULL), (COALESCE(jenis, '')))
+        DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Row count is unchanged; only rows whose jenis changed move
+        INSERT INTO tanaman_jenis_counts AS c (jenis, jumlah)
+        SELECT jenis, SUM(change) FROM (
+            SELECT jenis, 1 AS change FROM new_rows
+            UNION ALL
+            SELECT jenis, -1 AS change FROM old_rows
+        ) d
+        GROUP BY jenis
+        HAVING SUM(change) <> 0
+        ORDER BY jenis IS NULL, COALESCE(jenis, '')
+        ON CONFLICT ((jenis IS NULL), (COALESCE(jenis, '')))
+        DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+    END IF;
+
+    DELETE FROM tanaman_jenis_counts WHERE jumlah <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- jadwal: total and per-date counts (branches as in tanaman_summary_apply)
+CREATE OR REPLACE FUNCTION jadwal_summary_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE dashboard_totals SET row_count = 0 WHERE table_name = 'jadwal';
+        DELETE FROM jadwal_date_counts;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        UPDATE dashboard_totals SET row_count = row_count + (SELECT COUNT(*) FROM new_rows)
+        WHERE table_name = 'jadwal';
+
+        INSERT INTO jadwal_date_counts AS c (tanggal, jumlah)
+        SELECT tanggal, COUNT(*) FROM new_rows
+        WHERE tanggal IS NOT NULL
+        GROUP BY tanggal
+        ORDER BY tanggal
+        ON CONFLICT (tanggal) DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE dashboard_totals SET row_count = row_count - (SELECT COUNT(*) FROM old_rows)
+        WHERE table_name = 'jadwal';
+
+        INSERT INTO jadwal_date_counts AS c (tanggal, jumlah)
+        SELECT tanggal, -COUNT(*) FROM old_rows
+        WHERE tanggal IS NOT NULL
+        GROUP BY tanggal
+        ORDER BY tanggal
+        ON CONFLICT (tanggal) DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO jadwal_date_counts AS c (tanggal, jumlah)
+        SELECT tanggal, SUM(change) FROM (
+            SELECT tanggal, 1 AS change FROM new_rows
+            UNION ALL
+            SELECT tanggal, -1 AS change FROM old_rows
+        ) d
+        WHERE tanggal IS NOT NULL
+        GROUP BY tanggal
+        HAVING SUM(change) <> 0
+        ORDER BY tanggal
+        ON CONFLICT (tanggal) DO UPDATE SET jumlah = c.jumlah + EXCLUDED.jumlah;
+    END IF;
+
+    DELETE FROM jadwal_date_counts WHERE jumlah <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Transition tables can only be named by triggers for a single event,
+-- so each event gets its own trigger
+DROP TRIGGER IF EXISTS tanaman_summary_insert ON tanaman;
+DROP TRIGGER IF EXISTS tanaman_summary_update ON tanaman;
+DROP TRIGGER IF EXISTS tanaman_summary_delete ON tanaman;
+DROP TRIGGER IF EXISTS tanaman_summary_truncate ON tanaman;
+CREATE TRIGGER tanaman_summary_insert AFTER INSERT ON tanaman
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION tanaman_summary_apply();
+CREATE TRIGGER tanaman_summary_update AFTER UPDATE ON tanaman
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION tanaman_summary_apply();
+CREATE TRIGGER tanaman_summary_delete AFTER DELETE ON tanaman
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION tanaman_summary_apply();
+CREATE TRIGGER tanaman_summary_truncate AFTER TRUNCATE ON tanaman
+    FOR EACH STATEMENT EXECUTE FUNCTION tanaman_summary_apply();
+
+DROP TRIGGER IF EXISTS jadwal_summary_insert ON jadwal;
+DROP TRIGGER IF EXISTS jadwal_summary_update ON jadwal;
+DROP TRIGGER IF EXISTS jadwal_summary_delete ON jadwal;
+DROP TRIGGER IF EXISTS jadwal_summary_truncate ON jadwal;
+CREATE TRIGGER jadwal_summary_insert AFTER INSERT ON jadwal
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION jadwal_summary_apply();
+CREATE TRIGGER jadwal_summary_update AFTER UPDATE ON jadwal
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION jadwal_summary_apply();
+CREATE TRIGGER jadwal_summary_delete AFTER DELETE ON jadwal
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION jadwal_summary_apply();
+CREATE TRIGGER jadwal_summary_truncate AFTER TRUNCATE ON jadwal
+    FOR EACH STATEMENT EXECUTE FUNCTION jadwal_summary_apply();
+
+-- Backfill from the current contents
+SELECT refresh_dashboard_summary();
@@ -0,0 +1,79 @@
+"""
+Bulk-load tanaman/jadwal data from CSV or NDJSON using COPY.
+
+Usage:
+    python import_data.py tanaman plants.csv
+    python import_data.py jadwal schedules.ndjson --chunk-rows 20000
+    gunzip -c big.csv.gz | python import_data.py tanaman - --format csv
+
+After a successful import the table's cache tags are invalidated in the
+backend configured by the ini file (--ini, default PLANTCARE_INI or
+development.ini). With plantcare.cache.backend = sqlite running servers
+see that at once; with the in-memory backend they cannot be reached
+and serve cached lists of the table until those entries expire.
+"""
+import argparse
+import json
+import os
+import sys
+
+# Make the pyramid_backend package importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public'))
+
+import psycopg2
+from pyramid_backend import caching
+from pyramid_backend.importer import DEFAULT_CHUNK_ROWS, IMPORT_FORMATS, import_stream
+from pyramid_backend.server import load_settings
+
+DEFAULT_INI = os.environ.get(
+    'PLANTCARE_INI', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public', 'pyramid_backend', 'development.ini'))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Import plant or schedule data with COPY FROM STDIN')
+    parser.add_argument('table', choices=['tanaman', 'jadwal'])
+    parser.add_argument('path', help="CSV/NDJSON file, or '-' for stdin")
+    parser.add_argument('--format', choices=IMPORT_FORMATS,
+                        help='Input format (default: from the file extension, else csv)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help='Valid rows buffered per COPY round trip')
+    parser.add_argument('--dbname', default=os.environ.get('PGDATABASE', 'plantcare_db'))
+    parser.add_argument('--user', default=os.environ.get('PGUSER', 'postgres'))
+    parser.add_argument('--password', default=os.environ.get('PGPASSWORD', 'jeremiaz'))
+    parser.add_argument('--host', default=os.environ.get('PGHOST', 'localhost'))
+    parser.add_argument('--ini', default=DEFAULT_INI, help='Settings file naming the shared cache backend')
+    return parser.parse_args(argv)
+
+
+def invalidate_cache(ini_path, table):
+    """Drop cached reads of table from the servers' cache backend"""
+    settings = load_settings(ini_path)
+    caching.configure_cache(settings)
+    caching.invalidate_tags(table)
+    if settings.get('plantcare.cache.backend', 'memory') != 'sqlite':
+        print(f"Note: plantcare.cache.backend is not sqlite; running servers keep serving cached "
+              f"{table} results until they expire", file=sys.stderr)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, password=args.password, host=args.host)
+    try:
+        if args.path == '-':
+            report = import_stream(conn, args.table, sys.stdin.buffer, fmt, args.chunk_rows)
+        else:
+            with open(args.path, 'rb') as fileobj:
+                report = import_stream(conn, args.table, fileobj, fmt, args.chunk_rows)
+    finally:
+        conn.close()
+
+    if report['imported']:
+        invalidate_cache(args.ini, args.table)
+    print(json.dumps(report, indent=2))
+    return 1 if report['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
-from wsgiref.simple_server import make_server
+import os
+import sys
 from pyramid.config import Configurator
 from pyramid.response import Response
 from pyramid.view import view_config
@@ -7,43 +8,43 @@ from pyramid.view import view_config
 def main(global_config, **settings):
     config = Configurator(settings=settings)
     from pyramid_backend.views import includeme, cors_tween_factory
+    # Tweens added earlier sit closer to the views: the session tween is
+    # under CORS so its 401s still carry the CORS headers
+    config.add_tween('pyramid_backend.sessions.session_tween_factory')
     config.add_tween('pyramid_backend.views.cors_tween_factory')
+    config.add_tween('pyramid_backend.tracing.query_timing_tween_factory')
+    config.add_tween('pyramid_backend.compression.compression_tween_factory')
+    config.add_tween('pyramid_backend.metrics.metrics_tween_factory')
     config.include(includeme)
     config.include('pyramid_jinja2')
     config.add_route('home', '/')
     config.add_route('dashboard_summary', '/dashboard')
     config.add_route('tanaman', '/tanaman')
+    # Bulk/export/import routes must precede the {id} routes they would otherwise match
+    config.add_route('tanaman_bulk', '/tanaman/bulk')
+    config.add_route('tanaman_export', '/tanaman/export')
+    config.add_route('tanaman_import', '/tanaman/import')
     config.add_route('tanaman_detail', '/tanaman/{id}')
     config.add_route('jadwal', '/jadwal')
+    config.add_route('jadwal_bulk', '/jadwal/bulk')
+    config.add_route('jadwal_export', '/jadwal/export')
+    config.add_route('jadwal_import', '/jadwal/import')
     config.add_route('jadwal_detail', '/jadwal/{id}')
     config.add_route('login', '/login')
     config.add_route('logout', '/logout')
     config.add_route('register', '/register')
+    config.add_route('metrics', '/metrics')
     config.scan('pyramid_backend.views')
     return config.make_wsgi_app()
 
 if __name__ == '__main__':
-    with Configurator() as config:
-        try:
-            # Try absolute import first (for running as a module)
-            from pyramid_backend.views import includeme, cors_tween_factory
-        except ImportError:
-            # Fallback to relative import (for direct script execution)
-            from views import includeme, cors_tween_factory
-        config.add_tween('pyramid_backend.views.cors_tween_factory')
-        config.include(includeme)
-        config.include('pyramid_jinja2')
-        config.add_route('home', '/')
-        config.add_route('dashboard_summary', '/dashboard')
-        config.add_route('tanaman', '/tanaman')
-        config.add_route('tanaman_detail', '/tanaman/{id}')
-        config.add_route('jadwal', '/jadwal')
-        config.add_route('jadwal_detail', '/jadwal/{id}')
-        config.add_route('login', '/login')
-        config.add_route('logout', '/logout')
-        config.add_route('register', '/register')
-        config.scan('pyramid_backend.views')
-        app = config.make_wsgi_app()
-    server = make_server('0.0.0.0', 6543, app)
-    print('Pyramid app running on http://localhost:6543')
-    server.serve_forever()
+    try:
+        # Try absolute import first (for running as a module)
+        from pyramid_backend.server import load_settings, serve
+    except ImportError:
+        # Fallback to relative import (for direct script execution)
+        from server import load_settings, serve
+    # Serving mode, workers and threads come from plantcare.server.* in the ini file
+    ini_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'development.ini')
+    serve(lambda settings: main({}, **settings), load_settings(ini_path),
+          reload_settings=lambda: load_settings(ini_path))
@@ -0,0 +1,622 @@
+"""
+ASGI variant of the PlantCare API on asyncpg
+
+Serves the core routes of views.py (dashboard, tanaman, jadwal, login,
+logout, register) with the same SQL and response shapes, taken from
+queries.py (placeholders converted with queries.to_dollar_params), on an
+asyncpg pool so a waiting query does not hold a
+thread. Run it with any ASGI server, for example:
+
+    uvicorn pyramid_backend.asgi_app:app --port 6544
+
+Settings are read from the ini file named by PLANTCARE_INI (default
+development.ini next to this file). Bulk, export and import remain on
+the WSGI app.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import functools
+from urllib.parse import parse_qs
+
+import bcrypt
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    from . import queries
+    from . import counting
+    from . import caching
+    from .db_pool import pool_settings
+    from .server import load_settings
+    from .rendering import EncodedBody, dumps, etag_matches
+    from . import compression
+    from . import sessions
+    from . import hashing
+    from . import credentials
+except ImportError:
+    import queries
+    import counting
+    import caching
+    from db_pool import pool_settings
+    from server import load_settings
+    from rendering import EncodedBody, dumps, etag_matches
+    import compression
+    import sessions
+    import hashing
+    import credentials
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAIT_TIMEOUT = 10.0  # seconds a concurrent miss waits on the query already running
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'http://localhost:3000'),
+    (b'access-control-allow-methods', b'GET,POST,PUT,DELETE,OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type,Authorization,If-None-Match'),
+    (b'access-control-allow-credentials', b'true'),
+    (b'access-control-expose-headers', b'ETag'),
+]
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, body=b''):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.params = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.body = body
+        self.matchdict = {}
+
+    @property
+    def json_body(self):
+        return json.loads(self.body or b'null')
+
+
+class Response:
+    """A JSON response with an explicit status"""
+
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+
+
+def fail(status, msg, **headers):
+    return Response({"status": "fail", "msg": msg}, status, headers)
+
+
+def errors_as(status, msg=None, passthrough=()):
+    """
+    Answer handler errors the way the matching WSGI view does.
+
+    Writes report {"status": "error", "msg": str(e)} with 200 and a failed
+    register reports "Registration failed" with 401; exceptions listed in
+    passthrough keep the app-wide mapping in PlantCareASGI.handle.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request, db):
+            try:
+                return await handler(request, db)
+            except passthrough:
+                raise
+            except Exception as e:
+                logger.error(f"Error in {handler.__name__}: {e}")
+                return Response({"status": "error", "msg": msg or str(e)}, status)
+        return wrapper
+    return decorator
+
+
+async def cache_call(method, *args, **kwargs):
+    """
+    Call a method of the shared cache without blocking the event loop.
+
+    The in-memory backend only takes a lock and is called directly;
+    other backends (sqlite) do file I/O and run on the default executor.
+    """
+    if isinstance(caching.cache, caching.LRUCache):
+        return method(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+
+def async_cached(expiry=300, tags=(), vary=None, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+    """
+    Cache a GET handler's result in the shared cache backend.
+
+    Uses the same tags as the WSGI views, so writes through either app
+    invalidate both. Concurrent misses for the same key share one query.
+    Results are stored JSON-encoded with an ETag and sent as stored.
+    vary works as in caching.cached. A waiter whose leader is cancelled,
+    that waits longer than wait_timeout, or whose leader got a result
+    that is not cacheable (an error response), runs the query itself.
+    """
+    def decorator(func):
+        prefix = f"asgi:{func.__name__}:"
+        inflight = {}
+
+        async def wrapper(request, db):
+            key = f"{prefix}{str(sorted(request.params.items()))}"
+            if vary is not None:
+                key = f"{key}:{vary()}"
+            value, state = await cache_call(caching.cache.lookup, key, allow_stale=False)
+            if state == caching.FRESH:
+                return value
+            flight = inflight.get(key)
+            if flight is not None:
+                try:
+                    shared = await asyncio.wait_for(asyncio.shield(flight), wait_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Gave up waiting for {key} after {wait_timeout}s; querying directly")
+                    return await func(request, db)
+                except asyncio.CancelledError:
+                    if not flight.cancelled():
+                        raise  # this request was cancelled, not the leader
+                    return await func(request, db)
+                if shared is not None:
+                    return shared
+                return await func(request, db)
+
+            future = asyncio.get_running_loop().create_future()
+            inflight[key] = future
+            try:
+                versions = await cache_call(caching.cache.tag_versions, tags)
+                result = await func(request, db)
+                cacheable = caching.is_cacheable(result)
+                if cacheable:
+                    result = EncodedBody.encode_with_etag(result)
+                # Only cacheable results are shared; None sends waiters to the database
+                future.set_result(result if cacheable else None)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; mark it retrieved
+                raise
+            finally:
+                inflight.pop(key, None)
+                # Cancelled (client gone, server shutting down): release the waiters
+                if not future.done():
+                    future.cancel()
+            if cacheable:
+                await cache_call(caching.cache.set, key, result, expiry, tags=versions)
+            return result
+
+        wrapper.__name__ = func.__name__
+        return wrapper
+    return decorator
+
+
+async def table_changed(table, delta=0):
+    """Invalidate cached reads of a table after a committed write and keep its row count current"""
+    await cache_call(caching.invalidate_tags, table)
+    if delta:
+        counting.row_counter.adjust(table, delta)
+
+
+async def count_rows(conn, table, where_clauses, params, mode='auto'):
+    """Async counterpart of counting.count_rows, sharing its counters and threshold"""
+    if mode == 'none':
+        return None, 'none'
+    if not where_clauses:
+        if queries.dashboard_summary.available():
+            try:
+                count = await conn.fetchval(queries.to_dollar_params(queries.TABLE_TOTAL_QUERY), table)
+                queries.dashboard_summary.mark_present()
+                if count is not None:
+                    return count, 'exact'
+            except asyncpg.UndefinedTableError:
+                queries.dashboard_summary.mark_missing()
+                logger.warning("Dashboard summary tables missing (run dashboard_summary.sql), using maintained counts")
+        count = counting.row_counter.peek(table)
+        if count is None:
+            count = counting.row_counter.store(table, await conn.fetchval(queries.count_query(table, [])))
+        return count, 'maintained'
+
+    if mode != 'exact':
+        plan = await conn.fetchval(queries.to_dollar_params(counting.estimate_query(table, where_clauses)), *params)
+        estimate = counting.plan_rows(table, plan)
+        if estimate is not None and (mode == 'estimate' or estimate >= counting.estimate_threshold):
+            return estimate, 'estimate'
+
+    return await conn.fetchval(queries.to_dollar_params(queries.count_query(table, where_clauses)), *params), 'exact'
+
+
+def list_params(request):
+    """Validate the paging parameters shared by GET /tanaman and GET /jadwal"""
+    try:
+        limit = min(int(request.params.get('limit', '50')), 100)
+        offset = int(request.params.get('offset', '0'))
+    except ValueError:
+        limit, offset = 50, 0
+    cursor = request.params.get('cursor')
+    cursor = queries.decode_cursor(cursor) if cursor else None
+    count_mode = request.params.get('count', 'auto')
+    if count_mode not in counting.COUNT_MODES:
+        raise ValueError(f"count must be one of {', '.join(counting.COUNT_MODES)}")
+    sort = request.params.get('sort', 'default')
+    if sort not in queries.SORT_MODES:
+        raise ValueError(f"sort must be one of {', '.join(queries.SORT_MODES)}")
+    return limit, offset, cursor, count_mode, sort
+
+
+def row_id(request):
+    try:
+        return int(request.matchdict['id'])
+    except ValueError:
+        return None
+
+
+# --- Handlers; each takes (request, db) and returns a dict or a Response.
+# db is the PlantCareASGI app, whose acquire() checks out a connection ---
+
+async def home_view(request, db):
+    return {"message": "Welcome to PlantCare Pyramid API!"}
+
+
+@async_cached(expiry=300, tags=('tanaman', 'jadwal'), vary=caching.today_key)
+async def dashboard_summary_view(request, db):
+    async with db.acquire() as conn:
+        start_time = time.time()
+        row = None
+        if queries.dashboard_summary.available():
+            try:
+                row = await conn.fetchrow(queries.DASHBOARD_SUMMARY_QUERY)
+                queries.dashboard_summary.mark_present()
+            except asyncpg.UndefinedTableError:
+                queries.dashboard_summary.mark_missing()
+                logger.warning("Dashboard summary tables missing (run dashboard_summary.sql), using the full query")
+        if row is None:
+            row = await conn.fetchrow(queries.DASHBOARD_QUERY)
+        query_time = time.time() - start_time
+    logger.info(f"Dashboard query executed in {query_time:.3f} seconds")
+    return queries.dashboard_to_dict(*row, query_time)
+
+
+async def _list(request, db, table, where_clauses, params, page_query, to_dict, sort_index):
+    limit, offset, cursor, count_mode, sort = list_params(request)
+    rank_term = request.params.get('search', '').strip() if sort == 'relevance' else None
+    sql, page_params = page_query(where_clauses, params, limit, offset, cursor, rank_term)
+    async with db.acquire() as conn:
+        query_start = time.time()
+        rows, next_cursor = queries.split_page(await conn.fetch(queries.to_dollar_params(sql), *page_params), limit, sort_index)
+        total_count, count_method = await count_rows(conn, table, where_clauses, params, count_mode)
+        query_time = time.time() - query_start
+    logger.info(f"GET /{table} (asgi) - Query: {query_time:.3f}s, Rows: {len(rows)} (total: {total_count})")
+    return {
+        table: [to_dict(r) for r in rows],
+        "pagination": {
+            "total": total_count,
+            "countMethod": count_method,
+            "limit": limit,
+            "offset": offset,
+            "next_cursor": None if rank_term else next_cursor,
+            "queryTime": f"{query_time:.3f}s"
+        }
+    }
+
+
+@async_cached(expiry=300, tags=('tanaman',))
+async def get_tanaman(request, db):
+    where_clauses, params = queries.tanaman_filters(request.params.get('search', ''))
+    return await _list(request, db, 'tanaman', where_clauses, params,
+                       queries.tanaman_page_query, queries.tanaman_to_dict, sort_index=4)
+
+
+@async_cached(expiry=300, tags=('jadwal',))
+async def get_jadwal(request, db):
+    where_clauses, params = queries.jadwal_filters(
+        request.params.get('search', '').strip(),
+        request.params.get('tanaman', ''),
+        request.params.get('tanggal', ''),
+    )
+    return await _list(request, db, 'jadwal', where_clauses, params,
+                       queries.jadwal_page_query, queries.jadwal_to_dict, sort_index=3)
+
+
+async def _write(db, table, sql, params, to_dict, delta=0):
+    """Run a single-row write; returns the shaped row or None if nothing matched"""
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(queries.to_dollar_params(sql), *params)
+    if row is None:
+        return None
+    await table_changed(table, delta)
+    return to_dict(row)
+
+
+@errors_as(200)
+async def add_tanaman(request, db):
+    data = request.json_body
+    return await _write(db, 'tanaman', queries.TANAMAN_INSERT,
+                        (data.get('nama'), data.get('jenis'), data.get('lokasi')), queries.tanaman_to_dict, 1)
+
+
+@errors_as(200)
+async def update_tanaman(request, db):
+    id, data = row_id(request), request.json_body
+    item = id is not None and await _write(
+        db, 'tanaman', queries.TANAMAN_UPDATE,
+        (data.get('nama'), data.get('jenis'), data.get('lokasi'), id), queries.tanaman_to_dict)
+    return item or Response({"status": "fail", "msg": f"Tanaman with id {request.matchdict['id']} not found"}, 404)
+
+
+@errors_as(200)
+async def delete_tanaman(request, db):
+    id = row_id(request)
+    if id is not None and await _write(db, 'tanaman', queries.TANAMAN_DELETE, (id,), tuple, -1):
+        return {"status": "success", "msg": f"Tanaman with id {id} deleted"}
+    return Response({"status": "fail", "msg": f"Tanaman with id {request.matchdict['id']} not found"}, 404)
+
+
+@errors_as(200)
+async def add_jadwal(request, db):
+    data = request.json_body
+    return await _write(db, 'jadwal', queries.JADWAL_INSERT,
+                        (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal')),
+                        queries.jadwal_write_to_dict, 1)
+
+
+@errors_as(200)
+async def update_jadwal(request, db):
+    id, data = row_id(request), request.json_body
+    item = id is not None and await _write(
+        db, 'jadwal', queries.JADWAL_UPDATE,
+        (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal'), id), queries.jadwal_write_to_dict)
+    return item or Response({"status": "fail", "msg": f"Jadwal with id {request.matchdict['id']} not found"}, 404)
+
+
+@errors_as(200)
+async def delete_jadwal(request, db):
+    id = row_id(request)
+    if id is not None and await _write(db, 'jadwal', queries.JADWAL_DELETE, (id,), tuple, -1):
+        return {"status": "success", "msg": f"Jadwal with id {id} deleted"}
+    return Response({"status": "fail", "msg": f"Jadwal with id {request.matchdict['id']} not found"}, 404)
+
+
+def request_session(request):
+    """Verified session claims for the request, or None"""
+    return sessions.manager.verify(
+        sessions.manager.token_from(request.headers.get('authorization'), request.headers.get('cookie')))
+
+
+async def hash_call(func, *args):
+    """Run a bcrypt call on the shared bounded pool; HasherBusy when saturated or too slow"""
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(hashing.hasher.submit(func, *args)),
+                                      hashing.hasher.timeout)
+    except asyncio.TimeoutError:
+        raise hashing.HasherBusy("password hashing timed out")
+
+
+def logged_in(username):
+    token = sessions.manager.issue(username)
+    return Response({"status": "success", "user": username},
+                    headers={'Set-Cookie': sessions.manager.cookie_header(token)})
+
+
+async def login_view(request, db):
+    data = request.json_body
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        return fail(401, "Username and password are required")
+    if username == 'admin' and password == 'sainsdata':
+        return logged_in(username)
+    if credentials.credential_cache.check(username, password):
+        return logged_in(username)
+
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(queries.to_dollar_params(queries.LOGIN_QUERY), username)
+    if row:
+        # bcrypt is CPU-bound; keep it off the event loop
+        ok = await hash_call(bcrypt.checkpw, password.encode('utf-8'), row[1].encode('utf-8'))
+        if ok:
+            credentials.credential_cache.store(username, password)
+            return logged_in(username)
+    logger.warning(f"Login failed for {username}")
+    return fail(401, "Invalid username or password")
+
+
+async def logout_view(request, db):
+    # The session comes from the signed token, not from the request body
+    sessions.manager.revoke(request_session(request))
+    return Response({"status": "logout"}, headers={'Set-Cookie': sessions.manager.clear_cookie_header()})
+
+
+@errors_as(401, "Registration failed", passthrough=hashing.HasherBusy)
+async def register_view(request, db):
+    data = request.json_body
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        return fail(401, "Username and password are required")
+    if len(username) < 3:
+        return fail(401, "Username must be at least 3 characters")
+    if len(password) < 6:
+        return fail(401, "Password must be at least 6 characters")
+
+    async with db.acquire() as conn:
+        if await conn.fetchrow(queries.to_dollar_params(queries.USER_EXISTS_QUERY), username):
+            return fail(401, "Username already exists")
+        password_hash = await hash_call(
+            lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8'))
+        await conn.execute(queries.to_dollar_params(queries.USER_INSERT), username, password_hash)
+    credentials.credential_cache.invalidate_user(username)
+    logger.info(f"User registered successfully: {username}")
+    return {"status": "success", "msg": "User registered successfully"}
+
+
+# Same names and patterns as the WSGI routes, in matching order
+ROUTES = [
+    ('home', '/', {'GET': home_view}),
+    ('dashboard_summary', '/dashboard', {'GET': dashboard_summary_view}),
+    ('tanaman', '/tanaman', {'GET': get_tanaman, 'POST': add_tanaman}),
+    ('tanaman_detail', '/tanaman/{id}', {'PUT': update_tanaman, 'DELETE': delete_tanaman}),
+    ('jadwal', '/jadwal', {'GET': get_jadwal, 'POST': add_jadwal}),
+    ('jadwal_detail', '/jadwal/{id}', {'PUT': update_jadwal, 'DELETE': delete_jadwal}),
+    ('login', '/login', {'POST': login_view}),
+    ('logout', '/logout', {'POST': logout_view}),
+    ('register', '/register', {'POST': register_view}),
+]
+
+
+def _compile(pattern):
+    return re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', pattern) + '$')
+
+
+class PlantCareASGI:
+    """Route requests to the async handlers and manage the asyncpg pool over the lifespan"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.routes = [(name, _compile(pattern), handlers) for name, pattern, handlers in ROUTES]
+        self.db = None
+        self.acquire_timeout = None
+        self.compression = compression.compression_settings(settings)
+
+    def acquire(self):
+        """Check out a pooled connection; raises TimeoutError when none frees up in time"""
+        return self.db.acquire(timeout=self.acquire_timeout)
+
+    async def startup(self):
+        if asyncpg is None:
+            raise RuntimeError("asgi_app requires asyncpg (pip install asyncpg)")
+        # Same backend and limits as the WSGI app, so with sqlite both share
+        # cached results and tag invalidations
+        caching.configure_cache(self.settings)
+        counting.configure_counting(self.settings)
+        sessions.configure_sessions(self.settings)
+        hashing.configure_hashing(self.settings)
+        credentials.configure_credentials(self.settings)
+        options = pool_settings(self.settings)
+        self.acquire_timeout = options['timeout']
+        self.db = await asyncpg.create_pool(
+            database=options['dbname'], user=options['user'], password=options['password'],
+            host=options['host'], port=options.get('port', 5432),
+            min_size=options['minconn'], max_size=options['maxconn'],
+            max_inactive_connection_lifetime=options['max_lifetime'],
+            init=self._init_connection,
+        )
+        logger.info(f"asyncpg pool created ({options['minconn']}-{options['maxconn']} connections)")
+
+    async def _init_connection(self, conn):
+        # Decode json columns (dashboard aggregates) like psycopg2 does
+        await conn.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+    async def shutdown(self):
+        if self.db is not None:
+            await self.db.close()
+
+    def match(self, request):
+        for name, regex, handlers in self.routes:
+            found = regex.match(request.path)
+            if found:
+                request.matchdict = found.groupdict()
+                return name, handlers
+        return None, None
+
+    async def handle(self, request):
+        name, handlers = self.match(request)
+        if name is None:
+            return Response({"status": "fail", "msg": "Not found"}, 404)
+        if request.method == 'OPTIONS':
+            return Response(None)
+        if (sessions.manager.require_auth and request.path not in sessions.PUBLIC_PATHS
+                and request_session(request) is None):
+            return fail(401, "Login required")
+        handler = handlers.get(request.method)
+        if handler is None:
+            return Response({"status": "fail", "msg": "Method not allowed"}, 405)
+        try:
+            return await handler(request, self)
+        except (queries.InvalidCursor, ValueError) as e:
+            return fail(400, str(e))
+        except hashing.HasherBusy as e:
+            logger.warning(f"Password hashing pool busy: {e}")
+            return fail(503, "Server is busy, please retry", **{'Retry-After': str(hashing.hasher.retry_after)})
+        except asyncio.TimeoutError:
+            logger.warning(f"asyncpg pool exhausted serving {request.path}")
+            return fail(503, "Server is busy, please retry", **{'Retry-After': '1'})
+        except Exception as e:
+            logger.error(f"Error in {name} ({request.method}): {e}")
+            return Response({"status": "error", "msg": str(e)}, 500)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        request = Request(scope, body)
+        response = await self.handle(request)
+        content_type = 'application/json'
+        if isinstance(response, EncodedBody):
+            response = Response(response, headers=dict(response.headers))
+        elif not isinstance(response, Response):
+            response = Response(response)
+        if isinstance(response.body, EncodedBody):
+            # Cached results are sent as stored, or not at all if the client has them
+            encoded = response.body
+            content_type = encoded.content_type
+            if etag_matches(request.headers.get('if-none-match'), encoded.etag):
+                response.status = 304
+                payload = b''
+            else:
+                payload = encoded.body
+        else:
+            payload = b'' if response.body is None else dumps(response.body)
+        extra = []
+        if response.status not in (204, 304):
+            extra.append((b'vary', b'Accept-Encoding'))
+            coding = compression.negotiate(request.headers.get('accept-encoding'))
+            if coding and self.compression['enabled'] and len(payload) >= self.compression['min_size']:
+                payload = compression.compressed_variant(payload, coding, response.headers.get('ETag'), self.compression)
+                extra.append((b'content-encoding', coding.encode('latin-1')))
+        headers = [(b'content-type', content_type.encode('latin-1')), (b'content-length', str(len(payload)).encode())]
+        headers += extra
+        headers += CORS_HEADERS
+        headers += [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_app(settings):
+    """Build the ASGI app from ini settings"""
+    return PlantCareASGI(settings)
+
+
+def _default_settings():
+    path = os.environ.get('PLANTCARE_INI', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'development.ini'))
+    return load_settings(path) if os.path.exists(path) else {}
+
+
+app = create_app(_default_settings())
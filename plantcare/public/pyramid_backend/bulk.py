@@ -0,0 +1,198 @@
+"""
+Batch create/update/delete for tanaman and jadwal
+"""
+import datetime
+import logging
+
+from psycopg2.extras import execute_values
+
+try:
+    from .queries import jadwal_write_to_dict, tanaman_to_dict
+except ImportError:
+    from queries import jadwal_write_to_dict, tanaman_to_dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = 10000
+# Rows per multi-row VALUES statement
+PAGE_SIZE = 1000
+
+
+def _check_date(value):
+    datetime.date.fromisoformat(value)
+
+
+# Per table: (json key, column, sql type, max length, required) for each
+# writable field, the RETURNING list and the response shape
+TABLES = {
+    'tanaman': {
+        'fields': [
+            ('nama', 'nama', 'varchar', 100, True),
+            ('jenis', 'jenis', 'varchar', 100, False),
+            ('lokasi', 'lokasi', 'varchar', 100, False),
+        ],
+        'returning': 'id, nama, jenis, lokasi, created_at',
+        'to_dict': tanaman_to_dict,
+    },
+    'jadwal': {
+        'fields': [
+            ('namaTanaman', 'nama_tanaman', 'varchar', 100, True),
+            ('kegiatan', 'kegiatan', 'varchar', 200, True),
+            ('tanggal', 'tanggal', 'date', None, False),
+        ],
+        'returning': 'id, nama_tanaman, kegiatan, tanggal',
+        'to_dict': jadwal_write_to_dict,
+    },
+}
+
+
+class BulkRequestError(ValueError):
+    """Raised when a batch request body is unusable as a whole"""
+
+
+def read_items(body, key='items', max_items=DEFAULT_MAX_ITEMS):
+    """Accept either a bare JSON array or {key: [...]} and enforce the batch limit"""
+    items = body.get(key) if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise BulkRequestError(f"Expected a JSON array or an object with '{key}'")
+    if not items:
+        raise BulkRequestError("Batch is empty")
+    if len(items) > max_items:
+        raise BulkRequestError(f"Batch of {len(items)} exceeds the limit of {max_items} items")
+    return items
+
+
+def validate_item(table, item, require_id=False):
+    """Return (row values, None) for a valid item or (None, error message)"""
+    if not isinstance(item, dict):
+        return None, "Item must be an object"
+    row = []
+    if require_id:
+        try:
+            row.append(int(item['id']))
+        except (KeyError, TypeError, ValueError):
+            return None, "id must be an integer"
+    for key, column, sql_type, max_length, required in TABLES[table]['fields']:
+        value = item.get(key)
+        if value in (None, ''):
+            if required:
+                return None, f"{key} is required"
+            value = None
+        elif not isinstance(value, str):
+            return None, f"{key} must be a string"
+        elif max_length and len(value) > max_length:
+            return None, f"{key} must be at most {max_length} characters"
+        elif sql_type == 'date':
+            try:
+                _check_date(value)
+            except ValueError:
+                return None, f"{key} must be a date (YYYY-MM-DD)"
+        row.append(value)
+    return row, None
+
+
+def _partition(table, items, require_id=False):
+    """Split items into valid (index, row) pairs and per-item error results"""
+    valid = []
+    results = [None] * len(items)
+    seen_ids = set()
+    for index, item in enumerate(items):
+        row, error = validate_item(table, item, require_id)
+        if error is None and require_id:
+            if row[0] in seen_ids:
+                error = f"Duplicate id {row[0]} in batch"
+            seen_ids.add(row[0])
+        if error:
+            results[index] = {"index": index, "status": "invalid", "msg": error}
+        else:
+            valid.append((index, row))
+    return valid, results
+
+
+def bulk_insert(cur, table, items):
+    """
+    Insert every valid item with multi-row VALUES; return per-item results.
+
+    RETURNING order is not guaranteed to follow VALUES, so each row carries
+    its batch index (ord) and its id is drawn up front, letting the
+    returned rows be joined back to their items.
+    """
+    spec = TABLES[table]
+    valid, results = _partition(table, items)
+    if valid:
+        columns = [column for _, column, _, _, _ in spec['fields']]
+        template = '(%s::int, ' + ', '.join(f'%s::{sql_type}' for _, _, sql_type, _, _ in spec['fields']) + ')'
+        returning = ', '.join(f'ins.{column.strip()}' for column in spec['returning'].split(','))
+        returned = execute_values(
+            cur,
+            f"WITH v (ord, {', '.join(columns)}) AS (VALUES %s), "
+            f"k AS (SELECT ord, nextval(pg_get_serial_sequence('{table}', 'id')) AS id FROM v), "
+            f"ins AS (INSERT INTO {table} (id, {', '.join(columns)}) "
+            f"SELECT k.id, {', '.join(f'v.{column}' for column in columns)} FROM v JOIN k USING (ord) "
+            f"RETURNING {spec['returning']}) "
+            f"SELECT k.ord, {returning} FROM ins JOIN k USING (id) ORDER BY k.ord",
+            [[index] + row for index, row in valid],
+            template=template, page_size=PAGE_SIZE, fetch=True,
+        )
+        for row in returned:
+            index = row[0]
+            results[index] = {"index": index, "status": "created", "item": spec['to_dict'](row[1:])}
+    return results
+
+
+def bulk_update(cur, table, items):
+    """Update every valid item by id in a single UPDATE ... FROM (VALUES ...)"""
+    spec = TABLES[table]
+    valid, results = _partition(table, items, require_id=True)
+    if valid:
+        columns = [column for _, column, _, _, _ in spec['fields']]
+        assignments = ', '.join(f'{column} = v.{column}' for column in columns)
+        template = '(%s::int, ' + ', '.join(f'%s::{sql_type}' for _, _, sql_type, _, _ in spec['fields']) + ')'
+        returning = ', '.join(f't.{column.strip()}' for column in spec['returning'].split(','))
+        returned = execute_values(
+            cur,
+            f"UPDATE {table} AS t SET {assignments} FROM (VALUES %s) AS v (id, {', '.join(columns)}) "
+            f"WHERE t.id = v.id RETURNING {returning}",
+            [row for _, row in valid],
+            template=template, page_size=PAGE_SIZE, fetch=True,
+        )
+        updated = {row[0]: row for row in returned}
+        for index, row in valid:
+            if row[0] in updated:
+                results[index] = {"index": index, "status": "updated", "item": spec['to_dict'](updated[row[0]])}
+            else:
+                results[index] = {"index": index, "status": "not_found", "msg": f"{table} with id {row[0]} not found"}
+    return results
+
+
+def bulk_delete(cur, table, ids):
+    """Delete rows by id list with a single DELETE ... WHERE id = ANY(...)"""
+    results = [None] * len(ids)
+    valid = {}
+    seen_ids = set()
+    for index, value in enumerate(ids):
+        try:
+            row_id = int(value)
+        except (TypeError, ValueError):
+            results[index] = {"index": index, "status": "invalid", "msg": "id must be an integer"}
+            continue
+        if row_id in seen_ids:
+            results[index] = {"index": index, "status": "invalid", "msg": f"Duplicate id {row_id} in batch"}
+        else:
+            valid[index] = row_id
+            seen_ids.add(row_id)
+    if valid:
+        cur.execute(f'DELETE FROM {table} WHERE id = ANY(%s) RETURNING id', (list(valid.values()),))
+        deleted = {row[0] for row in cur.fetchall()}
+        for index, row_id in valid.items():
+            status = "deleted" if row_id in deleted else "not_found"
+            results[index] = {"index": index, "status": status, "id": row_id}
+    return results
+
+
+def summarize(results):
+    """Count results by status for the response envelope"""
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
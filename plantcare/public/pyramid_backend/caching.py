@@ -1,61 +1,883 @@
 """
 Simple cache implementation for the PlantCare application
 """
+import os
+import sys
+import json
+import stat
 import time
+import sqlite3
+import tempfile
+import datetime
+import threading
+from collections import OrderedDict
 from functools import wraps
 import logging
 
+try:
+    from .rendering import EncodedBody, dumps, remember_encoded
+except ImportError:
+    from rendering import EncodedBody, dumps, remember_encoded
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Simple cache dictionary
-cache = {}
+# Default limits for the in-process cache
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # 32 MB
+DEFAULT_SWEEP_INTERVAL = 30  # seconds between active expiry sweeps
+DEFAULT_WAIT_TIMEOUT = 10  # seconds a coalesced caller waits for the leader
+# Seconds a bumped tag's version is kept after no entry references it.
+# Dropping it sooner could let a computation that read the old version
+# before the bump store a result that looks current.
+TAG_RETENTION = 600
+
+SQLITE_FILENAME = 'plantcare_cache.sqlite3'
+
+# Lookup states returned by CacheBackend.lookup
+FRESH = 'fresh'
+STALE = 'stale'
+MISS = 'miss'
+
+
+def private_dir():
+    """
+    Directory for the files shared by this user's workers (cache, revocations).
+
+    <tmp>/plantcare-<uid> with mode 0700, so other local users can neither
+    pre-create nor write the files in it. Raises if the directory exists
+    with another owner or with group/other access.
+    """
+    if os.name == 'nt':
+        # The temp directory is already per user on Windows
+        path = os.path.join(tempfile.gettempdir(), 'plantcare')
+        os.makedirs(path, exist_ok=True)
+        return path
+    path = os.path.join(tempfile.gettempdir(), f'plantcare-{os.getuid()}')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by this user with mode 0700")
+    return path
+
+
+def estimate_size(value, _seen=None):
+    """Roughly estimate the memory footprint of a cached value in bytes"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, _seen)
+    return size
+
+
+class CacheBackend:
+    """
+    Interface every cache backend used by the cached decorator implements.
+
+    Backends store values with an expiry, an optional stale window and
+    the tag versions the value was computed against, and keep the tag
+    version counters themselves so invalidation reaches every process
+    sharing the backend.
+    """
+
+    name = 'base'
+
+    def lookup(self, key, allow_stale=True):
+        """Return (value, state) where state is FRESH, STALE or MISS"""
+        raise NotImplementedError
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        value, state = self.lookup(key, allow_stale=False)
+        return value if state == FRESH else default
+
+    def set(self, key, value, expiry, tags=None, stale=0):
+        """Store value under key for expiry seconds"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a single key from the cache"""
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix, returning the count removed"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop every entry"""
+        raise NotImplementedError
+
+    def tag_versions(self, tags):
+        """Return the current version of each tag as a dict"""
+        raise NotImplementedError
+
+    def bump_tags(self, tags):
+        """Invalidate every entry depending on any of tags"""
+        raise NotImplementedError
+
+    def sweep_expired(self):
+        """Actively remove expired entries, returning the count removed"""
+        return 0
+
+    def stats(self):
+        """Return runtime counters for monitoring"""
+        return {'backend': self.name}
+
+    def configure(self, max_entries=None, max_bytes=None, sweep_interval=None):
+        """Change limits at runtime"""
+
+
+class LRUCache(CacheBackend):
+    """
+    Bounded in-process cache with LRU eviction and TTL expiry.
+
+    Entries are evicted least-recently-used first once either the entry
+    count or the estimated byte budget is exceeded. Expired entries are
+    removed on access and by a periodic sweep triggered from writes.
+    Entries stored with a stale window are kept past expiry so callers
+    can serve them while a refresh runs. The sweep also forgets tag
+    versions no entry refers to any more (after TAG_RETENTION), so
+    per-user tags do not accumulate.
+    """
+
+    name = 'memory'
 
-def cached(key_prefix="", expiry=60):
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._last_sweep = time.time()
+        self._tag_versions = {}
+        self._tag_bumped = {}  # tag -> time of its last bump
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return (entry is not None and entry['expires'] > time.time()
+                    and self._tags_current(entry))
+
+    def lookup(self, key, allow_stale=True):
+        """
+        Return (value, state) where state is FRESH, STALE or MISS.
+
+        A stale value is past its expiry but still inside the stale
+        window it was stored with. Entries whose tags were bumped are
+        always a miss, stale window or not.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            now = time.time()
+            if not self._tags_current(entry):
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None, MISS
+            if entry['stale_until'] <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None, MISS
+            if entry['expires'] <= now:
+                if not allow_stale:
+                    self.misses += 1
+                    return None, MISS
+                self._data.move_to_end(key)
+                self.stale_hits += 1
+                return entry['value'], STALE
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry['value'], FRESH
+
+    def set(self, key, value, expiry, tags=None, stale=0):
+        """
+        Store value under key for expiry seconds, evicting as needed.
+
+        tags maps each tag the value depends on to the version observed
+        before the value was computed (see tag_versions). The entry is
+        treated as a miss once any of those tags is bumped. stale keeps
+        the entry servable as STALE for that many seconds past expiry.
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {key}: {size} bytes exceeds cache budget")
+            return False
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = {
+                'value': value,
+                'expires': time.time() + expiry,
+                'stale_until': time.time() + expiry + stale,
+                'size': size,
+                'tags': dict(tags or {}),
+            }
+            self._bytes += size
+            self._maybe_sweep()
+            self._evict()
+        return True
+
+    def delete(self, key):
+        """Remove a single key from the cache"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                return True
+        return False
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix, returning the count removed"""
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                self._remove(k)
+        return len(keys)
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def tag_versions(self, tags):
+        """Return the current version of each tag as a dict"""
+        with self._lock:
+            return {tag: self._tag_versions.get(tag, 0) for tag in tags}
+
+    def bump_tags(self, tags):
+        """Invalidate every entry depending on any of tags"""
+        now = time.time()
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+                self._tag_bumped[tag] = now
+
+    def sweep_expired(self):
+        """Actively remove all expired or invalidated entries, then unused tag versions"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._data.items() if not self._is_valid(e, now)]
+            for k in expired:
+                self._remove(k)
+            self.expirations += len(expired)
+            self._last_sweep = now
+            self._prune_tags(now)
+        if expired:
+            logger.info(f"Cache sweep removed {len(expired)} expired entries")
+        return len(expired)
+
+    def stats(self):
+        """Return runtime counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.name,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def configure(self, max_entries=None, max_bytes=None, sweep_interval=None):
+        """Change limits at runtime, evicting immediately if they shrank"""
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if sweep_interval is not None:
+                self.sweep_interval = sweep_interval
+            self._evict()
+
+    def _prune_tags(self, now):
+        horizon = now - TAG_RETENTION
+        old = [tag for tag, bumped in self._tag_bumped.items() if bumped <= horizon]
+        if not old:
+            return
+        referenced = set()
+        for entry in self._data.values():
+            referenced.update(entry['tags'])
+        for tag in old:
+            if tag not in referenced:
+                del self._tag_versions[tag]
+                del self._tag_bumped[tag]
+
+    def _tags_current(self, entry):
+        for tag, version in entry['tags'].items():
+            if self._tag_versions.get(tag, 0) != version:
+                return False
+        return True
+
+    def _is_valid(self, entry, now):
+        return entry['stale_until'] > now and self._tags_current(entry)
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry['size']
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep >= self.sweep_interval:
+            self.sweep_expired()
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            key, entry = self._data.popitem(last=False)
+            self._bytes -= entry['size']
+            self.evictions += 1
+            logger.debug(f"Evicted cache entry {key}")
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by every worker process on a host, stored in a local
+    SQLite database in WAL mode.
+
+    Only data is stored, never pickles: an EncodedBody as its bytes plus
+    its content type and headers, anything else as the JSON the renderer
+    would send for it. Tag versions live in the same database,
+    so a write handled by one worker invalidates entries for all of them.
+    Each thread (and each forked process) opens its own connection. The
+    file defaults to private_dir().
+    """
+
+    name = 'sqlite'
+    touch_interval = 1.0  # seconds between last-access updates of an entry
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, sweep_interval=DEFAULT_SWEEP_INTERVAL,
+                 timeout=5.0):
+        self.path = path or os.path.join(private_dir(), SQLITE_FILENAME)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.timeout = timeout
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._init_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cache_entries)')]
+        if columns and 'kind' not in columns:
+            # Written by a version that pickled values; never read those
+            conn.execute('DROP TABLE cache_entries')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL, meta TEXT,'
+            ' expires REAL NOT NULL, stale_until REAL NOT NULL, size INTEGER NOT NULL,'
+            ' tags TEXT NOT NULL, last_access REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_access ON cache_entries(last_access)')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL,'
+                     ' bumped REAL NOT NULL DEFAULT 0)')
+        if 'bumped' not in [row[1] for row in conn.execute('PRAGMA table_info(cache_tags)')]:
+            conn.execute('ALTER TABLE cache_tags ADD COLUMN bumped REAL NOT NULL DEFAULT 0')
+        self._init_totals(conn)
+
+    def _init_totals(self, conn):
+        """
+        Keep entry count and size in cache_totals with triggers, so eviction
+        checks the budget without scanning cache_entries on every set.
+        """
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_totals (id INTEGER PRIMARY KEY CHECK (id = 0),'
+                     ' entries INTEGER NOT NULL, bytes INTEGER NOT NULL)')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Triggers go away with a dropped cache_entries; recount whenever they are (re)created
+            if not (conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger'"
+                                 " AND name = 'cache_entries_insert'").fetchone() and self._totals(conn)):
+                conn.execute('CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN'
+                             ' UPDATE cache_totals SET entries = entries + 1, bytes = bytes + NEW.size; END')
+                conn.execute('CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN'
+                             ' UPDATE cache_totals SET entries = entries - 1, bytes = bytes - OLD.size; END')
+                conn.execute('CREATE TRIGGER IF NOT EXISTS cache_entries_resize AFTER UPDATE OF size ON cache_entries'
+                             ' BEGIN UPDATE cache_totals SET bytes = bytes + NEW.size - OLD.size; END')
+                conn.execute('INSERT OR REPLACE INTO cache_totals (id, entries, bytes)'
+                             ' SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _totals(self, conn):
+        return conn.execute('SELECT entries, bytes FROM cache_totals WHERE id = 0').fetchone()
+
+    def _count(self, counter, n=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _tags_current(self, conn, tags):
+        if not tags:
+            return True
+        return self._read_versions(conn, tags) == tags
+
+    def _read_versions(self, conn, tags):
+        placeholders = ','.join('?' * len(tags))
+        rows = conn.execute(f'SELECT tag, version FROM cache_tags WHERE tag IN ({placeholders})', list(tags))
+        versions = {tag: 0 for tag in tags}
+        versions.update(dict(rows.fetchall()))
+        return versions
+
+    @staticmethod
+    def _serialize(value):
+        """(kind, blob, meta) stored for value"""
+        if isinstance(value, EncodedBody):
+            meta = json.dumps({"content_type": value.content_type, "headers": value.headers})
+            return 'body', bytes(value.body), meta
+        return 'json', dumps(value), None
+
+    @staticmethod
+    def _deserialize(kind, blob, meta):
+        if kind == 'body':
+            meta = json.loads(meta)
+            return EncodedBody(bytes(blob), meta['content_type'], [tuple(h) for h in meta['headers']])
+        if kind == 'json':
+            return json.loads(bytes(blob))
+        raise ValueError(f"unknown entry kind {kind!r}")
+
+    def lookup(self, key, allow_stale=True):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT kind, value, meta, expires, stale_until, tags, last_access FROM cache_entries WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None, MISS
+
+        kind, blob, meta, expires, stale_until, tags, last_access = row
+        now = time.time()
+        if not self._tags_current(conn, json.loads(tags)):
+            self.delete(key)
+            self._count('invalidations')
+            self._count('misses')
+            return None, MISS
+        if stale_until <= now:
+            self.delete(key)
+            self._count('expirations')
+            self._count('misses')
+            return None, MISS
+        if expires <= now and not allow_stale:
+            self._count('misses')
+            return None, MISS
+
+        if now - last_access >= self.touch_interval:
+            conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (now, key))
+        try:
+            value = self._deserialize(kind, blob, meta)
+        except Exception as e:
+            logger.error(f"Dropping unreadable cache entry {key}: {e}")
+            self.delete(key)
+            self._count('misses')
+            return None, MISS
+
+        if expires <= now:
+            self._count('stale_hits')
+            return value, STALE
+        self._count('hits')
+        return value, FRESH
+
+    def set(self, key, value, expiry, tags=None, stale=0):
+        try:
+            kind, blob, meta = self._serialize(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Not caching {key}: value cannot be stored ({e})")
+            return False
+        if len(blob) > self.max_bytes:
+            logger.warning(f"Not caching {key}: {len(blob)} bytes exceeds cache budget")
+            return False
+
+        now = time.time()
+        conn = self._conn()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete
+        # would skip the cache_totals trigger
+        conn.execute(
+            'INSERT INTO cache_entries'
+            ' (key, kind, value, meta, expires, stale_until, size, tags, last_access)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT(key) DO UPDATE SET kind = excluded.kind, value = excluded.value,'
+            ' meta = excluded.meta, expires = excluded.expires, stale_until = excluded.stale_until,'
+            ' size = excluded.size, tags = excluded.tags, last_access = excluded.last_access',
+            (key, kind, sqlite3.Binary(blob), meta, now + expiry, now + expiry + stale, len(blob),
+             json.dumps(dict(tags or {})), now),
+        )
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep_expired()
+        self._evict(conn)
+        return True
+
+    def delete(self, key):
+        cur = self._conn().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cur.rowcount > 0
+
+    def delete_prefix(self, prefix):
+        cur = self._conn().execute(
+            'DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?', (len(prefix), prefix)
+        )
+        return cur.rowcount
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache_entries')
+
+    def tag_versions(self, tags):
+        if not tags:
+            return {}
+        return self._read_versions(self._conn(), tags)
+
+    def bump_tags(self, tags):
+        conn = self._conn()
+        now = time.time()
+        for tag in tags:
+            conn.execute(
+                'INSERT INTO cache_tags (tag, version, bumped) VALUES (?, 1, ?)'
+                ' ON CONFLICT(tag) DO UPDATE SET version = version + 1, bumped = excluded.bumped',
+                (tag, now),
+            )
+
+    def sweep_expired(self):
+        conn = self._conn()
+        cur = conn.execute('DELETE FROM cache_entries WHERE stale_until <= ?', (time.time(),))
+        self._last_sweep = time.time()
+        # Tag versions no entry refers to any more, as in LRUCache
+        conn.execute(
+            'DELETE FROM cache_tags WHERE bumped <= ? AND NOT EXISTS ('
+            ' SELECT 1 FROM cache_entries, json_each(cache_entries.tags) t WHERE t.key = cache_tags.tag)',
+            (self._last_sweep - TAG_RETENTION,),
+        )
+        if cur.rowcount:
+            self._count('expirations', cur.rowcount)
+            logger.info(f"Cache sweep removed {cur.rowcount} expired entries")
+        return cur.rowcount
+
+    def stats(self):
+        entries, size = self._totals(self._conn())
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'entries': entries,
+            'bytes': size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+    def configure(self, max_entries=None, max_bytes=None, sweep_interval=None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if sweep_interval is not None:
+            self.sweep_interval = sweep_interval
+        self._evict(self._conn())
+
+    def _evict(self, conn):
+        entries, size = self._totals(conn)
+        while entries > self.max_entries or size > self.max_bytes:
+            victims = conn.execute(
+                'SELECT key, size FROM cache_entries ORDER BY last_access ASC LIMIT ?',
+                (max(entries - self.max_entries, 1),),
+            ).fetchall()
+            if not victims:
+                break
+            for key, victim_size in victims:
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                entries -= 1
+                size -= victim_size
+                self._count('evictions')
+                if entries <= self.max_entries and size <= self.max_bytes:
+                    break
+
+
+# Shared cache instance used by the cached decorator
+cache = LRUCache()
+
+
+def set_cache_backend(backend):
+    """Swap the backend used by every cached view"""
+    global cache
+    cache = backend
+    logger.info(f"Cache backend set to {backend.name}")
+
+
+def configure_cache(settings):
+    """Apply plantcare.cache.* settings from the ini file"""
+    limits = dict(
+        max_entries=int(settings.get('plantcare.cache.max_entries', DEFAULT_MAX_ENTRIES)),
+        max_bytes=int(settings.get('plantcare.cache.max_bytes', DEFAULT_MAX_BYTES)),
+        sweep_interval=float(settings.get('plantcare.cache.sweep_interval', DEFAULT_SWEEP_INTERVAL)),
+    )
+    backend = settings.get('plantcare.cache.backend', 'memory')
+    if backend == 'sqlite':
+        path = settings.get('plantcare.cache.path') or None
+        set_cache_backend(SQLiteCache(path=path, **limits))
+    elif backend == 'memory':
+        if not isinstance(cache, LRUCache):
+            set_cache_backend(LRUCache())
+        cache.configure(**limits)
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    logger.info(f"Cache configured: {backend}, {limits['max_entries']} entries, {limits['max_bytes']} bytes")
+
+
+def is_cacheable(result):
+    """Only plain successful payloads are cached, never error fallbacks or responses"""
+    return isinstance(result, (dict, list)) and not (isinstance(result, dict) and 'error' in result)
+
+
+class _Flight:
+    """A computation in progress that concurrent callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        # False when the result is a per-request object (an error response)
+        # that each waiter must produce for itself
+        self.shared = True
+
+
+# Keys currently being recomputed, for single-flight coalescing
+_inflight = {}
+_inflight_lock = threading.Lock()
+flight_stats = {'coalesced': 0, 'wait_timeouts': 0, 'background_refreshes': 0}
+
+
+def _join_flight(key):
+    """Return (flight, is_leader) for key, creating the flight if needed"""
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _inflight[key] = _Flight()
+        return flight, True
+
+
+def _land_flight(key, flight, result=None, error=None, shared=True):
+    """Publish the leader's outcome and wake every waiting caller"""
+    flight.result = result if shared else None
+    flight.error = error
+    flight.shared = shared
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    flight.event.set()
+
+
+def deliver(value, request=None):
+    """Turn a stored EncodedBody back into a response (304 when the ETag matches)"""
+    if isinstance(value, EncodedBody):
+        return value.to_response(request)
+    return value
+
+
+class RefreshRequest:
+    """
+    What a background refresh passes to the view instead of the request.
+
+    The request that found the stale value is finished (and its
+    environ, session and connection released) while the refresh still
+    runs, so the view gets a copy of the parts a cached GET view reads.
+    """
+
+    method = 'GET'
+
+    def __init__(self, request):
+        self.params = dict(getattr(request, 'params', {}))
+        self.GET = self.params
+        self.matchdict = dict(getattr(request, 'matchdict', None) or {})
+        self.path = getattr(request, 'path', '/')
+        self.registry = getattr(request, 'registry', None)
+        self.headers = {}
+        self.environ = {}
+
+
+def today_key():
+    """Cache key part for results that depend on CURRENT_DATE; rolls over at local midnight"""
+    return datetime.date.today().isoformat()
+
+def cached(key_prefix="", expiry=60, tags=(), stale=0, wait_timeout=DEFAULT_WAIT_TIMEOUT, encode=False,
+           vary=None):
     """
     A decorator that caches the result of a function for a specified time.
-    
+
+    Concurrent misses for the same key are coalesced: one caller runs the
+    function while the others wait for its result (up to wait_timeout).
+
     Args:
         key_prefix: Optional prefix for the cache key
         expiry: The time to live for the cache in seconds
+        tags: Tables (or other tags) the result depends on; calling
+            invalidate_tags() with any of them drops the cached result
+        stale: Stale-while-revalidate window in seconds; an expired value
+            is served immediately and refreshed in a background thread
+        wait_timeout: Seconds a coalesced caller waits before computing
+            the value itself
+        encode: Store the JSON-encoded body and its ETag instead of the
+            value; hits return a ready Response (or 304 Not Modified when
+            If-None-Match matches), so nothing is encoded again
+        vary: Optional callable whose result becomes part of the key, for
+            results that change without a write (e.g. today_key for
+            "today" counts, so yesterday's value is never served)
     """
     def decorator(func):
-        from functools import wraps
+        prefix = f"{key_prefix}{func.__name__}:"
+
         @wraps(func)
         def wrapper(request, *args, **kwargs):
             # Create a cache key based on the function name and request params (for GET views)
             params = dict(request.params) if hasattr(request, 'params') else {}
-            key = f"{key_prefix}{func.__name__}:{str(sorted(params.items()))}"
-            
+            key = f"{prefix}{str(sorted(params.items()))}"
+            if vary is not None:
+                key = f"{key}:{vary()}"
+
             # Check if we have a cached value that hasn't expired
-            if key in cache and cache[key]['expires'] > time.time():
+            value, state = cache.lookup(key, allow_stale=stale > 0)
+            if state == FRESH:
                 logger.info(f"Cache hit for {key}")
-                return cache[key]['value']
-            
+                return deliver(value, request)
+
+            flight, leader = _join_flight(key)
+            if state == STALE:
+                # Serve the stale value now; only the leader schedules a refresh
+                if leader:
+                    flight_stats['background_refreshes'] += 1
+                    threading.Thread(
+                        target=refresh, args=(key, flight, RefreshRequest(request), args, kwargs),
+                        name=f"cache-refresh-{func.__name__}", daemon=True,
+                    ).start()
+                logger.info(f"Stale cache hit for {key}")
+                return deliver(value, request)
+
+            if not leader:
+                flight_stats['coalesced'] += 1
+                if flight.event.wait(wait_timeout):
+                    if flight.error is not None:
+                        raise flight.error
+                    if not flight.shared:
+                        # Responses are mutated by the tweens; never hand one to two threads
+                        return compute(key, None, request, args, kwargs)
+                    logger.info(f"Coalesced cache miss for {key}")
+                    return deliver(flight.result, request)
+                flight_stats['wait_timeouts'] += 1
+                logger.warning(f"Timed out waiting for {key}, computing it directly")
+                return compute(key, None, request, args, kwargs)
+
+            return compute(key, flight, request, args, kwargs)
+
+        def compute(key, flight, request, args, kwargs):
+            # Snapshot tag versions before computing so a write racing with
+            # this read invalidates the result we are about to store
+            versions = cache.tag_versions(tags)
+
             # Call the original function
-            result = func(request, *args, **kwargs)
-              # Cache the result with an expiration time
-            cache[key] = {
-                'value': result,
-                'expires': time.time() + expiry
-            }
-            logger.info(f"Cache miss for {key}, stored new result")
-            
+            try:
+                result = func(request, *args, **kwargs)
+            except Exception as e:
+                if flight is not None:
+                    _land_flight(key, flight, error=e)
+                raise
+
+            stored = result
+            cacheable = is_cacheable(result)
+            if cacheable:
+                if encode:
+                    # Encoded once here; the renderer reuses the bytes for this request
+                    stored = EncodedBody.encode_with_etag(result)
+                    remember_encoded(request, result, stored)
+                # Cache the result with an expiration time
+                cache.set(key, stored, expiry, tags=versions, stale=stale)
+                logger.info(f"Cache miss for {key}, stored new result")
+            else:
+                logger.info(f"Cache miss for {key}, result not cacheable")
+
+            if flight is not None:
+                _land_flight(key, flight, result=stored, shared=cacheable)
             return result
-        
+
+        def refresh(key, flight, request, args, kwargs):
+            try:
+                compute(key, flight, request, args, kwargs)
+            except Exception as e:
+                logger.error(f"Background refresh failed for {key}: {e}")
+
         # Add a method to clear the specific cache for this function
         def clear_cache():
-            keys_to_remove = [k for k in cache if k.startswith(f"{func.__name__}:")]
-            for k in keys_to_remove:
-                del cache[k]
-            logger.info(f"Cleared cache for {func.__name__}")
-            
+            removed = cache.delete_prefix(prefix)
+            logger.info(f"Cleared cache for {func.__name__} ({removed} entries)")
+
         wrapper.clear_cache = clear_cache
+        wrapper.cache_tags = tuple(tags)
         return wrapper
-    
+
     return decorator
 
 def clear_all_cache():
     """Clear all cached data"""
     cache.clear()
     logger.info("Cleared all cache")
+
+def invalidate_tags(*tags):
+    """Invalidate every cached result that depends on any of the given tags"""
+    cache.bump_tags(tags)
+    logger.info(f"Invalidated cache tags: {', '.join(tags)}")
+
+def get_cache_stats():
+    """Return hit/miss/eviction counters for the shared cache"""
+    stats = cache.stats()
+    stats.update(flight_stats)
+    return stats
@@ -0,0 +1,131 @@
+"""
+Response compression for the PlantCare API
+
+compression_tween_factory compresses response bodies with brotli (when
+the brotli package is installed) or gzip, chosen from the request's
+Accept-Encoding. Bodies below plantcare.compress.min_size, streamed
+responses (exports) and already encoded responses are sent unchanged.
+
+Responses that carry an ETag come from the response cache and always
+have the same bytes for the same tag, so their compressed variants are
+stored in the cache backend under that ETag and reused on later hits.
+"""
+import gzip
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from . import caching
+except ImportError:
+    import caching
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_SIZE = 1024  # bytes; smaller bodies are not worth the CPU
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_VARIANT_EXPIRY = 600  # seconds a compressed variant stays cached
+
+# Preference order when the client accepts several codings equally
+CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def compression_settings(settings):
+    """Translate plantcare.compress.* settings"""
+    return {
+        'enabled': settings.get('plantcare.compress.enabled', 'true').lower() in ('true', '1', 'yes', 'on'),
+        'min_size': int(settings.get('plantcare.compress.min_size', DEFAULT_MIN_SIZE)),
+        'gzip_level': int(settings.get('plantcare.compress.gzip_level', DEFAULT_GZIP_LEVEL)),
+        'brotli_quality': int(settings.get('plantcare.compress.brotli_quality', DEFAULT_BROTLI_QUALITY)),
+        'variant_expiry': int(settings.get('plantcare.compress.variant_expiry', DEFAULT_VARIANT_EXPIRY)),
+    }
+
+
+def negotiate(accept_encoding, codings=CODINGS):
+    """Pick the coding to use from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for coding in codings:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, coding, opts):
+    if coding == 'br':
+        return brotli.compress(body, quality=opts['brotli_quality'])
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(body, compresslevel=opts['gzip_level'], mtime=0)
+
+
+def compressed_variant(body, coding, etag, opts):
+    """Compressed body, reused from the cache when the ETag was seen before"""
+    if not etag:
+        return compress(body, coding, opts)
+    key = f"compressed:{coding}:{etag}"
+    value, state = caching.cache.lookup(key, allow_stale=False)
+    if state == caching.FRESH:
+        return value
+    value = compress(body, coding, opts)
+    caching.cache.set(key, value, opts['variant_expiry'])
+    return value
+
+
+def is_compressible(content_type):
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(response):
+    vary = response.headers.get('Vary')
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = f"{vary}, Accept-Encoding"
+
+
+def compression_tween_factory(handler, registry):
+    opts = compression_settings(registry.settings or {})
+    if not opts['enabled']:
+        return handler
+
+    def compression_tween(request):
+        response = handler(request)
+        if response.status_code in (204, 304) or not is_compressible(response.content_type):
+            return response
+        add_vary(response)
+        if response.headers.get('Content-Encoding'):
+            return response
+        # Streamed bodies (exports) are left alone so they stay streamed
+        if not isinstance(response.app_iter, (list, tuple)):
+            return response
+        body = response.body
+        if len(body) < opts['min_size']:
+            return response
+        coding = negotiate(request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return response
+
+        response.body = compressed_variant(body, coding, response.headers.get('ETag'), opts)
+        response.headers['Content-Encoding'] = coding
+        return response
+
+    return compression_tween
@@ -0,0 +1,164 @@
+"""
+Row counting strategies for the paginated list endpoints
+"""
+import json
+import time
+import threading
+import logging
+
+import psycopg2.errors
+
+try:
+    from . import queries
+    from .queries import count_query
+except ImportError:
+    import queries
+    from queries import count_query
+
+logger = logging.getLogger(__name__)
+
+# Accepted values of the ?count= query parameter
+COUNT_MODES = ('auto', 'exact', 'estimate', 'none')
+
+# Filtered queries whose planner estimate is at least this many rows
+# report the estimate instead of running COUNT(*) in auto mode
+DEFAULT_ESTIMATE_THRESHOLD = 10000
+# Seconds before an incrementally maintained count is re-read from the table
+DEFAULT_RECONCILE_INTERVAL = 60
+
+
+class RowCounter:
+    """
+    Row counts for whole tables, maintained incrementally per process.
+
+    A table is counted once with COUNT(*), then adjusted by the write
+    views as rows are inserted and deleted. Writes made by other worker
+    processes are only picked up when the count is re-read every
+    reconcile_interval seconds, so these counts are reported as
+    'maintained' rather than 'exact'.
+    """
+
+    def __init__(self, reconcile_interval=DEFAULT_RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, cur, table):
+        """Return the maintained row count for table, counting it if needed"""
+        count = self.peek(table)
+        if count is None:
+            cur.execute(count_query(table, []))
+            count = self.store(table, cur.fetchone()[0])
+        return count
+
+    def peek(self, table):
+        """Return the known count for table, or None if it must be recounted"""
+        with self._lock:
+            entry = self._counts.get(table)
+            if entry and time.time() - entry['loaded_at'] < self.reconcile_interval:
+                return entry['count']
+        return None
+
+    def store(self, table, count):
+        """Record a fresh COUNT(*) of table"""
+        with self._lock:
+            self._counts[table] = {'count': count, 'loaded_at': time.time()}
+        logger.info(f"Reconciled row count for {table}: {count}")
+        return count
+
+    def adjust(self, table, delta):
+        """Apply a committed insert (+n) or delete (-n) to a known count"""
+        with self._lock:
+            entry = self._counts.get(table)
+            if entry is not None:
+                entry['count'] = max(entry['count'] + delta, 0)
+
+    def invalidate(self, table=None):
+        """Force the next read of table (or every table) to recount"""
+        with self._lock:
+            if table is None:
+                self._counts.clear()
+            else:
+                self._counts.pop(table, None)
+
+
+row_counter = RowCounter()
+estimate_threshold = DEFAULT_ESTIMATE_THRESHOLD
+
+
+def configure_counting(settings):
+    """Apply plantcare.count.* settings from the ini file"""
+    global estimate_threshold
+    estimate_threshold = int(settings.get('plantcare.count.estimate_threshold', DEFAULT_ESTIMATE_THRESHOLD))
+    row_counter.reconcile_interval = float(
+        settings.get('plantcare.count.reconcile_interval', DEFAULT_RECONCILE_INTERVAL))
+
+
+def estimate_query(table, where_clauses):
+    """EXPLAIN statement whose plan carries the row estimate for a filtered scan"""
+    sql = f'EXPLAIN (FORMAT JSON) SELECT 1 FROM {table}'
+    if where_clauses:
+        sql += ' WHERE ' + ' AND '.join(where_clauses)
+    return sql
+
+
+def plan_rows(table, plan):
+    """Read the top-level row estimate from an EXPLAIN (FORMAT JSON) result, or None"""
+    try:
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except (TypeError, KeyError, IndexError, ValueError) as e:
+        logger.warning(f"Could not read row estimate for {table}: {e}")
+        return None
+
+
+def estimate_rows(cur, table, where_clauses, params):
+    """Return the planner's row estimate for a filtered scan, or None"""
+    cur.execute(estimate_query(table, where_clauses), params)
+    row = cur.fetchone()
+    return plan_rows(table, row[0] if row else None)
+
+
+def summary_total(cur, table):
+    """Row count of table from dashboard_totals, or None if the summary tables are missing"""
+    if not queries.dashboard_summary.available():
+        return None
+    try:
+        cur.execute(queries.TABLE_TOTAL_QUERY, (table,))
+        row = cur.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        queries.dashboard_summary.mark_missing()
+        logger.warning("Dashboard summary tables missing (run dashboard_summary.sql), using maintained counts")
+        return None
+    queries.dashboard_summary.mark_present()
+    return row[0] if row else None
+
+
+def count_rows(cur, table, where_clauses, params, mode='auto'):
+    """
+    Return (total, method) for a list query using the requested strategy.
+
+    method is 'exact', 'maintained', 'estimate' or 'none'. Unfiltered
+    tables read the trigger-maintained dashboard_totals row, which is
+    exact across workers, and fall back to the per-process RowCounter
+    ('maintained') when dashboard_summary.sql has not been applied. For
+    filtered queries, auto runs COUNT(*) only when the planner expects
+    fewer than estimate_threshold rows.
+    """
+    if mode == 'none':
+        return None, 'none'
+    if not where_clauses:
+        total = summary_total(cur, table)
+        if total is not None:
+            return total, 'exact'
+        return row_counter.get(cur, table), 'maintained'
+
+    if mode != 'exact':
+        estimate = estimate_rows(cur, table, where_clauses, params)
+        if estimate is not None and (mode == 'estimate' or estimate >= estimate_threshold):
+            return estimate, 'estimate'
+
+    cur.execute(count_query(table, where_clauses), params)
+    return cur.fetchone()[0], 'exact'
@@ -0,0 +1,93 @@
+"""
+Cache of recently verified logins
+
+A successful bcrypt check is remembered for plantcare.auth.cache_ttl
+seconds so repeat logins skip both the users query and bcrypt. Entries
+are keyed by HMAC-SHA256(secret, username, password): the key is the
+same in every worker sharing the secret, and without the secret it
+cannot be used to guess passwords. Only the username is stored.
+
+Entries live in a bounded LRU cache with TTL sweeping, or in the shared
+cache backend with plantcare.auth.cache_shared so every worker reuses
+them. Each entry is tagged with its user, so invalidate_user() (on
+register or a password change) drops every entry for that user at once.
+"""
+import hmac
+import hashlib
+import secrets
+import logging
+
+try:
+    from . import caching
+except ImportError:
+    import caching
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300  # seconds a verified login is remembered
+DEFAULT_MAX_ENTRIES = 10000
+ENTRY_BYTES = 512  # generous per-entry estimate for the byte budget
+
+
+class CredentialCache:
+    """Remembers verified (username, password) pairs under keyed-HMAC keys"""
+
+    def __init__(self, secret=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, shared=False):
+        secret = secret or secrets.token_hex(32)
+        self.key = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self.shared = shared
+        self._local = caching.LRUCache(max_entries=max_entries, max_bytes=max_entries * ENTRY_BYTES,
+                                       sweep_interval=min(ttl, caching.DEFAULT_SWEEP_INTERVAL))
+
+    @property
+    def backend(self):
+        return caching.cache if self.shared else self._local
+
+    def _key(self, username, password):
+        digest = hmac.new(self.key, f"{username}\0{password}".encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"auth:{digest}"
+
+    @staticmethod
+    def _tag(username):
+        return f"auth-user:{username}"
+
+    def check(self, username, password):
+        """True if this username/password pair was verified within the TTL"""
+        if not self.ttl:
+            return False
+        value, state = self.backend.lookup(self._key(username, password), allow_stale=False)
+        return state == caching.FRESH and value == username
+
+    def store(self, username, password):
+        """Remember a pair bcrypt just verified"""
+        if not self.ttl:
+            return
+        backend = self.backend
+        tags = backend.tag_versions([self._tag(username)])
+        backend.set(self._key(username, password), username, self.ttl, tags=tags)
+
+    def invalidate_user(self, username):
+        """Forget every cached login of username (password changed, account re-created)"""
+        self.backend.bump_tags([self._tag(username)])
+
+    def stats(self):
+        stats = self._local.stats() if not self.shared else {'backend': 'shared'}
+        stats['ttl'] = self.ttl
+        return stats
+
+
+credential_cache = CredentialCache()
+
+
+def configure_credentials(settings):
+    """Apply plantcare.auth.cache_* settings; the key defaults to the session secret"""
+    global credential_cache
+    credential_cache = CredentialCache(
+        secret=settings.get('plantcare.auth.cache_secret') or settings.get('plantcare.session.secret'),
+        ttl=int(settings.get('plantcare.auth.cache_ttl', DEFAULT_TTL)),
+        max_entries=int(settings.get('plantcare.auth.cache_max_entries', DEFAULT_MAX_ENTRIES)),
+        shared=settings.get('plantcare.auth.cache_shared', 'false').lower() in ('true', '1', 'yes', 'on'),
+    )
+    logger.info(f"Credential cache: {credential_cache.ttl}s TTL, "
+                f"{'shared backend' if credential_cache.shared else 'per process'}")
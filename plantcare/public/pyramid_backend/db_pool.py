@@ -0,0 +1,331 @@
+"""
+Thread-safe PostgreSQL connection pool for the PlantCare API
+"""
+import os
+import time
+import weakref
+import threading
+import logging
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+# Connection parameters used when the ini file does not override them
+DEFAULT_DB_SETTINGS = {
+    'dbname': 'plantcare_db',
+    'user': 'postgres',
+    'password': 'jeremiaz',
+    'host': 'localhost',
+}
+DEFAULT_POOL_MIN = 2
+DEFAULT_POOL_MAX = 20
+DEFAULT_POOL_TIMEOUT = 5.0  # seconds a checkout may wait for a free connection
+DEFAULT_POOL_MAX_WAITING = 100  # callers allowed to queue before failing fast
+DEFAULT_VALIDATE_AFTER = 30.0  # idle seconds after which a checkout runs SELECT 1
+DEFAULT_MAX_LIFETIME = 3600.0  # seconds before a connection is recycled
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection became available within the wait timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded connection pool safe to share between threads.
+
+    getconn() hands out an idle connection, opens a new one while the
+    pool is below maxconn, or waits up to timeout seconds for one to be
+    returned. Connections idle for longer than validate_after are
+    checked with SELECT 1 before being handed out, and connections older
+    than max_lifetime are closed and replaced, so dead connections are
+    recycled instead of reaching a view.
+    """
+
+    def __init__(self, minconn=DEFAULT_POOL_MIN, maxconn=DEFAULT_POOL_MAX, timeout=DEFAULT_POOL_TIMEOUT,
+                 max_waiting=DEFAULT_POOL_MAX_WAITING, validate_after=DEFAULT_VALIDATE_AFTER,
+                 max_lifetime=DEFAULT_MAX_LIFETIME, prefill=True, on_connect=(), **connect_kwargs):
+        if minconn > maxconn:
+            raise ValueError("minconn must not exceed maxconn")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.validate_after = validate_after
+        self.max_lifetime = max_lifetime
+        self.connect_kwargs = connect_kwargs
+        # Callables run on every newly opened connection
+        self.on_connect = list(on_connect)
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, returned_at)
+        self._in_use = {}  # id(conn) -> (conn, created_at, checked_out_at)
+        self._size = 0  # open connections plus ones being opened
+        self._waiting = 0
+        self._closed = False
+        self._inherited = []
+        self._metrics = {
+            'checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+            'exhausted': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'validation_failures': 0,
+        }
+        _pools.add(self)
+        if prefill:
+            self.prefill()
+
+    def prefill(self):
+        """Open connections up to minconn; failures are logged, not raised"""
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                logger.error(f"Could not prefill connection pool: {e}")
+                return
+            with self._cond:
+                self._idle.append((conn, time.time(), time.time()))
+                self._cond.notify()
+
+    def _connect(self):
+        """Open a connection and run the on_connect hooks; callers release the size slot on failure"""
+        conn = psycopg2.connect(**self.connect_kwargs)
+        try:
+            for hook in self.on_connect:
+                hook(conn)
+        except Exception:
+            # A half-initialised connection never enters the pool
+            self._discard(conn)
+            raise
+        with self._cond:
+            self._metrics['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+
+    def _is_usable(self, conn, created_at, returned_at):
+        """Cheap checks first; SELECT 1 only for connections idle for a while"""
+        now = time.time()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at < self.validate_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed validation: {e}")
+            with self._cond:
+                self._metrics['validation_failures'] += 1
+            return False
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to timeout seconds for one"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if not self._idle and self._size >= self.maxconn and self._waiting >= self.max_waiting:
+                    self._metrics['exhausted'] += 1
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(f"connection pool exhausted ({self._waiting} callers already waiting)")
+
+                counted_exhaustion = False
+                while not self._idle and self._size >= self.maxconn:
+                    if not counted_exhaustion:
+                        self._metrics['exhausted'] += 1
+                        counted_exhaustion = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeout(f"no connection available within {timeout:.1f}s "
+                                          f"({self._size} in use)")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                waited = time.monotonic() - start
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is not None and not self._is_usable(conn, created_at, returned_at):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._metrics['recycled'] += 1
+                    self._cond.notify()
+                continue
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.time()
+
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self._in_use[id(conn)] = (conn, created_at, time.time())
+                m = self._metrics
+                m['checkouts'] += 1
+                m['wait_time_total'] += waited
+                m['wait_time_max'] = max(m['wait_time_max'], waited)
+                m['checkout_time_total'] += elapsed
+                m['checkout_time_max'] = max(m['checkout_time_max'], elapsed)
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; broken or mid-transaction connections are cleaned up"""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Returned a connection that does not belong to the pool")
+            self._discard(conn)
+            return
+        _, created_at, _ = entry
+
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning(f"Rollback on return failed, discarding connection: {e}")
+                    close = True
+
+        with self._cond:
+            if close or conn.closed or self._closed:
+                self._size -= 1
+                self._metrics['recycled'] += 1
+                discard = True
+            else:
+                self._idle.append((conn, created_at, time.time()))
+                discard = False
+            self._cond.notify()
+        if discard:
+            self._discard(conn)
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def reset_after_fork(self):
+        """
+        Forget connections inherited from a parent process.
+
+        The sockets belong to the parent, so they are dropped without
+        sending a terminate message; the pool refills on demand.
+        """
+        # The parent's lock may have been held at fork time
+        self._cond = threading.Condition()
+        # Keep the inherited objects alive: closing or collecting them
+        # would end the parent's sessions
+        self._inherited.extend(conn for conn, _, _ in self._idle)
+        self._inherited.extend(conn for conn, _, _ in self._in_use.values())
+        self._idle.clear()
+        self._in_use.clear()
+        self._size = 0
+        self._waiting = 0
+
+    def stats(self):
+        """Snapshot of pool gauges and counters for monitoring"""
+        with self._cond:
+            m = dict(self._metrics)
+            checkouts = m['checkouts']
+            m.update({
+                'min': self.minconn,
+                'max': self.maxconn,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'wait_time_avg': m['wait_time_total'] / checkouts if checkouts else 0.0,
+                'checkout_time_avg': m['checkout_time_total'] / checkouts if checkouts else 0.0,
+            })
+            return m
+
+
+# Every pool in this process, so forked workers never share the parent's sockets
+_pools = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool.reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def pool_settings(settings):
+    """Translate plantcare.db.* ini settings into ConnectionPool arguments"""
+    connect_kwargs = {
+        key: settings.get(f'plantcare.db.{key}', default)
+        for key, default in DEFAULT_DB_SETTINGS.items()
+    }
+    if settings.get('plantcare.db.port'):
+        connect_kwargs['port'] = int(settings['plantcare.db.port'])
+    return dict(
+        minconn=int(settings.get('plantcare.db.pool_min', DEFAULT_POOL_MIN)),
+        maxconn=int(settings.get('plantcare.db.pool_max', DEFAULT_POOL_MAX)),
+        timeout=float(settings.get('plantcare.db.pool_timeout', DEFAULT_POOL_TIMEOUT)),
+        max_waiting=int(settings.get('plantcare.db.pool_max_waiting', DEFAULT_POOL_MAX_WAITING)),
+        validate_after=float(settings.get('plantcare.db.pool_validate_after', DEFAULT_VALIDATE_AFTER)),
+        max_lifetime=float(settings.get('plantcare.db.pool_max_lifetime', DEFAULT_MAX_LIFETIME)),
+        **connect_kwargs
+    )
+
+
+def create_pool(settings, prefill=True, on_connect=(), **connect_kwargs):
+    """Build a ConnectionPool from ini settings; extra keywords go to psycopg2.connect"""
+    kwargs = pool_settings(settings)
+    kwargs.update(connect_kwargs)
+    pool = ConnectionPool(prefill=prefill, on_connect=on_connect, **kwargs)
+    logger.info(f"Database connection pool created ({kwargs['minconn']}-{kwargs['maxconn']} connections, "
+                f"{kwargs['timeout']}s wait timeout)")
+    return pool
@@ -0,0 +1,92 @@
+"""
+Streaming CSV/NDJSON export backed by server-side cursors
+"""
+import io
+import csv
+import json
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Supported ?format= values and their content types
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+# Rows fetched from the server-side cursor per round trip
+ITERSIZE = 2000
+
+
+class ExportStream:
+    """
+    WSGI app_iter streaming a query result in constant memory.
+
+    Rows are read from a named (server-side) cursor ITERSIZE at a time
+    and encoded chunk by chunk. The connection is handed back through
+    release() when the stream is exhausted or closed by the server,
+    including when the client disconnects before iteration starts.
+    With fields, CSV output starts with that header even when no row
+    matches; without, the header comes from the first row.
+    """
+
+    def __init__(self, conn, release, sql, params, to_dict, fmt, name='export', fields=None):
+        self.conn = conn
+        self.release = release
+        self.sql = sql
+        self.params = params
+        self.to_dict = to_dict
+        self.fmt = fmt
+        self.fields = list(fields) if fields else None
+        self.cursor_name = f"{name}_{uuid.uuid4().hex[:12]}"
+        self.rows = 0
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            cur = self.conn.cursor(name=self.cursor_name)
+            cur.itersize = ITERSIZE
+            cur.execute(self.sql, self.params)
+
+            buf = io.StringIO()
+            writer = None
+            if self.fmt == 'csv' and self.fields:
+                writer = csv.DictWriter(buf, fieldnames=self.fields)
+                writer.writeheader()
+            while True:
+                rows = cur.fetchmany(ITERSIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    item = self.to_dict(row)
+                    if self.fmt == 'csv':
+                        if writer is None:
+                            writer = csv.DictWriter(buf, fieldnames=list(item))
+                            writer.writeheader()
+                        writer.writerow(item)
+                    else:
+                        buf.write(json.dumps(item, default=str))
+                        buf.write('\n')
+                self.rows += len(rows)
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+            if buf.tell():
+                # Header of an empty result
+                yield buf.getvalue().encode('utf-8')
+            cur.close()
+            logger.info(f"Export {self.cursor_name} streamed {self.rows} rows")
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the connection; safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            # End the read-only transaction the named cursor lives in
+            self.conn.rollback()
+        except Exception as e:
+            logger.error(f"Error ending export transaction: {e}")
+        self.release(self.conn)
@@ -0,0 +1,172 @@
+"""
+Bounded worker pool for bcrypt hashing and verification
+
+bcrypt deliberately takes ~100-300ms of CPU per call. Running it on the
+serving threads lets a burst of logins occupy all of them, so login and
+register hand the work to a dedicated pool instead. bcrypt releases the
+GIL, so the pool's threads hash in parallel.
+
+At most plantcare.auth.hash_workers calls run at once and
+plantcare.auth.hash_queue more may wait. Every admitted call parks a
+serving thread until it finishes, so admitted calls are also capped at
+plantcare.server.threads minus RESERVED_THREADS: a login burst can never
+occupy every serving thread, and other requests are still answered.
+Beyond that, or when a call is not finished within
+plantcare.auth.hash_timeout seconds, HasherBusy is raised and the views
+answer 503 with Retry-After.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+try:
+    from .server import DEFAULT_THREADS
+except ImportError:
+    from server import DEFAULT_THREADS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+DEFAULT_TIMEOUT = 5.0  # seconds a caller waits for its hash before giving up
+DEFAULT_RETRY_AFTER = 1  # seconds suggested to rejected clients
+RESERVED_THREADS = 2  # serving threads hashing may never occupy
+
+
+def admission_limit(server_threads):
+    """Calls that may wait on the pool at once without starving a server with server_threads threads"""
+    return max(1, server_threads - RESERVED_THREADS)
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated or a call timed out"""
+
+
+class PasswordHasher:
+    """Runs password hashing calls on a size-limited thread pool with admission control"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=None, timeout=DEFAULT_TIMEOUT,
+                 retry_after=DEFAULT_RETRY_AFTER, max_pending=None):
+        self.workers = workers
+        self.max_queue = workers * 2 if max_queue is None else max_queue
+        # Running plus queued calls admitted at once
+        if max_pending is None:
+            max_pending = admission_limit(DEFAULT_THREADS)
+        self.max_pending = min(workers + self.max_queue, max_pending)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0  # queued plus running
+        self._running = 0
+        self._metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'queue_time_total': 0.0,
+            'queue_time_max': 0.0,
+            'run_time_total': 0.0,
+            'run_time_max': 0.0,
+        }
+
+    def _pool(self):
+        # Threads do not survive fork, so each process starts its own pool
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            self._pid = os.getpid()
+            self._pending = 0
+            self._running = 0
+        return self._executor
+
+    def submit(self, func, *args):
+        """Queue func(*args); returns a Future or raises HasherBusy when the queue is full"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._metrics['rejected'] += 1
+                raise HasherBusy(f"password hashing pool saturated ({self._pending} calls pending)")
+            pool = self._pool()
+            self._pending += 1
+            self._metrics['submitted'] += 1
+        future = pool.submit(self._run, func, args, time.monotonic())
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future):
+        # A call cancelled before it started never reaches _run
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, func, args, queued_at):
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+            m = self._metrics
+            m['queue_time_total'] += started - queued_at
+            m['queue_time_max'] = max(m['queue_time_max'], started - queued_at)
+        ok = False
+        try:
+            result = func(*args)
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                m = self._metrics
+                m['completed' if ok else 'failed'] += 1
+                m['run_time_total'] += elapsed
+                m['run_time_max'] = max(m['run_time_max'], elapsed)
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool and wait for its result"""
+        future = self.submit(func, *args)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Drop it if it has not started; a running call finishes unobserved
+            future.cancel()
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            raise HasherBusy(f"password hashing did not finish within {self.timeout:.1f}s")
+
+    def stats(self):
+        """Gauges and counters for monitoring"""
+        with self._lock:
+            m = dict(self._metrics)
+            started = m['completed'] + m['failed']
+            m.update({
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'max_pending': self.max_pending,
+                'running': self._running,
+                'queued': self._pending - self._running,
+                'queue_time_avg': m['queue_time_total'] / started if started else 0.0,
+                'run_time_avg': m['run_time_total'] / started if started else 0.0,
+            })
+            return m
+
+
+hasher = PasswordHasher()
+
+
+def configure_hashing(settings):
+    """Apply plantcare.auth.hash_* settings, capped by plantcare.server.threads"""
+    global hasher
+    workers = int(settings.get('plantcare.auth.hash_workers') or DEFAULT_WORKERS)
+    queue = settings.get('plantcare.auth.hash_queue')
+    threads = int(settings.get('plantcare.server.threads') or DEFAULT_THREADS)
+    hasher = PasswordHasher(
+        workers=workers,
+        max_queue=int(queue) if queue else None,
+        timeout=float(settings.get('plantcare.auth.hash_timeout', DEFAULT_TIMEOUT)),
+        retry_after=int(settings.get('plantcare.auth.hash_retry_after', DEFAULT_RETRY_AFTER)),
+        max_pending=admission_limit(threads),
+    )
+    logger.info(f"Password hashing pool: {hasher.workers} workers, at most {hasher.max_pending} calls "
+                f"admitted ({threads} serving threads)")
@@ -0,0 +1,117 @@
+"""
+COPY-based bulk import of tanaman/jadwal from CSV or NDJSON
+"""
+import io
+import csv
+import json
+import time
+import logging
+
+try:
+    from .bulk import TABLES, validate_item
+except ImportError:
+    from bulk import TABLES, validate_item
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+# Valid rows buffered before each COPY round trip
+DEFAULT_CHUNK_ROWS = 5000
+# Rejected rows reported back individually (the count is always exact)
+MAX_REPORTED_ERRORS = 100
+
+
+def _aliases(table):
+    """Accept both the API field names and the column names as input keys"""
+    aliases = {}
+    for key, column, _, _, _ in TABLES[table]['fields']:
+        aliases[key] = key
+        aliases[column] = key
+    return aliases
+
+
+def iter_records(fileobj, fmt):
+    """
+    Yield (line_number, record, error) from a binary file object.
+
+    Records are read lazily, so memory does not grow with file size.
+    """
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+    else:
+        for line_number, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line), None
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+
+
+def import_stream(conn, table, fileobj, fmt='csv', chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Validate records in chunks and load the valid ones with COPY FROM STDIN.
+
+    The whole import runs in one transaction: either every valid row is
+    committed or nothing is. Returns a report with imported/rejected
+    counts and the first MAX_REPORTED_ERRORS rejections.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+    start_time = time.time()
+    aliases = _aliases(table)
+    columns = ', '.join(column for _, column, _, _, _ in TABLES[table]['fields'])
+    copy_sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    cur = conn.cursor()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    pending = imported = rejected = 0
+    errors = []
+
+    def flush():
+        buf.seek(0)
+        cur.copy_expert(copy_sql, buf)
+        buf.seek(0)
+        buf.truncate()
+
+    try:
+        for line_number, record, error in iter_records(fileobj, fmt):
+            if error is None:
+                if isinstance(record, dict):
+                    record = {aliases.get(k, k): v for k, v in record.items()}
+                row, error = validate_item(table, record)
+            if error:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_number, "msg": error})
+                continue
+            writer.writerow(row)
+            pending += 1
+            if pending >= chunk_rows:
+                flush()
+                imported += pending
+                pending = 0
+        if pending:
+            flush()
+            imported += pending
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = time.time() - start_time
+    logger.info(f"Imported {imported} rows into {table} ({rejected} rejected) in {elapsed:.3f}s")
+    return {
+        "table": table,
+        "imported": imported,
+        "rejected": rejected,
+        "errors": errors,
+        "rowsPerSecond": round(imported / elapsed) if elapsed > 0 else imported,
+        "queryTime": f"{elapsed:.3f}s",
+    }
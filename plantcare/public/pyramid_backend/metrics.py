@@ -0,0 +1,229 @@
+"""
+Request metrics in Prometheus text format
+
+metrics_tween_factory times every request and records it per route and
+method in a latency histogram, counts responses by status and tracks
+the number of requests in flight. render() writes those, estimated
+p50/p90/p99 per endpoint and any component stats passed in (cache,
+connection pool, prepared statements, hashing pool) as Prometheus text
+for GET /metrics.
+
+Each worker process keeps its own numbers; Prometheus sums them when
+every worker is scraped.
+
+GET /metrics answers a logged-in session, a request carrying
+Authorization: Bearer <plantcare.metrics.token>, or anyone when
+plantcare.metrics.public is true.
+"""
+import hmac
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, as in the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.9, 0.99)
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+UNMATCHED_ROUTE = 'unmatched'
+# Methods recorded by name; anything else a client sends is labelled OTHER
+# so arbitrary method strings cannot create new series
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+OTHER_METHOD = 'OTHER'
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Estimate the q-quantile by linear interpolation within its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if seen + count >= rank:
+                return lower + (bound - lower) * ((rank - seen) / count if count else 0.0)
+            lower, seen = bound, seen + count
+        return self.buckets[-1]
+
+
+class RequestMetrics:
+    """Latency, status and in-flight numbers for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}  # (route, method) -> Histogram
+        self.responses = {}  # (route, method, status) -> count
+        self.in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, route, method, status, elapsed):
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self.latency.get((route, method))
+            if histogram is None:
+                histogram = self.latency[(route, method)] = Histogram()
+            histogram.observe(elapsed)
+            key = (route, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            latency = {key: (list(h.cumulative()), h.sum, h.count, {q: h.quantile(q) for q in QUANTILES})
+                       for key, h in self.latency.items()}
+            return latency, dict(self.responses), self.in_flight
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.responses.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def render(components=None, statements=None):
+    """
+    Prometheus text exposition of the request metrics.
+
+    components maps a name (e.g. 'cache', 'db_pool') to a stats dict;
+    each numeric entry becomes a plantcare_<name>_<key> gauge.
+    statements is the prepared-statement registry's per-statement stats.
+    """
+    latency, responses, in_flight = request_metrics.snapshot()
+    lines = []
+
+    lines.append('# HELP plantcare_http_request_duration_seconds Request latency by route and method')
+    lines.append('# TYPE plantcare_http_request_duration_seconds histogram')
+    for (route, method), (buckets, total, count, _) in sorted(latency.items()):
+        for bound, cumulative in buckets:
+            lines.append(f'plantcare_http_request_duration_seconds_bucket'
+                         f'{_labels(route=route, method=method, le=_number(bound))} {cumulative}')
+        lines.append(f'plantcare_http_request_duration_seconds_sum{_labels(route=route, method=method)} {total!r}')
+        lines.append(f'plantcare_http_request_duration_seconds_count{_labels(route=route, method=method)} {count}')
+
+    lines.append('# HELP plantcare_http_request_duration_quantile_seconds Latency quantiles estimated from the histogram')
+    lines.append('# TYPE plantcare_http_request_duration_quantile_seconds gauge')
+    for (route, method), (_, _, _, quantiles) in sorted(latency.items()):
+        for q, value in quantiles.items():
+            if value is not None:
+                lines.append(f'plantcare_http_request_duration_quantile_seconds'
+                             f'{_labels(route=route, method=method, quantile=q)} {value!r}')
+
+    lines.append('# HELP plantcare_http_responses_total Responses by route, method and status')
+    lines.append('# TYPE plantcare_http_responses_total counter')
+    for (route, method, status), count in sorted(responses.items()):
+        lines.append(f'plantcare_http_responses_total{_labels(route=route, method=method, status=status)} {count}')
+
+    lines.append('# HELP plantcare_http_requests_in_flight Requests being handled')
+    lines.append('# TYPE plantcare_http_requests_in_flight gauge')
+    lines.append(f'plantcare_http_requests_in_flight {in_flight}')
+
+    for name, stats in sorted((components or {}).items()):
+        for key, value in sorted((stats or {}).items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f'plantcare_{name}_{key}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {_number(value)}')
+
+    if statements:
+        lines.append('# HELP plantcare_statement_executions_total Executions per prepared statement')
+        lines.append('# TYPE plantcare_statement_executions_total counter')
+        for name, stats in sorted(statements.items()):
+            lines.append(f'plantcare_statement_executions_total{_labels(statement=name)} {stats["executions"]}')
+        lines.append('# HELP plantcare_statement_duration_seconds_total Time spent executing each prepared statement')
+        lines.append('# TYPE plantcare_statement_duration_seconds_total counter')
+        for name, stats in sorted(statements.items()):
+            lines.append(f'plantcare_statement_duration_seconds_total{_labels(statement=name)} '
+                         f'{stats["total_ms"] / 1000.0!r}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class ScrapeAccess:
+    """Who may read GET /metrics"""
+
+    def __init__(self, public=False, token=None):
+        self.public = public
+        self.token = token
+
+    def allows(self, authorization=None, user=None):
+        """True for public metrics, a logged-in user or the configured bearer token"""
+        if self.public or user is not None:
+            return True
+        if not self.token or not authorization or authorization[:7].lower() != 'bearer ':
+            return False
+        return hmac.compare_digest(authorization[7:].strip().encode('utf-8'), self.token.encode('utf-8'))
+
+
+access = ScrapeAccess()
+
+
+def configure_metrics(settings):
+    """Apply plantcare.metrics.* settings from the ini file"""
+    global access
+    access = ScrapeAccess(
+        public=str(settings.get('plantcare.metrics.public', 'false')).lower() in ('true', '1', 'yes', 'on'),
+        token=settings.get('plantcare.metrics.token') or None,
+    )
+    logger.info(f"Metrics endpoint: {'public' if access.public else 'session or token'}")
+
+
+def metrics_tween_factory(handler, registry):
+    def metrics_tween(request):
+        request_metrics.started()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.matched_route.name if getattr(request, 'matched_route', None) else UNMATCHED_ROUTE
+            method = request.method if request.method in KNOWN_METHODS else OTHER_METHOD
+            request_metrics.finished(route, method, status, time.perf_counter() - start)
+    return metrics_tween
@@ -1,9 +1,22 @@
 import psycopg2
+import os
+import json
 import time
 import logging
+import difflib
+import argparse
 from psycopg2 import pool
 from typing import Dict, List, Any
 
+try:
+    from . import queries
+    from .statements import StatementRegistry
+    from .db_pool import DEFAULT_DB_SETTINGS
+except ImportError:
+    import queries
+    from statements import StatementRegistry
+    from db_pool import DEFAULT_DB_SETTINGS
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -246,6 +259,12 @@ class DatabasePerformanceMonitor:
             ("Exact match", "SELECT * FROM tanaman WHERE nama = 'Mawar'"),
             ("ILIKE search", "SELECT * FROM tanaman WHERE nama ILIKE '%rose%'"),
             ("Multi-column search", "SELECT * FROM tanaman WHERE nama ILIKE '%a%' OR jenis ILIKE '%a%' OR lokasi ILIKE '%a%'"),
+            ("Ranked trigram search", "SELECT id, nama, jenis, lokasi FROM tanaman "
+                                      "WHERE nama ILIKE '%mons%' OR jenis ILIKE '%mons%' OR lokasi ILIKE '%mons%' "
+                                      "ORDER BY GREATEST(word_similarity('mons', nama), word_similarity('mons', jenis), "
+                                      "word_similarity('mons', lokasi)) DESC LIMIT 50"),
+            ("Jadwal search", "SELECT id, nama_tanaman, kegiatan, tanggal FROM jadwal "
+                              "WHERE nama_tanaman ILIKE '%siram%' OR kegiatan ILIKE '%siram%' LIMIT 50"),
             ("Date range search", "SELECT * FROM jadwal WHERE tanggal >= CURRENT_DATE AND tanggal <= CURRENT_DATE + INTERVAL '7 days'"),
         ]
         
@@ -259,6 +278,39 @@ class DatabasePerformanceMonitor:
         
         return {"search_tests": search_tests}
     
+    def test_prepared_statements(self) -> Dict[str, Any]:
+        """Compare planning time of the hot queries ad hoc and as prepared statements"""
+        logger.info("Testing prepared statement planning time...")
+        
+        if not self.connection:
+            self.connect()
+        
+        registry = StatementRegistry()
+        cursor = self.connection.cursor()
+        page_sql, page_params = queries.tanaman_page_query([], [], 50)
+        hot_queries = [
+            ("Dashboard summary", "dashboard", queries.DASHBOARD_QUERY, []),
+            ("Login lookup", "login", queries.LOGIN_QUERY, ['admin']),
+            ("Tanaman page", "tanaman_page", page_sql, page_params),
+        ]
+        
+        results = []
+        try:
+            for test_name, name, sql, params in hot_queries:
+                # Run the statement a few times so Postgres can settle on a generic plan
+                for _ in range(6):
+                    registry.execute(cursor, sql, params, name=name)
+                    cursor.fetchall()
+                timing = registry.planning_times(cursor, sql, params, name=name)
+                timing["test_name"] = test_name
+                results.append(timing)
+        finally:
+            self.connection.rollback()
+            cursor.execute('DEALLOCATE ALL')
+            cursor.close()
+        
+        return {"prepared_statements": results}
+    
     def generate_performance_report(self) -> Dict[str, Any]:
         """Generate comprehensive performance report"""
         logger.info("Generating performance report...")
@@ -268,6 +320,7 @@ class DatabasePerformanceMonitor:
             "database_analysis": {},
             "dashboard_performance": {},
             "search_performance": {},
+            "prepared_statements": {},
             "recommendations": []
         }
         
@@ -282,6 +335,9 @@ class DatabasePerformanceMonitor:
             # Test search performance
             report["search_performance"] = self.test_search_performance()
             
+            # Compare planning time with and without PREPARE
+            report["prepared_statements"] = self.test_prepared_statements()
+            
             # Generate recommendations
             report["recommendations"] = self.generate_recommendations(report)
             
@@ -317,14 +373,9 @@ class DatabasePerformanceMonitor:
         
         return recommendations
 
-def run_performance_analysis():
+def run_performance_analysis(db_config=None):
     """Run complete performance analysis"""
-    db_config = {
-        'dbname': 'plantcare_db',
-        'user': 'postgres',
-        'password': 'jeremiaz',
-        'host': 'localhost'
-    }
+    db_config = db_config or dict(DEFAULT_DB_SETTINGS)
     
     monitor = DatabasePerformanceMonitor(db_config)
     
@@ -377,5 +428,515 @@ def run_performance_analysis():
     finally:
         monitor.disconnect()
 
+# --- Scale benchmarks ---
+#
+# The report above times each query once against the few seed rows in
+# db_setup.sql. The benchmark suite instead fills a separate schema with
+# generated tanaman/jadwal/users data at a chosen scale, runs every hot
+# query with warmups and many iterations, and writes the latency
+# distribution and each query's EXPLAIN plan to a JSON file. Any such file
+# can serve as a baseline: compare_results() flags latency regressions and
+# plan changes (e.g. an index scan turning into a seq scan after an index
+# or schema change) against it.
+
+BENCH_SCHEMA = 'plantcare_bench'
+BENCH_SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+BENCH_CHUNK_ROWS = 500_000  # rows inserted per transaction while generating
+BENCH_USERS = 1000
+# dashboard_summary.sql aggregates, rebuilt from the generated tables
+BENCH_SUMMARY_TABLES = {
+    'dashboard_totals': "INSERT INTO {schema}.dashboard_totals (table_name, row_count) "
+                        "SELECT 'tanaman', COUNT(*) FROM {schema}.tanaman "
+                        "UNION ALL SELECT 'jadwal', COUNT(*) FROM {schema}.jadwal",
+    'tanaman_jenis_counts': "INSERT INTO {schema}.tanaman_jenis_counts (jenis, jumlah) "
+                            "SELECT jenis, COUNT(*) FROM {schema}.tanaman GROUP BY jenis",
+    'jadwal_date_counts': "INSERT INTO {schema}.jadwal_date_counts (tanggal, jumlah) "
+                          "SELECT tanggal, COUNT(*) FROM {schema}.jadwal WHERE tanggal IS NOT NULL GROUP BY tanggal",
+}
+DEFAULT_ITERATIONS = 50
+DEFAULT_WARMUP = 5
+DEFAULT_REGRESSION_THRESHOLD = 0.10  # relative slowdown flagged by compare_results
+MIN_REGRESSION_MS = 0.5  # absolute slowdown below which changes are noise
+
+PLANT_NAMES = ['Lidah Buaya', 'Monstera', 'Anggrek', 'Mawar', 'Melati', 'Kaktus', 'Sirih Gading',
+               'Lavender', 'Kemangi', 'Cabai', 'Tomat', 'Pakis', 'Bonsai Beringin', 'Sansevieria',
+               'Aglaonema', 'Kamboja', 'Bugenvil', 'Puring', 'Kuping Gajah', 'Calathea']
+PLANT_TYPES = ['Hias', 'Sukulen', 'Herbal', 'Sayuran', 'Buah', 'Bunga', 'Pakis', 'Kaktus', 'Merambat', 'Bonsai']
+LOCATIONS = ['Halaman Depan', 'Halaman Belakang', 'Ruang Tamu', 'Kamar Tidur', 'Dapur', 'Balkon',
+             'Teras', 'Kebun', 'Rumah Kaca', 'Atap']
+ACTIVITIES = ['Penyiraman', 'Pemupukan', 'Pemangkasan', 'Penggantian Pot', 'Penyemprotan Hama',
+              'Penyiangan', 'Panen']
+
+
+def parse_scale(scale) -> int:
+    """Row count for a scale name ('10k', '1m', '10m') or a plain number"""
+    text = str(scale).strip().lower()
+    if text in BENCH_SCALES:
+        return BENCH_SCALES[text]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if multiplier > 1 else text
+    try:
+        rows = int(float(number) * multiplier)
+    except ValueError:
+        raise ValueError(f"Unknown scale {scale!r}; use one of {', '.join(BENCH_SCALES)} or a row count")
+    if rows <= 0:
+        raise ValueError("Scale must be positive")
+    return rows
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """q-th percentile (0-100) of an ascending list, linearly interpolated"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(timings: List[float], rows: int) -> Dict[str, Any]:
+    """Latency distribution in milliseconds and throughput for one benchmark case"""
+    ordered = sorted(timings)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3) if ordered else 0.0,
+        "median_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "mean_ms": round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        "rows_per_iteration": rows,
+        "rows_per_sec": round(rows * len(ordered) / total, 1) if total else 0.0,
+    }
+
+
+def _sql_array(values: List[str]) -> str:
+    return 'ARRAY[' + ', '.join("'" + v.replace("'", "''") + "'" for v in values) + ']'
+
+
+def _pick(values: List[str], skew: bool = False) -> str:
+    # power(random(), 2) favours the first entries, like real category counts
+    position = 'power(random(), 2)' if skew else 'random()'
+    return f"({_sql_array(values)})[1 + floor({position} * {len(values)})::int]"
+
+
+def generate_dataset(conn, tanaman_rows: int, jadwal_per_tanaman: int = 2, seed: float = 0.42,
+                     schema: str = BENCH_SCHEMA, regenerate: bool = False) -> Dict[str, Any]:
+    """
+    Fill schema with generated tanaman, jadwal and users tables.
+
+    The tables copy the columns of the live ones and, after loading,
+    every index the live tables have (so add_indices.sql must have run
+    on the main schema first). When dashboard_summary.sql has run on the
+    main schema, its aggregate tables are built for the dataset too. A
+    dataset of the same size and seed left by an earlier run is reused
+    unless regenerate is set.
+    """
+    jadwal_rows = tanaman_rows * jadwal_per_tanaman
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT to_regclass('public.dashboard_totals') IS NOT NULL")
+        summary = bool(cur.fetchone()[0])
+        spec = {"tanaman": tanaman_rows, "jadwal": jadwal_rows, "users": BENCH_USERS, "seed": seed,
+                "summary": summary}
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+        cur.execute('SELECT obj_description(%s::regnamespace)', [schema])
+        existing = cur.fetchone()[0]
+        try:
+            existing = json.loads(existing) if existing else None
+        except ValueError:
+            # Commented by hand or by something else: not a dataset we know
+            existing = None
+        if not regenerate and existing == spec:
+            conn.commit()
+            logger.info(f"Reusing benchmark dataset in {schema}: {spec}")
+            return spec
+
+        logger.info(f"Generating benchmark dataset in {schema}: {spec}")
+        start = time.time()
+        for table in ('tanaman', 'jadwal', 'users', *BENCH_SUMMARY_TABLES):
+            cur.execute(f'DROP TABLE IF EXISTS {schema}.{table}')
+        for table in ('tanaman', 'jadwal', 'users'):
+            cur.execute(f'CREATE TABLE {schema}.{table} (LIKE public.{table})')
+        cur.execute('SELECT setseed(%s)', [seed])
+        conn.commit()
+
+        for first in range(1, tanaman_rows + 1, BENCH_CHUNK_ROWS):
+            last = min(first + BENCH_CHUNK_ROWS - 1, tanaman_rows)
+            cur.execute(
+                f"INSERT INTO {schema}.tanaman (id, nama, jenis, lokasi, created_at) "
+                f"SELECT g, {_pick(PLANT_NAMES)} || ' ' || g, "
+                f"CASE WHEN random() < 0.01 THEN NULL ELSE {_pick(PLANT_TYPES, skew=True)} END, "
+                f"{_pick(LOCATIONS, skew=True)}, "
+                f"now() - random() * interval '730 days' "
+                f"FROM generate_series(%s, %s) g", [first, last])
+            conn.commit()
+        for first in range(1, jadwal_rows + 1, BENCH_CHUNK_ROWS):
+            last = min(first + BENCH_CHUNK_ROWS - 1, jadwal_rows)
+            cur.execute(
+                f"INSERT INTO {schema}.jadwal (id, nama_tanaman, kegiatan, tanggal) "
+                f"SELECT g, {_pick(PLANT_NAMES)} || ' ' || (1 + floor(random() * %s)::int), "
+                f"{_pick(ACTIVITIES, skew=True)}, "
+                f"CURRENT_DATE + (random() * 365 - 180)::int "
+                f"FROM generate_series(%s, %s) g", [tanaman_rows, first, last])
+            conn.commit()
+        # Login only looks the user up, so every user shares the seed admin hash
+        cur.execute(
+            f"INSERT INTO {schema}.users (username, password_hash, created_at) "
+            f"SELECT 'user_' || g, (SELECT password_hash FROM public.users WHERE username = 'admin'), now() "
+            f"FROM generate_series(1, %s) g", [BENCH_USERS])
+
+        # Indexes after the load, mirroring the live tables
+        cur.execute("SELECT indexdef FROM pg_indexes WHERE schemaname = 'public' "
+                    "AND tablename IN ('tanaman', 'jadwal', 'users')")
+        for (indexdef,) in cur.fetchall():
+            cur.execute(indexdef.replace(' ON public.', f' ON {schema}.', 1))
+        if summary:
+            for table, fill in BENCH_SUMMARY_TABLES.items():
+                cur.execute(f'CREATE TABLE {schema}.{table} (LIKE public.{table} INCLUDING INDEXES)')
+                cur.execute(fill.format(schema=schema))
+        for table in ('tanaman', 'jadwal', 'users', *(BENCH_SUMMARY_TABLES if summary else ())):
+            cur.execute(f'ANALYZE {schema}.{table}')
+        cur.execute(f"COMMENT ON SCHEMA {schema} IS %s", [json.dumps(spec)])
+        conn.commit()
+        logger.info(f"Benchmark dataset generated in {time.time() - start:.1f}s")
+        return spec
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+# Node types that read a table through an index
+INDEX_ACCESS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+def _plan_nodes(node: Dict[str, Any], depth: int = 0):
+    yield depth, node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child, depth + 1)
+
+
+def plan_shape(root: Dict[str, Any]) -> List[str]:
+    """Plan tree as indented node descriptions, without costs or row estimates"""
+    shape = []
+    for depth, node in _plan_nodes(root):
+        text = node['Node Type']
+        if node.get('Join Type'):
+            text += f" ({node['Join Type']})"
+        if node.get('Relation Name'):
+            text += f" on {node['Relation Name']}"
+        if node.get('Index Name'):
+            text += f" using {node['Index Name']}"
+        shape.append('  ' * depth + text)
+    return shape
+
+
+def relation_access(root: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Scan node types used on each table"""
+    access = {}
+    for _, node in _plan_nodes(root):
+        if node.get('Relation Name'):
+            access.setdefault(node['Relation Name'], set()).add(node['Node Type'])
+    return {relation: sorted(types) for relation, types in access.items()}
+
+
+def explain_plan(cur, sql: str, params, registry: StatementRegistry = None, name: str = None) -> Dict[str, Any]:
+    """
+    EXPLAIN (FORMAT JSON) of one query, reduced to what compare_results checks.
+
+    With a registry the query is explained through its prepared
+    statement, so the plan is the one the timed executions used.
+    """
+    if registry is not None:
+        registry.explain(cur, sql, params, name=name)
+    else:
+        cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params or None)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]['Plan']
+    return {
+        "shape": plan_shape(root),
+        "access": relation_access(root),
+        "total_cost": root.get('Total Cost'),
+        "plan_rows": root.get('Plan Rows'),
+        "plan": root,
+    }
+
+
+def diff_plans(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape differences, tables read or no longer read, and tables that lost index access"""
+    added = sorted(set(current["access"]) - set(baseline["access"]))
+    removed = sorted(set(baseline["access"]) - set(current["access"]))
+    downgrades = []
+    for relation, before in baseline["access"].items():
+        after = current["access"].get(relation, [])
+        had_index = any(t in INDEX_ACCESS for t in before)
+        has_index = any(t in INDEX_ACCESS for t in after)
+        if had_index and not has_index and 'Seq Scan' in after:
+            downgrades.append(f"{relation}: {', '.join(before)} -> {', '.join(after)}")
+    diff = []
+    if baseline["shape"] != current["shape"]:
+        diff = [line for line in difflib.unified_diff(baseline["shape"], current["shape"], lineterm='', n=1)
+                if not line.startswith(('---', '+++'))]
+    return {"changed": bool(diff or added or removed), "downgrades": downgrades, "diff": diff,
+            "added": added, "removed": removed}
+
+
+class BenchmarkSuite:
+    """Times the dashboard, list, search, count and login queries against a generated dataset"""
+
+    def __init__(self, db_config: Dict[str, str], iterations: int = DEFAULT_ITERATIONS,
+                 warmup: int = DEFAULT_WARMUP, prepare: bool = True, schema: str = BENCH_SCHEMA):
+        self.db_config = db_config
+        self.iterations = iterations
+        self.warmup = warmup
+        self.prepare = prepare
+        self.schema = schema
+        self.connection = None
+
+    def connect(self):
+        # Unqualified table names in queries.py resolve to the benchmark tables
+        self.connection = psycopg2.connect(options=f'-c search_path={self.schema},public', **self.db_config)
+
+    def disconnect(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def cases(self, cur, dataset: Dict[str, Any]) -> List[tuple]:
+        """(name, sql, params) for every benchmarked query at this scale"""
+        tanaman_rows = dataset["tanaman"]
+        deep_offset = min(10_000, tanaman_rows // 2)
+        # Keyset cursors positioned as deep as the offset case
+        cur.execute('SELECT created_at, id FROM tanaman ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1',
+                    [deep_offset])
+        tanaman_key = cur.fetchone()
+        cur.execute('SELECT tanggal, id FROM jadwal ORDER BY tanggal ASC, id ASC OFFSET %s LIMIT 1', [deep_offset])
+        jadwal_key = cur.fetchone()
+        self.connection.rollback()
+
+        tanaman_search = queries.tanaman_filters('mons')
+        jadwal_search = queries.jadwal_filters('pemupukan')
+        jadwal_date = queries.jadwal_filters(tanggal_filter=time.strftime('%Y-%m-%d'))
+        cases = [
+            ("dashboard", queries.DASHBOARD_QUERY, []),
+            ("tanaman_page", *queries.tanaman_page_query([], [], 50)),
+            ("tanaman_page_offset", *queries.tanaman_page_query([], [], 50, deep_offset)),
+            ("tanaman_search", *queries.tanaman_page_query(*tanaman_search, 50)),
+            ("tanaman_search_ranked", *queries.tanaman_page_query(*tanaman_search, 50, rank_term='mons')),
+            ("tanaman_search_count", queries.count_query('tanaman', tanaman_search[0]), tanaman_search[1]),
+            ("jadwal_page", *queries.jadwal_page_query([], [], 50)),
+            ("jadwal_page_offset", *queries.jadwal_page_query([], [], 50, deep_offset)),
+            ("jadwal_search", *queries.jadwal_page_query(*jadwal_search, 50)),
+            ("jadwal_date", *queries.jadwal_page_query(*jadwal_date, 50)),
+            ("jadwal_search_count", queries.count_query('jadwal', jadwal_search[0]), jadwal_search[1]),
+            ("login", queries.LOGIN_QUERY, [f'user_{BENCH_USERS // 2}']),
+            # Exports stream every matching row; filtered so each iteration stays bounded
+            ("tanaman_export_search", *queries.tanaman_export_query(*tanaman_search)),
+            ("jadwal_export_date", *queries.jadwal_export_query(*jadwal_date)),
+        ]
+        if dataset.get("summary"):
+            cases.append(("dashboard_summary", queries.DASHBOARD_SUMMARY_QUERY, []))
+        if tanaman_key:
+            cases.append(("tanaman_page_keyset",
+                          *queries.tanaman_page_query([], [], 50, cursor=[tanaman_key[0].isoformat(), tanaman_key[1]])))
+        if jadwal_key:
+            cases.append(("jadwal_page_keyset",
+                          *queries.jadwal_page_query([], [], 50, cursor=[jadwal_key[0].isoformat(), jadwal_key[1]])))
+        return cases
+
+    def run_case(self, registry: StatementRegistry, cur, name: str, sql: str, params) -> Dict[str, Any]:
+        """Warm up, then time iterations runs of one query (execute plus fetch)"""
+        for _ in range(self.warmup):
+            registry.execute(cur, sql, params, name=name)
+            cur.fetchall()
+        timings = []
+        rows = 0
+        for _ in range(self.iterations):
+            start = time.perf_counter()
+            registry.execute(cur, sql, params, name=name)
+            rows = len(cur.fetchall())
+            timings.append(time.perf_counter() - start)
+        self.connection.rollback()
+        result = summarize(timings, rows)
+        logger.info(f"{name}: median {result['median_ms']:.2f}ms, p95 {result['p95_ms']:.2f}ms, "
+                    f"p99 {result['p99_ms']:.2f}ms ({rows} rows)")
+        return result
+
+    def run(self, dataset: Dict[str, Any]) -> Dict[str, Any]:
+        """Run every case and return the machine-readable result document"""
+        if not self.connection:
+            self.connect()
+        registry = StatementRegistry(enabled=self.prepare)
+        cur = self.connection.cursor()
+        try:
+            cur.execute('SHOW server_version')
+            server_version = cur.fetchone()[0]
+            results = {}
+            for name, sql, params in self.cases(cur, dataset):
+                results[name] = self.run_case(registry, cur, name, sql, params)
+                results[name]["plan"] = explain_plan(cur, sql, params, registry, name)
+                self.connection.rollback()
+        finally:
+            self.connection.rollback()
+            if self.prepare:
+                cur.execute('DEALLOCATE ALL')
+            cur.close()
+        return {
+            "timestamp": time.time(),
+            "server_version": server_version,
+            "dataset": dataset,
+            "iterations": self.iterations,
+            "warmup": self.warmup,
+            "prepared": self.prepare,
+            "results": results,
+        }
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Per-case median/p95 change and plan differences between two result documents.
+
+    A case regresses when its median or p95 grew by more than threshold
+    (and MIN_REGRESSION_MS), or when a table it read through an index is
+    now read with a seq scan. Other plan shape changes are reported
+    without counting as regressions.
+    """
+    comparison = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        entry = {"case": name, "regression": False}
+        for metric in ('median_ms', 'p95_ms'):
+            old, new = before[metric], now[metric]
+            change = (new - old) / old if old else 0.0
+            entry[metric] = {"baseline": old, "current": new, "change": round(change, 4)}
+            if change > threshold and new - old > MIN_REGRESSION_MS:
+                entry["regression"] = True
+        if before.get("plan") and now.get("plan"):
+            entry["plan"] = diff_plans(before["plan"], now["plan"])
+            if entry["plan"]["downgrades"]:
+                entry["regression"] = True
+        comparison.append(entry)
+    return comparison
+
+
+def print_comparison(comparison: List[Dict[str, Any]]):
+    for entry in comparison:
+        median, p95 = entry['median_ms'], entry['p95_ms']
+        flag = '  REGRESSION' if entry['regression'] else ''
+        print(f"{entry['case']:<24} median {median['baseline']:>9.3f} -> {median['current']:>9.3f}ms "
+              f"({median['change']:+.1%})  p95 {p95['baseline']:>9.3f} -> {p95['current']:>9.3f}ms "
+              f"({p95['change']:+.1%}){flag}")
+        plan = entry.get('plan')
+        if plan and plan['changed']:
+            print("    plan changed:")
+            for line in plan['diff']:
+                print(f"      {line}")
+            for relation in plan.get('added', []):
+                print(f"    now reads: {relation}")
+            for relation in plan.get('removed', []):
+                print(f"    no longer reads: {relation}")
+        for downgrade in (plan or {}).get('downgrades', []):
+            print(f"    lost index access: {downgrade}")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_results(results: Dict[str, Any], output_dir: str = None, path: str = None) -> str:
+    """Write a result document to path, or as output_dir/bench-<rows>-<timestamp>.json"""
+    if path is None:
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(results["timestamp"]))
+        path = os.path.join(output_dir, f"bench-{results['dataset']['tanaman']}-{stamp}.json")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, default=str)
+    return path
+
+
+def run_benchmarks(db_config: Dict[str, str], scales: List[str], iterations: int = DEFAULT_ITERATIONS,
+                   warmup: int = DEFAULT_WARMUP, prepare: bool = True, output_dir: str = 'benchmarks',
+                   seed: float = 0.42, regenerate: bool = False) -> List[tuple]:
+    """Generate (or reuse) each scale's dataset, benchmark it and write the results; returns (path, results)"""
+    runs = []
+    for scale in scales:
+        rows = parse_scale(scale)
+        suite = BenchmarkSuite(db_config, iterations=iterations, warmup=warmup, prepare=prepare)
+        try:
+            suite.connect()
+            dataset = generate_dataset(suite.connection, rows, seed=seed, regenerate=regenerate)
+            results = suite.run(dataset)
+        finally:
+            suite.disconnect()
+        path = write_results(results, output_dir)
+        logger.info(f"Benchmark results for {scale} written to {path}")
+        runs.append((path, results))
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PlantCare database performance report and benchmarks")
+    for key, default in DEFAULT_DB_SETTINGS.items():
+        parser.add_argument(f'--{key}', default=default)
+    parser.add_argument('--port', type=int)
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('report', help="one-shot report against the live tables (default)")
+
+    bench = commands.add_parser('bench', help="benchmark the hot queries on generated data")
+    bench.add_argument('--scale', nargs='+', default=['10k'], help="10k, 100k, 1m, 10m or a row count")
+    bench.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    bench.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    bench.add_argument('--no-prepare', action='store_true', help="run the queries unprepared")
+    bench.add_argument('--output-dir', default='benchmarks')
+    bench.add_argument('--seed', type=float, default=0.42)
+    bench.add_argument('--regenerate', action='store_true', help="rebuild the dataset even if it matches")
+    bench.add_argument('--save-baseline', metavar='FILE', help="also write the results (timings and plans) here")
+    bench.add_argument('--baseline', metavar='FILE', help="compare against this baseline; exit 1 on regressions")
+    bench.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+
+    compare = commands.add_parser('compare', help="compare two benchmark result files")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    db_config = {key: getattr(args, key) for key in DEFAULT_DB_SETTINGS}
+    if args.port:
+        db_config['port'] = args.port
+
+    if args.command == 'bench':
+        if (args.baseline or args.save_baseline) and len(args.scale) > 1:
+            parser.error("--baseline and --save-baseline take a single --scale")
+        baseline = load_results(args.baseline) if args.baseline else None
+        runs = run_benchmarks(db_config, args.scale, args.iterations, args.warmup, not args.no_prepare,
+                              args.output_dir, args.seed, args.regenerate)
+        path, results = runs[0]
+        if args.save_baseline:
+            write_results(results, path=args.save_baseline)
+            logger.info(f"Baseline written to {args.save_baseline}")
+        if baseline is None:
+            return 0
+        if baseline.get("dataset") != results["dataset"]:
+            logger.warning(f"Baseline dataset {baseline.get('dataset')} differs from {results['dataset']}")
+        comparison = compare_results(baseline, results, args.threshold)
+        print_comparison(comparison)
+        return 1 if any(entry['regression'] for entry in comparison) else 0
+    if args.command == 'compare':
+        comparison = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+        print_comparison(comparison)
+        return 1 if any(entry['regression'] for entry in comparison) else 0
+    report = run_performance_analysis(db_config)
+    return 1 if "error" in report else 0
+
 if __name__ == "__main__":
-    run_performance_analysis()
+    raise SystemExit(main())
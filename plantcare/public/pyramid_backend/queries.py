@@ -0,0 +1,455 @@
+"""
+SQL and row shaping shared by the WSGI views and the ASGI app
+
+Statements use psycopg2 %s placeholders; to_dollar_params converts them
+to $n for asyncpg and server-side PREPARE. Date and timestamp parameters
+are written as %s::date / %s::timestamp so both accept ISO strings.
+"""
+import re
+import time
+import base64
+import json
+import itertools
+from functools import lru_cache
+
+
+# Accepted values of the ?sort= query parameter; relevance needs pg_trgm
+SORT_MODES = ('default', 'relevance')
+
+# Searchable columns, each backed by a pg_trgm GIN index (add_indices.sql)
+TANAMAN_SEARCH_COLUMNS = ('nama', 'jenis', 'lokasi')
+JADWAL_SEARCH_COLUMNS = ('nama_tanaman', 'kegiatan')
+
+
+_PLACEHOLDER = re.compile(r'%s(::(?:date|timestamp))?|%%')
+
+
+@lru_cache(maxsize=256)
+def to_dollar_params(sql):
+    """
+    Rewrite psycopg2 %s placeholders as numbered $n parameters.
+
+    asyncpg binds date/timestamp parameters only from date objects, so
+    %s::date and %s::timestamp become $n::text::date and
+    $n::text::timestamp and keep accepting ISO strings.
+    """
+    numbers = itertools.count(1)
+
+    def replace(match):
+        if match.group(0) == '%%':
+            return '%'
+        cast = match.group(1) or ''
+        return f'${next(numbers)}' + (f'::text{cast}' if cast else '')
+
+    return _PLACEHOLDER.sub(replace, sql)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(values):
+    """Encode the last row's sort key as an opaque URL-safe token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor into [sort_value, id]"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(values[1], int):
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def _sort_value(value):
+    """JSON-friendly form of a timestamp/date sort key"""
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+# Keys of the *_to_dict shapes, in order (the CSV export header)
+TANAMAN_FIELDS = ('id', 'nama', 'jenis', 'lokasi', 'created_at')
+JADWAL_FIELDS = ('id', 'namaTanaman', 'kegiatan', 'tanggal', 'waktu', 'status')
+
+
+def tanaman_to_dict(r):
+    return {"id": r[0], "nama": r[1], "jenis": r[2], "lokasi": r[3], "created_at": str(r[4])}
+
+
+def jadwal_to_dict(r):
+    return {
+        "id": r[0],
+        "namaTanaman": r[1],
+        "kegiatan": r[2],
+        "tanggal": str(r[3]),
+        "waktu": None,  # Column doesn't exist in current schema
+        "status": "pending"  # Default status since column doesn't exist
+    }
+
+
+def jadwal_write_to_dict(r):
+    """Shape of a jadwal row returned by the create/update endpoints"""
+    return {"id": r[0], "namaTanaman": r[1], "kegiatan": r[2], "tanggal": str(r[3])}
+
+
+def like_pattern(term):
+    """Wrap a search term for a substring ILIKE, escaping LIKE wildcards"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_clause(columns, term):
+    """
+    Return (sql, params) matching term as a substring of any column.
+
+    Leading-wildcard ILIKE is served by the pg_trgm GIN indexes, one
+    bitmap index scan per column.
+    """
+    pattern = like_pattern(term)
+    sql = '(' + ' OR '.join(f'{column} ILIKE %s' for column in columns) + ')'
+    return sql, [pattern] * len(columns)
+
+
+def relevance_order(columns, term):
+    """Return (sql, params) ranking rows by their best trigram word similarity"""
+    sql = 'GREATEST(' + ', '.join(f'word_similarity(%s, {column})' for column in columns) + ') DESC'
+    return sql, [term] * len(columns)
+
+
+def tanaman_filters(search=''):
+    """Return (where_clauses, params) for GET /tanaman"""
+    where_clauses = []
+    params = []
+    if search:
+        clause, clause_params = search_clause(TANAMAN_SEARCH_COLUMNS, search)
+        where_clauses.append(clause)
+        params.extend(clause_params)
+    return where_clauses, params
+
+
+def jadwal_filters(search='', tanaman_filter='', tanggal_filter=''):
+    """Return (where_clauses, params) for GET /jadwal"""
+    where_clauses = []
+    params = []
+    if search:
+        clause, clause_params = search_clause(JADWAL_SEARCH_COLUMNS, search)
+        where_clauses.append(clause)
+        params.extend(clause_params)
+    if tanaman_filter:
+        where_clauses.append('nama_tanaman ILIKE %s')
+        params.append(like_pattern(tanaman_filter))
+    if tanggal_filter:
+        where_clauses.append('tanggal::text = %s')
+        params.append(tanggal_filter)
+    return where_clauses, params
+
+
+def _where(where_clauses):
+    return ' WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+
+
+def tanaman_page_query(where_clauses, params, limit, offset=0, cursor=None, rank_term=None):
+    """
+    Build the page query for GET /tanaman, newest first.
+
+    With a cursor the page starts right after the row it encodes
+    (keyset pagination) and offset is ignored. One extra row is fetched
+    so callers can tell whether another page exists. With rank_term the
+    best matches come first and only offset paging applies.
+    """
+    clauses = list(where_clauses)
+    params = list(params)
+    order_by = 'created_at DESC, id DESC'
+    if rank_term:
+        rank_sql, rank_params = relevance_order(TANAMAN_SEARCH_COLUMNS, rank_term)
+        sql = ('SELECT id, nama, jenis, lokasi, created_at FROM tanaman' + _where(clauses) +
+               f' ORDER BY {rank_sql}, {order_by} LIMIT %s OFFSET %s')
+        return sql, params + rank_params + [limit + 1, offset]
+    if cursor is not None:
+        created_at, last_id = cursor
+        if created_at is None:
+            # NULL created_at sorts first under DESC; continue through the
+            # remaining NULL rows, then every non-NULL row
+            clauses.append('((created_at IS NULL AND id < %s) OR created_at IS NOT NULL)')
+            params.append(last_id)
+        else:
+            clauses.append('(created_at, id) < (%s::timestamp, %s)')
+            params.extend([created_at, last_id])
+        offset = 0
+
+    sql = ('SELECT id, nama, jenis, lokasi, created_at FROM tanaman' + _where(clauses) +
+           f' ORDER BY {order_by} LIMIT %s OFFSET %s')
+    return sql, params + [limit + 1, offset]
+
+
+def jadwal_page_query(where_clauses, params, limit, offset=0, cursor=None, rank_term=None):
+    """Build the page query for GET /jadwal, by date then id (see tanaman_page_query)"""
+    clauses = list(where_clauses)
+    params = list(params)
+    order_by = 'tanggal ASC, id ASC'
+    if rank_term:
+        rank_sql, rank_params = relevance_order(JADWAL_SEARCH_COLUMNS, rank_term)
+        sql = ('SELECT id, nama_tanaman, kegiatan, tanggal FROM jadwal' + _where(clauses) +
+               f' ORDER BY {rank_sql}, {order_by} LIMIT %s OFFSET %s')
+        return sql, params + rank_params + [limit + 1, offset]
+    if cursor is not None:
+        tanggal, last_id = cursor
+        if tanggal is None:
+            # NULL tanggal sorts last under ASC, so only NULL rows remain
+            clauses.append('(tanggal IS NULL AND id > %s)')
+            params.append(last_id)
+        else:
+            clauses.append('((tanggal, id) > (%s::date, %s) OR tanggal IS NULL)')
+            params.extend([tanggal, last_id])
+        offset = 0
+
+    sql = ('SELECT id, nama_tanaman, kegiatan, tanggal FROM jadwal' + _where(clauses) +
+           f' ORDER BY {order_by} LIMIT %s OFFSET %s')
+    return sql, params + [limit + 1, offset]
+
+
+def tanaman_export_query(where_clauses, params):
+    """Full, unpaginated GET /tanaman/export query in list order"""
+    sql = ('SELECT id, nama, jenis, lokasi, created_at FROM tanaman' + _where(where_clauses) +
+           ' ORDER BY created_at DESC, id DESC')
+    return sql, list(params)
+
+
+def jadwal_export_query(where_clauses, params):
+    """Full, unpaginated GET /jadwal/export query in list order"""
+    sql = ('SELECT id, nama_tanaman, kegiatan, tanggal FROM jadwal' + _where(where_clauses) +
+           ' ORDER BY tanggal ASC, id ASC')
+    return sql, list(params)
+
+
+def count_query(table, where_clauses):
+    return f'SELECT COUNT(*) FROM {table}' + _where(where_clauses)
+
+
+def split_page(rows, limit, sort_index):
+    """
+    Trim the extra look-ahead row and return (rows, next_cursor).
+
+    next_cursor is None on the last page.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([_sort_value(last[sort_index]), last[0]])
+
+
+# Single round trip for every number and list on the dashboard
+DASHBOARD_QUERY = """
+WITH 
+tanaman_counts AS (
+    SELECT 
+        COUNT(*) as total_tanaman,
+        COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE - INTERVAL '7 days') as recent_count
+    FROM tanaman
+),
+jadwal_counts AS (
+    SELECT 
+        COUNT(*) as total_jadwal,
+        COUNT(*) FILTER (WHERE tanggal = CURRENT_DATE) as total_jadwal_hari_ini,
+        COUNT(*) FILTER (WHERE tanggal >= CURRENT_DATE) as upcoming_count
+    FROM jadwal
+),
+recent_plants AS (
+    SELECT 
+        json_agg(
+            json_build_object(
+                'id', id,
+                'nama', nama, 
+                'jenis', jenis,
+                'lokasi', lokasi,
+                'created_at', created_at::text
+            ) ORDER BY created_at DESC
+        ) as plants
+    FROM (
+        SELECT id, nama, jenis, lokasi, created_at 
+        FROM tanaman 
+        ORDER BY created_at DESC 
+        LIMIT 5
+    ) t
+),
+upcoming_schedules AS (
+    SELECT 
+        json_agg(
+            json_build_object(
+                'id', id,
+                'namaTanaman', nama_tanaman,
+                'kegiatan', kegiatan,
+                'tanggal', tanggal::text
+            ) ORDER BY tanggal ASC
+        ) as schedules
+    FROM (
+        SELECT id, nama_tanaman, kegiatan, tanggal 
+        FROM jadwal 
+        WHERE tanggal >= CURRENT_DATE 
+        ORDER BY tanggal ASC 
+        LIMIT 5
+    ) s
+),
+plant_stats AS (
+    SELECT 
+        json_agg(
+            json_build_object(
+                'jenis', jenis,
+                'jumlah', count
+            )
+        ) as stats
+    FROM (
+        SELECT jenis, COUNT(*) as count
+        FROM tanaman 
+        GROUP BY jenis
+        ORDER BY count DESC
+    ) ps
+)
+SELECT 
+    tc.total_tanaman,
+    jc.total_jadwal,
+    jc.total_jadwal_hari_ini,
+    COALESCE(rp.plants, '[]'::json) as recent_plants,
+    COALESCE(us.schedules, '[]'::json) as upcoming_schedules,
+    COALESCE(ps.stats, '[]'::json) as plant_stats
+FROM tanaman_counts tc
+CROSS JOIN jadwal_counts jc
+CROSS JOIN recent_plants rp
+CROSS JOIN upcoming_schedules us
+CROSS JOIN plant_stats ps;
+"""
+
+# Same columns from the trigger-maintained tables in dashboard_summary.sql.
+# Totals and per-jenis counts are single-row lookups; today's schedules
+# are looked up by CURRENT_DATE at read time, so midnight needs no job.
+# The two short lists are LIMIT 5 index scans.
+DASHBOARD_SUMMARY_QUERY = """
+SELECT 
+    COALESCE((SELECT row_count FROM dashboard_totals WHERE table_name = 'tanaman'), 0) as total_tanaman,
+    COALESCE((SELECT row_count FROM dashboard_totals WHERE table_name = 'jadwal'), 0) as total_jadwal,
+    COALESCE((SELECT jumlah FROM jadwal_date_counts WHERE tanggal = CURRENT_DATE), 0) as total_jadwal_hari_ini,
+    COALESCE((
+        SELECT json_agg(
+            json_build_object(
+                'id', id,
+                'nama', nama, 
+                'jenis', jenis,
+                'lokasi', lokasi,
+                'created_at', created_at::text
+            ) ORDER BY created_at DESC
+        )
+        FROM (
+            SELECT id, nama, jenis, lokasi, created_at 
+            FROM tanaman 
+            ORDER BY created_at DESC 
+            LIMIT 5
+        ) t
+    ), '[]'::json) as recent_plants,
+    COALESCE((
+        SELECT json_agg(
+            json_build_object(
+                'id', id,
+                'namaTanaman', nama_tanaman,
+                'kegiatan', kegiatan,
+                'tanggal', tanggal::text
+            ) ORDER BY tanggal ASC
+        )
+        FROM (
+            SELECT id, nama_tanaman, kegiatan, tanggal 
+            FROM jadwal 
+            WHERE tanggal >= CURRENT_DATE 
+            ORDER BY tanggal ASC 
+            LIMIT 5
+        ) s
+    ), '[]'::json) as upcoming_schedules,
+    COALESCE((
+        SELECT json_agg(
+            json_build_object(
+                'jenis', jenis,
+                'jumlah', jumlah
+            ) ORDER BY jumlah DESC
+        )
+        FROM tanaman_jenis_counts
+        WHERE jumlah > 0
+    ), '[]'::json) as plant_stats;
+"""
+
+
+# Trigger-maintained total of one table, kept in the same transaction as the write
+TABLE_TOTAL_QUERY = "SELECT row_count FROM dashboard_totals WHERE table_name = %s"
+
+
+class SummaryTables:
+    """
+    Tracks whether dashboard_summary.sql has been applied.
+
+    When the summary tables are missing the dashboard falls back to
+    DASHBOARD_QUERY, and only retries them every recheck_interval
+    seconds instead of failing a round trip on every request.
+    """
+
+    def __init__(self, recheck_interval=300):
+        self.recheck_interval = recheck_interval
+        self.missing_since = None
+
+    def available(self):
+        return (self.missing_since is None
+                or time.monotonic() - self.missing_since >= self.recheck_interval)
+
+    def mark_missing(self):
+        self.missing_since = time.monotonic()
+
+    def mark_present(self):
+        self.missing_since = None
+
+
+dashboard_summary = SummaryTables()
+
+
+def dashboard_to_dict(total_tanaman, total_jadwal, total_jadwal_hari_ini,
+                      recent_plants, upcoming_schedules, plant_stats, query_time=None):
+    """Response body for GET /dashboard"""
+    return {
+        "totalTanaman": total_tanaman,
+        "totalJadwal": total_jadwal,
+        "totalJadwalHariIni": total_jadwal_hari_ini,
+        "recentPlants": recent_plants or [],
+        "upcomingSchedules": upcoming_schedules or [],
+        "plantStats": plant_stats or [],
+        # System status (static data)
+        "systemStatus": {
+            "status": "online",
+            "version": "1.0.0",
+            "lastUpdate": None,
+            "queryTime": f"{query_time:.3f}s" if query_time is not None else "unknown",
+            "weather": {
+                "condition": "sunny",
+                "temperature": 29,
+                "humidity": 70,
+                "ideal_for_plants": True
+            }
+        }
+    }
+
+
+# Auth statements
+LOGIN_QUERY = 'SELECT username, password_hash FROM users WHERE username = %s LIMIT 1'
+USER_EXISTS_QUERY = 'SELECT username FROM users WHERE username = %s'
+USER_INSERT = 'INSERT INTO users (username, password_hash) VALUES (%s, %s)'
+
+# Single-row writes; params follow the column order, with id last
+TANAMAN_INSERT = ('INSERT INTO tanaman (nama, jenis, lokasi) VALUES (%s, %s, %s) '
+                  'RETURNING id, nama, jenis, lokasi, created_at')
+TANAMAN_UPDATE = ('UPDATE tanaman SET nama = %s, jenis = %s, lokasi = %s WHERE id = %s '
+                  'RETURNING id, nama, jenis, lokasi, created_at')
+TANAMAN_DELETE = 'DELETE FROM tanaman WHERE id = %s RETURNING id'
+JADWAL_INSERT = ('INSERT INTO jadwal (nama_tanaman, kegiatan, tanggal) VALUES (%s, %s, %s::date) '
+                 'RETURNING id, nama_tanaman, kegiatan, tanggal')
+JADWAL_UPDATE = ('UPDATE jadwal SET nama_tanaman = %s, kegiatan = %s, tanggal = %s::date WHERE id = %s '
+                 'RETURNING id, nama_tanaman, kegiatan, tanggal')
+JADWAL_DELETE = 'DELETE FROM jadwal WHERE id = %s RETURNING id'
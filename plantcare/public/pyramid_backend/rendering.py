@@ -0,0 +1,174 @@
+"""
+JSON encoding for API responses
+
+dumps() uses orjson when it is installed and falls back to the standard
+library otherwise; both produce the same compact UTF-8 bytes. The
+JSONRenderer factory replaces Pyramid's stock 'json' renderer, and
+EncodedBody is the form in which cached views keep their responses, so
+a cache hit is sent without encoding anything again.
+
+Encoded bodies carry a weak ETag hashed from their bytes. A request
+whose If-None-Match lists it gets 304 Not Modified with no body; the
+hash depends only on content, so it is the same in every worker.
+Timing fields (VOLATILE_FIELDS) are left out of the hash, so a result
+recomputed with the same data keeps its ETag.
+"""
+import re
+import json
+import hashlib
+import datetime
+import decimal
+import logging
+
+from pyramid.response import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/json'
+# request.environ key holding (value, EncodedBody) for a result encoded by the cache
+ENCODED_ENVIRON_KEY = 'plantcare.encoded'
+# Clients revalidate with If-None-Match instead of reusing a copy unasked
+CONDITIONAL_CACHE_CONTROL = 'no-cache'
+
+
+def _default(obj):
+    """Types neither encoder handles natively"""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (bytes, memoryview)):
+        return bytes(obj).decode('utf-8', 'replace')
+    return str(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        """Encode value as compact UTF-8 JSON bytes"""
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(value):
+        """Encode value as compact UTF-8 JSON bytes"""
+        return json.dumps(value, default=_default, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+
+# Fields that differ on every computation of the same data
+VOLATILE_FIELDS = ('queryTime',)
+# Their members in compact encoded JSON (string values; an escaped quote
+# inside a string can never match the unescaped key)
+_VOLATILE_MEMBERS = re.compile(
+    rb'"(?:' + b'|'.join(re.escape(f.encode()) for f in VOLATILE_FIELDS) + rb')":"(?:[^"\\]|\\.)*"')
+
+
+def etag_for(body):
+    """Weak ETag for an encoded body; weak so compressed variants share it"""
+    return f'W/"{hashlib.blake2b(_VOLATILE_MEMBERS.sub(b"", body), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def if_none_match(request):
+    headers = getattr(request, 'headers', None) or {}
+    return headers.get('If-None-Match')
+
+
+class EncodedBody:
+    """A response body already encoded, with the headers to send it with"""
+
+    __slots__ = ('body', 'content_type', 'headers')
+
+    def __init__(self, body, content_type=JSON_CONTENT_TYPE, headers=()):
+        self.body = body
+        self.content_type = content_type
+        self.headers = tuple(headers)
+
+    @classmethod
+    def encode(cls, value, headers=()):
+        return cls(dumps(value), headers=headers)
+
+    @classmethod
+    def encode_with_etag(cls, value):
+        body = dumps(value)
+        return cls(body, headers=[('ETag', etag_for(body)), ('Cache-Control', CONDITIONAL_CACHE_CONTROL)])
+
+    @property
+    def etag(self):
+        for name, value in self.headers:
+            if name == 'ETag':
+                return value
+        return None
+
+    def __sizeof__(self):
+        # Counted against the cache's byte budget
+        return object.__sizeof__(self) + len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def __getstate__(self):
+        return self.body, self.content_type, self.headers
+
+    def __setstate__(self, state):
+        self.body, self.content_type, self.headers = state
+
+    def to_response(self, request=None):
+        """A Pyramid response sharing the encoded bytes, or 304 if the client has them"""
+        if request is not None and etag_matches(if_none_match(request), self.etag):
+            response = Response(status=304)
+            response.headers.update(self.headers)
+            return response
+        response = Response(body=self.body, content_type=self.content_type, charset=None)
+        response.headers.update(self.headers)
+        return response
+
+
+def remember_encoded(request, value, entry):
+    """Let the renderer reuse entry's bytes and headers when the view returns value"""
+    environ = getattr(request, 'environ', None)
+    if environ is not None:
+        environ[ENCODED_ENVIRON_KEY] = (value, entry)
+
+
+class JSONRenderer:
+    """Renderer factory for renderer='json' using dumps()"""
+
+    def __init__(self, info):
+        self.info = info
+
+    def __call__(self, value, system):
+        request = system.get('request')
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                response.content_type = JSON_CONTENT_TYPE
+                response.charset = None
+            encoded = request.environ.get(ENCODED_ENVIRON_KEY)
+            if encoded is not None and encoded[0] is value:
+                entry = encoded[1]
+                response.headers.update(entry.headers)
+                if etag_matches(if_none_match(request), entry.etag):
+                    response.status = 304
+                    return b''
+                return entry.body
+        return dumps(value)
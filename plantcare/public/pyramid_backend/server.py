@@ -0,0 +1,339 @@
+"""
+Production WSGI serving for the PlantCare API
+
+plantcare.server.mode selects how requests are served:
+
+- threaded: one process serving requests from a bounded thread pool
+- prefork: a master process binds the socket once and forks
+  plantcare.server.workers processes, each with its own thread pool and
+  database pool. SIGHUP re-reads the ini file and replaces the workers;
+  SIGTERM/SIGINT shut down. Either way a worker stops accepting, lets
+  in-flight requests finish within plantcare.server.graceful_timeout and
+  closes keep-alive connections once they are idle.
+
+waitress is used when installed (HTTP/1.1 keep-alive); otherwise the
+standard library wsgiref server runs on a thread pool.
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+logger = logging.getLogger(__name__)
+
+SERVER_MODES = ('threaded', 'prefork')
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 6543
+DEFAULT_THREADS = 8
+DEFAULT_KEEPALIVE = 75  # seconds an idle keep-alive connection stays open
+DEFAULT_BACKLOG = 1024
+DEFAULT_GRACEFUL_TIMEOUT = 30  # seconds workers get to finish in-flight requests
+
+
+def load_settings(path, section='app:main'):
+    """Read the [app:main] settings from an ini file"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    if not parser.read(path):
+        raise FileNotFoundError(f"Settings file not found: {path}")
+    return dict(parser.items(section)) if parser.has_section(section) else {}
+
+
+def server_settings(settings):
+    """Translate plantcare.server.* settings into serving options"""
+    mode = settings.get('plantcare.server.mode', 'threaded')
+    if mode not in SERVER_MODES:
+        raise ValueError(f"plantcare.server.mode must be one of {', '.join(SERVER_MODES)}")
+    threads = int(settings.get('plantcare.server.threads', DEFAULT_THREADS))
+    return {
+        'mode': mode,
+        'host': settings.get('plantcare.server.host', DEFAULT_HOST),
+        'port': int(settings.get('plantcare.server.port', DEFAULT_PORT)),
+        'workers': int(settings.get('plantcare.server.workers') or os.cpu_count() or 1),
+        'threads': threads,
+        'keepalive': int(settings.get('plantcare.server.keepalive', DEFAULT_KEEPALIVE)),
+        'backlog': int(settings.get('plantcare.server.backlog', DEFAULT_BACKLOG)),
+        'graceful_timeout': float(settings.get('plantcare.server.graceful_timeout', DEFAULT_GRACEFUL_TIMEOUT)),
+        'worker_pool_max': int(settings.get('plantcare.server.worker_pool_max') or 0) or None,
+    }
+
+
+def worker_settings(settings, opts):
+    """
+    Settings for one worker, with the database pool sized for that worker.
+
+    An explicit plantcare.db.pool_max is kept, except that prefork workers
+    use plantcare.server.worker_pool_max when it is set. An unset pool is
+    sized to the thread count, since a worker never needs more connections
+    than it has request threads.
+    """
+    settings = dict(settings)
+    if opts['mode'] == 'prefork' and opts['worker_pool_max']:
+        pool_max = opts['worker_pool_max']
+    else:
+        pool_max = int(settings.get('plantcare.db.pool_max') or opts['threads'])
+    pool_min = min(int(settings.get('plantcare.db.pool_min', 2)), pool_max)
+    settings['plantcare.db.pool_max'] = str(pool_max)
+    settings['plantcare.db.pool_min'] = str(pool_min)
+    return settings
+
+
+def bind_socket(host, port, backlog=DEFAULT_BACKLOG):
+    """Create the listening socket, inheritable so forked workers share it"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """wsgiref server on an already bound socket that hands requests to a bounded thread pool"""
+
+    def __init__(self, sock, threads=DEFAULT_THREADS):
+        super().__init__(sock.getsockname()[:2], WSGIRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        host, port = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Let in-flight requests finish
+        self.executor.shutdown(wait=True)
+
+
+def _raise_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def drain_waitress(server, timeout):
+    """
+    Stop accepting on a waitress server and let its open connections finish.
+
+    Requests already received run to completion and their responses are
+    flushed; keep-alive connections are closed as soon as they are idle.
+    Whatever is still open after timeout seconds is dropped.
+    """
+    # Leaves the listening socket open for the other workers sharing it
+    server.del_channel()
+    deadline = time.monotonic() + timeout
+    while server.active_channels and time.monotonic() < deadline:
+        for channel in list(server.active_channels.values()):
+            if not (channel.requests or channel.request or channel.total_outbufs_len):
+                channel.will_close = True
+        server.asyncore.loop(timeout=0.1, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+    if server.active_channels:
+        logger.warning(f"Dropping {len(server.active_channels)} connection(s) still open after {timeout}s")
+    server.task_dispatcher.shutdown(timeout=max(deadline - time.monotonic(), 0))
+    server.asyncore.close_all(server._map)
+
+
+def run_server(app, sock, opts):
+    """Serve app on sock until SystemExit, then finish in-flight requests"""
+    if waitress is not None:
+        server = waitress.create_server(
+            app,
+            sockets=[sock],
+            threads=opts['threads'],
+            channel_timeout=opts['keepalive'],
+            backlog=opts['backlog'],
+        )
+        # Not server.run(): on SystemExit it gives workers only a few seconds
+        # and cuts keep-alive connections mid-response
+        try:
+            server.asyncore.loop(timeout=server.adj.asyncore_loop_timeout, map=server._map,
+                                 use_poll=server.adj.asyncore_use_poll)
+        except (SystemExit, KeyboardInterrupt):
+            drain_waitress(server, opts['graceful_timeout'])
+        return
+
+    server = ThreadPoolWSGIServer(sock, opts['threads'])
+    server.set_app(app)
+    try:
+        server.serve_forever()
+    except (SystemExit, KeyboardInterrupt):
+        pass
+    finally:
+        server.server_close()
+
+
+class Arbiter:
+    """
+    Pre-fork master process.
+
+    Owns the listening socket, forks the workers and replaces any that
+    die. The app is built inside each worker, so a SIGHUP restart picks
+    up changed settings.
+    """
+
+    def __init__(self, app_factory, settings, sock, reload_settings=None):
+        self.app_factory = app_factory
+        self.settings = settings
+        self.opts = server_settings(settings)
+        self.sock = sock
+        self.reload_settings = reload_settings
+        self.workers = set()  # pids of the current generation
+        self.retiring = set()  # pids being shut down after a restart
+        self._reload = False
+        self._stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._handle_hup)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logger.info(f"Master {os.getpid()} starting {self.opts['workers']} workers "
+                    f"x {self.opts['threads']} threads")
+        try:
+            while not self._stopping:
+                if self._reload:
+                    self._reload = False
+                    self.restart()
+                self.reap()
+                while len(self.workers) < self.opts['workers'] and not self._stopping:
+                    self.spawn_worker()
+                time.sleep(0.5)
+        finally:
+            self.stop_workers(self.workers | self.retiring)
+            self.sock.close()
+            logger.info("Master stopped")
+
+    def _handle_hup(self, signum, frame):
+        self._reload = True
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return pid
+
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, _raise_exit)
+            signal.signal(signal.SIGINT, _raise_exit)
+            app = self.app_factory(worker_settings(self.settings, self.opts))
+            logger.info(f"Worker {os.getpid()} serving")
+            run_server(app, self.sock, self.opts)
+        except SystemExit:
+            pass
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} failed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def reap(self):
+        """Collect exited workers; returns their pids"""
+        exited = set()
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            exited.add(pid)
+            if pid in self.workers and not self._stopping:
+                logger.warning(f"Worker {pid} exited unexpectedly (status {status}), replacing it")
+            self.workers.discard(pid)
+            self.retiring.discard(pid)
+        return exited
+
+    def restart(self):
+        """Graceful restart: start fresh workers, then retire the old ones"""
+        if self.reload_settings:
+            try:
+                self.settings = self.reload_settings()
+                self.opts = server_settings(self.settings)
+            except Exception as e:
+                logger.error(f"Could not reload settings, keeping the current ones: {e}")
+        logger.info("Graceful restart")
+        old = set(self.workers)
+        self.workers.clear()
+        self.retiring |= old
+        for _ in range(self.opts['workers']):
+            self.spawn_worker()
+        self.stop_workers(old)
+
+    def stop_workers(self, pids):
+        """SIGTERM workers, then SIGKILL any still running after graceful_timeout"""
+        pids = set(pids)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.time() + self.opts['graceful_timeout']
+        while pids and time.time() < deadline:
+            pids -= self.reap()
+            time.sleep(0.1)
+        for pid in pids:
+            logger.warning(f"Worker {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.workers.discard(pid)
+            self.retiring.discard(pid)
+
+
+def serve(app_factory, settings, reload_settings=None):
+    """
+    Serve the app described by settings until terminated.
+
+    app_factory(settings) builds the WSGI app; in prefork mode it is
+    called once in every worker. reload_settings() is used on SIGHUP to
+    re-read the ini file.
+    """
+    opts = server_settings(settings)
+    if opts['mode'] == 'prefork' and not hasattr(os, 'fork'):
+        logger.warning("prefork mode needs os.fork, falling back to threaded mode")
+        opts['mode'] = 'threaded'
+
+    sock = bind_socket(opts['host'], opts['port'], opts['backlog'])
+    print(f"Pyramid app running on http://localhost:{opts['port']} "
+          f"({opts['mode']}, {'waitress' if waitress else 'wsgiref'})")
+
+    if opts['mode'] == 'prefork':
+        Arbiter(app_factory, settings, sock, reload_settings).run()
+        return
+
+    signal.signal(signal.SIGTERM, _raise_exit)
+    app = app_factory(worker_settings(settings, opts))
+    try:
+        run_server(app, sock, opts)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
@@ -0,0 +1,336 @@
+"""
+Signed, expiring session tokens for the PlantCare API
+
+A token is the base64url JSON claims (user, issue and expiry time, a
+random token id) followed by their HMAC-SHA256 under
+plantcare.session.secret. Any worker holding the secret validates a
+token in constant time without a database or shared session store, so
+requests can go to any process or host.
+
+Logout revokes a token by its id until it would have expired anyway.
+Revocations live in their own store, apart from the response cache, so
+cache traffic and invalidation can never evict one early. With
+plantcare.session.revocation_store = sqlite every worker on the host
+sees them; with memory only the worker that handled the logout does,
+and the cookie is cleared either way.
+
+Browsers get the token in an HttpOnly cookie; other clients can send it
+as "Authorization: Bearer <token>". session_tween_factory verifies it on
+every request and, with plantcare.session.require_auth, rejects
+unauthenticated requests outside the public paths.
+"""
+import os
+import hmac
+import json
+import time
+import sqlite3
+import threading
+import base64
+import hashlib
+import secrets
+import logging
+from http.cookies import SimpleCookie
+
+from pyramid.httpexceptions import HTTPUnauthorized
+
+try:
+    from .caching import private_dir
+except ImportError:
+    from caching import private_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 12 * 3600  # seconds a token stays valid
+DEFAULT_COOKIE_NAME = 'plantcare_session'
+REVOCATION_FILENAME = 'plantcare_revoked.sqlite3'
+# Revocations above which a warning is logged; entries are never dropped before expiry
+DEFAULT_REVOCATION_WARN = 100000
+REVOCATION_ENTRY_BYTES = 100  # rough per-entry footprint for the stats
+REVOCATION_PRUNE_INTERVAL = 60  # seconds between removals of expired revocations
+# request.environ key holding the verified claims (or None)
+SESSION_ENVIRON_KEY = 'plantcare.session'
+# Example values that must never sign real tokens
+PLACEHOLDER_SECRETS = ('change-me', 'change-me-in-production', 'secret')
+# Reachable without a session when require_auth is on
+PUBLIC_PATHS = ('/', '/login', '/register', '/logout')
+# Passed through by the tween because their views check credentials
+# themselves (GET /metrics also takes a scrape token, see metrics.py)
+SELF_AUTHORIZED_PATHS = ('/metrics',)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _as_bool(value):
+    return str(value).lower() in ('true', '1', 'yes', 'on')
+
+
+class RevocationStore:
+    """
+    Revoked token ids of this process, each kept until its token's expiry.
+
+    Nothing is evicted before then, whatever the size; expired entries are
+    pruned at most every REVOCATION_PRUNE_INTERVAL seconds.
+    """
+
+    name = 'memory'
+
+    def __init__(self, warn_entries=DEFAULT_REVOCATION_WARN):
+        self.warn_entries = warn_entries
+        self._lock = threading.Lock()
+        self._revoked = {}  # jti -> exp
+        self._last_prune = 0.0
+        self.revocations = 0
+        self.peak = 0
+
+    def add(self, jti, exp, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._revoked[jti] = exp
+            self.revocations += 1
+            if now - self._last_prune >= REVOCATION_PRUNE_INTERVAL:
+                self._prune(now)
+            size = len(self._revoked)
+            self.peak = max(self.peak, size)
+        if size == self.warn_entries:
+            logger.warning(f"{size} revoked sessions outstanding; consider a shorter plantcare.session.max_age")
+
+    def _prune(self, now):
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._last_prune = now
+
+    def contains(self, jti, now=None):
+        exp = self._revoked.get(jti)
+        return exp is not None and exp > (time.time() if now is None else now)
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._revoked)
+            return {'backend': self.name, 'entries': entries, 'bytes': entries * REVOCATION_ENTRY_BYTES,
+                    'peak': self.peak, 'revocations': self.revocations}
+
+
+class SQLiteRevocationStore(RevocationStore):
+    """Revoked token ids shared by every worker on the host, in their own SQLite file"""
+
+    name = 'sqlite'
+
+    def __init__(self, path=None, warn_entries=DEFAULT_REVOCATION_WARN, timeout=5.0):
+        super().__init__(warn_entries)
+        # Another local user able to write this file could erase revocations
+        self.path = path or os.path.join(private_dir(), REVOCATION_FILENAME)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS revoked_sessions (jti TEXT PRIMARY KEY, exp REAL NOT NULL)')
+
+    def _conn(self):
+        # One connection per thread and per forked process, as in caching.SQLiteCache
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, jti, exp, now=None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO revoked_sessions (jti, exp) VALUES (?, ?)', (jti, exp))
+        with self._lock:
+            self.revocations += 1
+            prune = now - self._last_prune >= REVOCATION_PRUNE_INTERVAL
+            if prune:
+                self._last_prune = now
+        if prune:
+            conn.execute('DELETE FROM revoked_sessions WHERE exp <= ?', (now,))
+        size = len(self)
+        with self._lock:
+            self.peak = max(self.peak, size)
+        if size == self.warn_entries:
+            logger.warning(f"{size} revoked sessions outstanding; consider a shorter plantcare.session.max_age")
+
+    def contains(self, jti, now=None):
+        row = self._conn().execute('SELECT exp FROM revoked_sessions WHERE jti = ?', (jti,)).fetchone()
+        return row is not None and row[0] > (time.time() if now is None else now)
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM revoked_sessions').fetchone()[0]
+
+    def stats(self):
+        entries = len(self)
+        with self._lock:
+            return {'backend': self.name, 'entries': entries, 'bytes': entries * REVOCATION_ENTRY_BYTES,
+                    'peak': self.peak, 'revocations': self.revocations}
+
+
+class SessionManager:
+    """Issues, verifies and revokes signed session tokens"""
+
+    def __init__(self, secret=None, max_age=DEFAULT_MAX_AGE, revocation=True, require_auth=False,
+                 cookie_name=DEFAULT_COOKIE_NAME, cookie_secure=False, revocations=None):
+        if not secret:
+            # Tokens then only validate in this process until it restarts
+            secret = secrets.token_hex(32)
+        self.key = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.max_age = max_age
+        self.revocation = revocation
+        self.require_auth = require_auth
+        self.cookie_name = cookie_name
+        self.cookie_secure = cookie_secure
+        self.revocations = revocations if revocations is not None else RevocationStore()
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.key, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, username, now=None):
+        """A new token for username"""
+        now = int(time.time() if now is None else now)
+        claims = {'sub': username, 'iat': now, 'exp': now + self.max_age, 'jti': secrets.token_urlsafe(12)}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token, now=None):
+        """The token's claims if it is authentic, unexpired and not revoked, else None"""
+        # Header and cookie values are attacker-chosen; a signed token is always ASCII
+        if not token or not token.isascii() or token.count('.') != 1:
+            return None
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        now = time.time() if now is None else now
+        if not isinstance(claims, dict) or claims.get('exp', 0) <= now:
+            return None
+        if self.revocation and self.is_revoked(claims):
+            return None
+        return claims
+
+    def revoke(self, claims, now=None):
+        """Reject the token with these claims from now until it expires"""
+        if not self.revocation or not claims:
+            return
+        now = time.time() if now is None else now
+        if claims['exp'] > now:
+            self.revocations.add(claims['jti'], claims['exp'], now)
+
+    def is_revoked(self, claims):
+        return self.revocations.contains(claims.get('jti'))
+
+    def token_from(self, authorization=None, cookie=None):
+        """Token from an Authorization: Bearer header, else from the session cookie"""
+        if authorization and authorization[:7].lower() == 'bearer ':
+            return authorization[7:].strip()
+        if cookie:
+            jar = SimpleCookie()
+            try:
+                jar.load(cookie)
+            except Exception:
+                return None
+            morsel = jar.get(self.cookie_name)
+            if morsel is not None:
+                return morsel.value
+        return None
+
+    def cookie_header(self, token, max_age=None):
+        """Set-Cookie value carrying token (an empty token clears the cookie)"""
+        max_age = self.max_age if max_age is None else max_age
+        parts = [f"{self.cookie_name}={token}", 'Path=/', f"Max-Age={max_age}", 'HttpOnly', 'SameSite=Lax']
+        if self.cookie_secure:
+            parts.append('Secure')
+        return '; '.join(parts)
+
+    def clear_cookie_header(self):
+        return self.cookie_header('', max_age=0)
+
+
+manager = SessionManager()
+
+
+def configure_sessions(settings):
+    """Apply plantcare.session.* settings from the ini file"""
+    global manager
+    if settings.get('plantcare.session.secret') in PLACEHOLDER_SECRETS:
+        raise ValueError("plantcare.session.secret is a placeholder; set a random value "
+                         "(e.g. python -c 'import secrets; print(secrets.token_hex(32))') or leave it empty")
+    if not settings.get('plantcare.session.secret'):
+        logger.warning("plantcare.session.secret is not set; sessions only work in this process until it restarts")
+    # Defaults to the cache backend's kind, so sqlite deployments share revocations on the host
+    store = settings.get('plantcare.session.revocation_store') or settings.get('plantcare.cache.backend', 'memory')
+    warn = int(settings.get('plantcare.session.revocation_warn', DEFAULT_REVOCATION_WARN))
+    if store == 'sqlite':
+        revocations = SQLiteRevocationStore(
+            settings.get('plantcare.session.revocation_path') or None, warn_entries=warn)
+    elif store == 'memory':
+        revocations = RevocationStore(warn_entries=warn)
+    else:
+        raise ValueError(f"Unknown revocation store: {store}")
+    manager = SessionManager(
+        secret=settings.get('plantcare.session.secret'),
+        max_age=int(settings.get('plantcare.session.max_age', DEFAULT_MAX_AGE)),
+        revocation=_as_bool(settings.get('plantcare.session.revocation', 'true')),
+        require_auth=_as_bool(settings.get('plantcare.session.require_auth', 'false')),
+        cookie_name=settings.get('plantcare.session.cookie_name', DEFAULT_COOKIE_NAME),
+        cookie_secure=_as_bool(settings.get('plantcare.session.cookie_secure', 'false')),
+        revocations=revocations,
+    )
+    logger.info(f"Sessions configured: {manager.max_age}s tokens, "
+                f"revocation {'on (' + revocations.name + ')' if manager.revocation else 'off'}, "
+                f"auth {'required' if manager.require_auth else 'optional'}")
+
+
+def _request_token(request):
+    headers = request.headers
+    return manager.token_from(headers.get('Authorization'), headers.get('Cookie'))
+
+
+def session_claims(request):
+    """Verified claims for the request (set by the tween, or verified here)"""
+    environ = request.environ
+    if SESSION_ENVIRON_KEY not in environ:
+        environ[SESSION_ENVIRON_KEY] = manager.verify(_request_token(request))
+    return environ[SESSION_ENVIRON_KEY]
+
+
+def authenticated_user(request):
+    """Username of the request's session, or None"""
+    claims = session_claims(request)
+    return claims['sub'] if claims else None
+
+
+def remember(request, username):
+    """Start a session: set the cookie on request.response and return the token"""
+    token = manager.issue(username)
+    request.response.headers.add('Set-Cookie', manager.cookie_header(token))
+    request.environ[SESSION_ENVIRON_KEY] = manager.verify(token)
+    return token
+
+
+def forget(request):
+    """End the request's session: revoke its token and clear the cookie"""
+    claims = session_claims(request)
+    manager.revoke(claims)
+    request.response.headers.add('Set-Cookie', manager.clear_cookie_header())
+    request.environ[SESSION_ENVIRON_KEY] = None
+    return claims['sub'] if claims else None
+
+
+def session_tween_factory(handler, registry):
+    def session_tween(request):
+        claims = session_claims(request)
+        if (claims is None and manager.require_auth and request.method != 'OPTIONS'
+                and request.path not in PUBLIC_PATHS and request.path not in SELF_AUTHORIZED_PATHS):
+            return HTTPUnauthorized(json_body={"status": "fail", "msg": "Login required"})
+        return handler(request)
+    return session_tween
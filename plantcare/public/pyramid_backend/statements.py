@@ -0,0 +1,243 @@
+"""
+Server-side prepared statements for the hot queries
+
+The dashboard queries, the login lookup and the list page queries are
+PREPAREd once per pooled connection and run with EXECUTE, so Postgres
+parses and plans them once instead of on every request. Named
+statements are prepared when the pool opens a connection; the list
+query variants (one per combination of filters, cursor and ranking)
+are prepared the first time a connection runs them.
+
+Parsing is saved on every call; planning is saved too once Postgres
+settles on a generic plan (after five executions under the default
+plan_cache_mode). planning_times() measures the difference.
+"""
+import time
+import json
+import hashlib
+import logging
+import threading
+import weakref
+
+from psycopg2 import errors
+
+try:
+    from .queries import DASHBOARD_QUERY, DASHBOARD_SUMMARY_QUERY, LOGIN_QUERY, to_dollar_params
+except ImportError:
+    from queries import DASHBOARD_QUERY, DASHBOARD_SUMMARY_QUERY, LOGIN_QUERY, to_dollar_params
+
+logger = logging.getLogger(__name__)
+
+# Distinct statements tracked before further SQL falls back to plain execute
+DEFAULT_MAX_STATEMENTS = 100
+
+
+class Statement:
+    """A registered statement and its timing counters"""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.prepare_sql = f'PREPARE {name} AS {to_dollar_params(sql)}'
+        self.executions = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.prepares = 0
+        self.prepare_time = 0.0
+        self.reprepares = 0
+
+    def execute_sql(self, param_count):
+        if not param_count:
+            return f'EXECUTE {self.name}'
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * param_count)})"
+
+    def stats(self):
+        return {
+            "sql": self.sql.strip()[:100],
+            "executions": self.executions,
+            "avg_ms": round(self.total_time / self.executions * 1000, 3) if self.executions else 0.0,
+            "max_ms": round(self.max_time * 1000, 3),
+            "total_ms": round(self.total_time * 1000, 3),
+            # Parse/plan work paid once per connection instead of per call
+            "prepares": self.prepares,
+            "avg_prepare_ms": round(self.prepare_time / self.prepares * 1000, 3) if self.prepares else 0.0,
+            "reprepares": self.reprepares,
+        }
+
+
+class StatementRegistry:
+    """Names statements, prepares them per connection and runs them with EXECUTE"""
+
+    def __init__(self, enabled=True, max_statements=DEFAULT_MAX_STATEMENTS):
+        self.enabled = enabled
+        self.max_statements = max_statements
+        self._by_sql = {}
+        self._eager = []
+        self._prepared = weakref.WeakKeyDictionary()  # connection -> prepared names
+        self._lock = threading.Lock()
+
+    def register(self, name, sql, eager=True):
+        """Register a named statement; eager ones are prepared on new connections"""
+        with self._lock:
+            stmt = self._by_sql.get(sql)
+            if stmt is None:
+                stmt = self._by_sql[sql] = Statement(f'pc_{name}', sql)
+            if eager and stmt not in self._eager:
+                self._eager.append(stmt)
+            return stmt
+
+    def _lookup(self, sql, name):
+        with self._lock:
+            stmt = self._by_sql.get(sql)
+            if stmt is not None or len(self._by_sql) >= self.max_statements:
+                return stmt
+            # Dynamic variants get a stable name derived from their text
+            digest = hashlib.sha1(sql.encode('utf-8')).hexdigest()[:10]
+            stmt = self._by_sql[sql] = Statement(f'pc_{name or "q"}_{digest}', sql)
+            return stmt
+
+    def find(self, name):
+        """The registered statement prepared as name, or None"""
+        with self._lock:
+            for stmt in self._by_sql.values():
+                if stmt.name == name:
+                    return stmt
+        return None
+
+    def _prepared_on(self, conn):
+        with self._lock:
+            return self._prepared.setdefault(conn, set())
+
+    def _prepare(self, cur, stmt):
+        start = time.perf_counter()
+        try:
+            cur.execute(stmt.prepare_sql)
+        except errors.DuplicatePreparedStatement:
+            # Prepared earlier on this session without us tracking it
+            cur.connection.rollback()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stmt.prepares += 1
+            stmt.prepare_time += elapsed
+        self._prepared_on(cur.connection).add(stmt.name)
+
+    def prepare_all(self, conn):
+        """Pool on_connect hook: prepare every eager statement on a new connection"""
+        if not self.enabled:
+            return
+        cur = conn.cursor()
+        try:
+            # One at a time, so a statement over a missing table (e.g. the
+            # dashboard summary before dashboard_summary.sql ran) does not
+            # stop the others from being prepared
+            for stmt in list(self._eager):
+                try:
+                    self._prepare(cur, stmt)
+                    conn.commit()
+                except Exception as e:
+                    # Prepared lazily on first use instead
+                    conn.rollback()
+                    logger.warning(f"Could not prepare {stmt.name} on new connection: {e}")
+        finally:
+            cur.close()
+
+    def execute(self, cur, sql, params=(), name=None):
+        """
+        Run sql on cur through its prepared statement.
+
+        Prepares the statement on this connection first if needed, and
+        prepares it again if the server lost it (InvalidSqlStatementName,
+        e.g. after DISCARD ALL). Falls back to a plain execute when
+        disabled or when the registry is full.
+        """
+        stmt = self._lookup(sql, name) if self.enabled else None
+        if stmt is None:
+            cur.execute(sql, params or None)
+            return
+
+        params = list(params or ())
+        prepared = self._prepared_on(cur.connection)
+        if stmt.name not in prepared:
+            self._prepare(cur, stmt)
+        execute_sql = stmt.execute_sql(len(params))
+
+        start = time.perf_counter()
+        try:
+            cur.execute(execute_sql, params or None)
+        except errors.InvalidSqlStatementName:
+            cur.connection.rollback()
+            prepared.discard(stmt.name)
+            with self._lock:
+                stmt.reprepares += 1
+            self._prepare(cur, stmt)
+            start = time.perf_counter()
+            cur.execute(execute_sql, params or None)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stmt.executions += 1
+            stmt.total_time += elapsed
+            stmt.max_time = max(stmt.max_time, elapsed)
+
+    def planning_times(self, cur, sql, params=(), name=None):
+        """
+        Compare Postgres planning time for sql ad hoc and through EXECUTE.
+
+        Runs EXPLAIN ANALYZE, so only pass read-only statements.
+        """
+        def planning_ms(explain_sql, explain_params):
+            cur.execute(explain_sql, explain_params or None)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0].get('Planning Time')
+
+        stmt = self._lookup(sql, name)
+        if stmt is None:
+            raise ValueError("Statement registry is full")
+        params = list(params or ())
+        if stmt.name not in self._prepared_on(cur.connection):
+            self._prepare(cur, stmt)
+        return {
+            "statement": stmt.name,
+            "adhoc_planning_ms": planning_ms('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params),
+            "prepared_planning_ms": planning_ms(
+                'EXPLAIN (ANALYZE, FORMAT JSON) ' + stmt.execute_sql(len(params)), params),
+        }
+
+    def explain(self, cur, sql, params=(), name=None, options='FORMAT JSON'):
+        """
+        EXPLAIN sql the way execute() runs it, leaving the output on cur.
+
+        EXPLAIN EXECUTE shows the plan the next execution will use, which
+        is the generic plan once Postgres has switched to it; EXPLAIN of
+        the SQL text always plans a fresh custom plan for these params.
+        Uses the SQL text when disabled or when the registry is full.
+        """
+        stmt = self._lookup(sql, name) if self.enabled else None
+        params = list(params or ())
+        if stmt is None:
+            cur.execute(f'EXPLAIN ({options}) ' + sql, params or None)
+            return
+        if stmt.name not in self._prepared_on(cur.connection):
+            self._prepare(cur, stmt)
+        cur.execute(f'EXPLAIN ({options}) ' + stmt.execute_sql(len(params)), params or None)
+
+    def stats(self):
+        """Per-statement execution and prepare timings"""
+        with self._lock:
+            return {stmt.name: stmt.stats() for stmt in self._by_sql.values()}
+
+
+registry = StatementRegistry()
+# Prepared on every new pooled connection
+registry.register('dashboard', DASHBOARD_QUERY)
+registry.register('dashboard_summary', DASHBOARD_SUMMARY_QUERY)
+registry.register('login', LOGIN_QUERY)
+
+
+def configure_statements(settings):
+    """Apply plantcare.db.prepare_statements / max_prepared settings"""
+    registry.enabled = settings.get('plantcare.db.prepare_statements', 'true').lower() in ('true', '1', 'yes', 'on')
+    registry.max_statements = int(settings.get('plantcare.db.max_prepared', DEFAULT_MAX_STATEMENTS))
+    logger.info(f"Prepared statements {'enabled' if registry.enabled else 'disabled'}")
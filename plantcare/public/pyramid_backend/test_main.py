@@ -1,6 +1,7 @@
 import unittest
 import sys
 import os
+import time
 from pyramid import testing
 from unittest.mock import patch, MagicMock
 
@@ -41,6 +42,25 @@ class TestPlantCareViews(unittest.TestCase):
             self.assertIsInstance(response, dict)
             self.assertEqual(response['status'], 'success')
 
+    @patch('views.return_db_conn')
+    @patch('views.get_db_conn')
+    def test_login_releases_connection_before_hashing(self, mock_get_db_conn, mock_return_db_conn):
+        """The pooled connection is back in the pool while bcrypt runs"""
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.fetchone.return_value = ('budi', '$2b$12$hash')
+        mock_get_db_conn.return_value = mock_conn
+        released = []
+
+        def checkpw(password, hashed):
+            released.append(mock_return_db_conn.called)
+            return False
+
+        with patch('views.bcrypt.checkpw', side_effect=checkpw):
+            response = views.login_view(testing.DummyRequest(json_body={'username': 'budi', 'password': 'password'}))
+        self.assertEqual(released, [True])
+        self.assertEqual(response.status_code, 401)
+        mock_return_db_conn.assert_called_once_with(mock_conn)
+
     @patch('views.get_db_conn')
     def test_get_tanaman(self, mock_get_db_conn):
         """Test get tanaman with pagination"""
@@ -208,5 +228,2131 @@ class TestPlantCareViews(unittest.TestCase):
         self.assertIsInstance(response, dict)
         self.assertEqual(response['status'], 'logout')
 
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        self.cache = caching.LRUCache(max_entries=3, max_bytes=10 ** 6, sweep_interval=3600)
+
+    def test_evicts_least_recently_used(self):
+        """Oldest untouched entry is evicted once max_entries is exceeded"""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key, 60)
+        self.cache.get('a')
+        self.cache.set('d', 'd', 60)
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_byte_budget(self):
+        """Entries are evicted to stay under max_bytes"""
+        self.cache.configure(max_bytes=1500)
+        self.cache.set('big1', 'x' * 900, 60)
+        self.cache.set('big2', 'y' * 900, 60)
+
+        self.assertNotIn('big1', self.cache)
+        self.assertLessEqual(self.cache.stats()['bytes'], 1500)
+
+    def test_expiry_and_counters(self):
+        """Expired entries count as misses and are swept"""
+        self.cache.set('old', 1, -1)
+        self.cache.set('new', 2, 60)
+
+        self.assertEqual(self.cache.sweep_expired(), 1)
+        self.assertIsNone(self.cache.get('old'))
+        self.assertEqual(self.cache.get('new'), 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+class TestCachedDecorator(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        self.caching = caching
+        caching.clear_all_cache()
+        self.calls = 0
+
+        @caching.cached(key_prefix='test:', expiry=300, tags=('tanaman',))
+        def view(request):
+            self.calls += 1
+            return {"calls": self.calls}
+        self.view = view
+
+    def test_tag_invalidation(self):
+        """Bumping a tag drops dependent cached results"""
+        request = testing.DummyRequest(params={'limit': '10'})
+        self.assertEqual(self.view(request), {"calls": 1})
+        self.assertEqual(self.view(request), {"calls": 1})
+
+        self.caching.invalidate_tags('jadwal')
+        self.assertEqual(self.view(request), {"calls": 1})
+        self.caching.invalidate_tags('tanaman')
+        self.assertEqual(self.view(request), {"calls": 2})
+
+    def test_clear_cache_honours_key_prefix(self):
+        """clear_cache removes entries stored under the decorator's key_prefix"""
+        request = testing.DummyRequest()
+        self.view(request)
+        self.view.clear_cache()
+        self.view(request)
+        self.assertEqual(self.calls, 2)
+
+    @patch('views.get_db_conn')
+    def test_write_view_invalidates_reads(self, mock_get_db_conn):
+        """add_tanaman invalidates the cached get_tanaman page"""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.fetchone.return_value = (0,)
+        mock_get_db_conn.return_value.cursor.return_value = mock_cursor
+
+        request = testing.DummyRequest(params={'search': 'invalidate'})
+        views.get_tanaman(request)
+        views.get_tanaman(request)
+        self.assertEqual(mock_get_db_conn.call_count, 1)
+
+        mock_cursor.fetchone.return_value = (1, 'Plant', 'Indoor', 'Room', '2023-05-01')
+        views.add_tanaman(testing.DummyRequest(json_body={'nama': 'Plant'}))
+        views.get_tanaman(request)
+        self.assertEqual(mock_get_db_conn.call_count, 3)
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        self.caching = caching
+        caching.clear_all_cache()
+
+    def test_concurrent_misses_are_coalesced(self):
+        """Only one of several concurrent callers runs the view"""
+        import threading
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @self.caching.cached(key_prefix='flight:', expiry=60)
+        def slow_view(request):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"value": len(calls)}
+
+        results = []
+        request = testing.DummyRequest()
+        leader = threading.Thread(target=lambda: results.append(slow_view(request)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(slow_view(request))) for _ in range(4)]
+        for t in followers:
+            t.start()
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 1}] * 5)
+
+    def test_error_responses_are_not_shared(self):
+        """Waiters on a leader that got an error response build their own"""
+        import threading
+        from pyramid.httpexceptions import HTTPServiceUnavailable
+        started = threading.Event()
+        release = threading.Event()
+
+        @self.caching.cached(key_prefix='flight-error:', expiry=60)
+        def busy_view(request):
+            started.set()
+            release.wait(5)
+            return HTTPServiceUnavailable()
+
+        results = []
+        request = testing.DummyRequest()
+        coalesced = self.caching.flight_stats['coalesced']
+        threads = [threading.Thread(target=lambda: results.append(busy_view(request)))]
+        threads[0].start()
+        started.wait(5)
+        threads += [threading.Thread(target=lambda: results.append(busy_view(request))) for _ in range(3)]
+        for t in threads[1:]:
+            t.start()
+        for _ in range(200):
+            if self.caching.flight_stats['coalesced'] - coalesced == 3:
+                break
+            time.sleep(0.005)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(self.caching.flight_stats['coalesced'] - coalesced, 3)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len({id(r) for r in results}), 4)
+
+    def test_stale_value_served_while_refreshing(self):
+        """An expired value inside the stale window is returned immediately"""
+        calls = []
+
+        @self.caching.cached(key_prefix='swr:', expiry=0, stale=60)
+        def view(request):
+            calls.append(1)
+            return {"value": len(calls)}
+
+        request = testing.DummyRequest()
+        self.assertEqual(view(request), {"value": 1})
+        self.assertEqual(view(request), {"value": 1})
+        for _ in range(50):
+            if len(calls) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(calls), 2)
+
+    def test_refresh_does_not_reuse_finished_request(self):
+        """The background refresh sees the same params on a request of its own"""
+        seen = []
+
+        @self.caching.cached(key_prefix='swr-request:', expiry=0, stale=60, encode=True)
+        def view(request):
+            seen.append(request)
+            return {"q": request.params.get('q')}
+
+        request = testing.DummyRequest(params={'q': 'mons'})
+        view(request)
+        view(request)
+        for _ in range(50):
+            if len(seen) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(seen), 2)
+        self.assertIsNot(seen[1], request)
+        self.assertEqual(seen[1].params, {'q': 'mons'})
+        self.assertIsNot(seen[1].environ, request.environ)
+
+class TestSQLiteCache(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import tempfile
+        self.caching = caching
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'cache.sqlite3')
+        # Two instances on one file behave like two worker processes
+        self.worker_a = caching.SQLiteCache(path=path, max_entries=2)
+        self.worker_b = caching.SQLiteCache(path=path, max_entries=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_entries_shared_between_workers(self):
+        """A value stored by one worker is a hit for another"""
+        self.worker_a.set('k', {"rows": [1, 2]}, 60)
+        self.assertEqual(self.worker_b.get('k'), {"rows": [1, 2]})
+
+    def test_tag_bump_reaches_other_workers(self):
+        """Invalidation by one worker is seen by all of them"""
+        versions = self.worker_a.tag_versions(['tanaman'])
+        self.worker_a.set('k', 'v', 60, tags=versions)
+        self.worker_b.bump_tags(['tanaman'])
+        self.assertEqual(self.worker_a.lookup('k'), (None, self.caching.MISS))
+
+    def test_lru_eviction(self):
+        """Least recently accessed entry is evicted past max_entries"""
+        self.worker_a.set('a', 1, 60)
+        time.sleep(0.01)
+        self.worker_a.set('b', 2, 60)
+        time.sleep(0.01)
+        self.worker_a.set('c', 3, 60)
+        self.assertIsNone(self.worker_b.get('a'))
+        self.assertEqual(self.worker_b.stats()['entries'], 2)
+
+    def test_totals_are_kept_without_scanning(self):
+        """set() checks the budget from trigger-kept totals, never COUNT(*) over the table"""
+        import sqlite3
+        statements = []
+        self.worker_a._conn().set_trace_callback(statements.append)
+        self.worker_a.set('a', 'x' * 10, 60)
+        self.worker_a.set('a', 'x' * 30, 60)
+        self.worker_b.set('b', 'y', 60)
+        self.worker_a.set('c', 'z', 60)
+        self.assertFalse([sql for sql in statements if 'COUNT(' in sql])
+
+        self.worker_b.delete_prefix('c')
+        conn = sqlite3.connect(self.worker_a.path)
+        actual = conn.execute('SELECT COUNT(*), SUM(size) FROM cache_entries').fetchone()
+        self.assertEqual((self.worker_a.stats()['entries'], self.worker_a.stats()['bytes']), actual)
+        self.assertEqual(actual[0], 1)
+
+        # Files from before cache_totals are counted once on open
+        conn.execute('DROP TABLE cache_totals')
+        conn.execute('DROP TRIGGER cache_entries_insert')
+        conn.commit()
+        reopened = self.caching.SQLiteCache(path=self.worker_a.path)
+        self.assertEqual((reopened.stats()['entries'], reopened.stats()['bytes']), actual)
+
+    def test_entries_are_data_not_pickles(self):
+        """Rows hold JSON; old pickled tables are dropped unread"""
+        import pickle
+        import sqlite3
+        self.worker_a.set('k', {"rows": [1, 2]}, 60)
+        conn = sqlite3.connect(self.worker_a.path)
+        kind, value = conn.execute("SELECT kind, value FROM cache_entries WHERE key = 'k'").fetchone()
+        self.assertEqual((kind, self.caching.json.loads(value)), ('json', {"rows": [1, 2]}))
+
+        legacy = os.path.join(self.tmpdir.name, 'legacy.sqlite3')
+        conn = sqlite3.connect(legacy)
+        conn.execute('CREATE TABLE cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL,'
+                     ' stale_until REAL NOT NULL, size INTEGER NOT NULL, tags TEXT NOT NULL, last_access REAL NOT NULL)')
+        conn.execute("INSERT INTO cache_entries VALUES ('k', ?, 1e12, 1e12, 1, '{}', 0)", (pickle.dumps({"a": 1}),))
+        conn.commit()
+        with patch('pickle.loads') as loads:
+            self.assertIsNone(self.caching.SQLiteCache(path=legacy).get('k'))
+        loads.assert_not_called()
+
+    @unittest.skipIf(os.name == 'nt', "POSIX permissions")
+    def test_default_files_live_in_a_private_directory(self):
+        """The default cache and revocation files sit in a 0700 directory of this user"""
+        import stat
+        import tempfile
+        with patch('tempfile.gettempdir', return_value=self.tmpdir.name):
+            cache = self.caching.SQLiteCache()
+            import sessions
+            revocations = sessions.SQLiteRevocationStore()
+            directory = os.path.dirname(cache.path)
+            self.assertEqual(os.path.dirname(revocations.path), directory)
+            self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+            os.chmod(directory, 0o777)
+            with self.assertRaises(RuntimeError):
+                self.caching.SQLiteCache()
+
+class TestKeysetPagination(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        caching.clear_all_cache()
+
+    def test_cursor_round_trip(self):
+        """Cursors are opaque and decode back to the sort key"""
+        import queries
+        token = queries.encode_cursor(['2025-05-29T10:00:00', 42])
+        self.assertEqual(queries.decode_cursor(token), ['2025-05-29T10:00:00', 42])
+        with self.assertRaises(queries.InvalidCursor):
+            queries.decode_cursor('not-a-cursor')
+
+    def test_cursor_query_seeks_instead_of_offset(self):
+        """A cursor turns the page query into a keyset seek with OFFSET 0"""
+        import queries
+        sql, params = queries.tanaman_page_query([], [], 10, offset=500, cursor=['2025-05-29T10:00:00', 42])
+        self.assertIn('(created_at, id) < (%s::timestamp, %s)', sql)
+        self.assertEqual(params, ['2025-05-29T10:00:00', 42, 11, 0])
+
+    @patch('views.get_db_conn')
+    def test_get_tanaman_returns_next_cursor(self, mock_get_db_conn):
+        """A full page carries a cursor pointing after its last row"""
+        import queries
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [
+            (3, 'Plant3', 'Indoor', 'Room', '2023-05-03'),
+            (2, 'Plant2', 'Indoor', 'Room', '2023-05-02'),
+            (1, 'Plant1', 'Indoor', 'Room', '2023-05-01'),
+        ]
+        mock_cursor.fetchone.return_value = (3,)
+        mock_get_db_conn.return_value.cursor.return_value = mock_cursor
+
+        response = views.get_tanaman(testing.DummyRequest(params={'limit': '2'}))
+
+        self.assertEqual([t['id'] for t in response['tanaman']], [3, 2])
+        self.assertEqual(queries.decode_cursor(response['pagination']['next_cursor']), ['2023-05-02', 2])
+
+    def test_get_jadwal_rejects_bad_cursor(self):
+        """Malformed cursors are a 400, not a fallback page"""
+        response = views.get_jadwal(testing.DummyRequest(params={'cursor': '!!'}))
+        self.assertEqual(response.status_code, 400)
+
+class TestCounting(unittest.TestCase):
+
+    def setUp(self):
+        import counting
+        self.counting = counting
+        counting.row_counter.invalidate()
+        self.cur = MagicMock()
+        self.addCleanup(counting.queries.dashboard_summary.mark_present)
+
+    def test_unfiltered_count_is_maintained_incrementally(self):
+        """Without the summary tables COUNT(*) runs once and writes adjust the per-process count"""
+        self.counting.queries.dashboard_summary.mark_missing()
+        self.cur.fetchone.return_value = (10,)
+        self.assertEqual(self.counting.count_rows(self.cur, 'tanaman', [], []), (10, 'maintained'))
+        self.counting.row_counter.adjust('tanaman', 2)
+        self.assertEqual(self.counting.count_rows(self.cur, 'tanaman', [], []), (12, 'maintained'))
+        self.assertEqual(self.cur.execute.call_count, 1)
+
+    def test_unfiltered_count_reads_shared_totals(self):
+        """dashboard_totals is read on every request, so writes from other workers are seen"""
+        self.cur.fetchone.side_effect = [(10,), (13,)]
+        self.assertEqual(self.counting.count_rows(self.cur, 'jadwal', [], []), (10, 'exact'))
+        self.assertEqual(self.counting.count_rows(self.cur, 'jadwal', [], []), (13, 'exact'))
+        self.cur.execute.assert_called_with(self.counting.queries.TABLE_TOTAL_QUERY, ('jadwal',))
+
+    def test_missing_summary_tables_fall_back_to_maintained_count(self):
+        """UndefinedTable rolls back and uses the RowCounter"""
+        import psycopg2.errors
+        self.cur.execute.side_effect = [psycopg2.errors.UndefinedTable(), None]
+        self.cur.fetchone.return_value = (7,)
+        self.assertEqual(self.counting.count_rows(self.cur, 'tanaman', [], []), (7, 'maintained'))
+        self.cur.connection.rollback.assert_called_once()
+        self.assertFalse(self.counting.queries.dashboard_summary.available())
+
+    def test_large_filtered_count_uses_planner_estimate(self):
+        """Filtered queries past the threshold report the planner estimate"""
+        self.cur.fetchone.return_value = ([{"Plan": {"Plan Rows": 250000}}],)
+        total = self.counting.count_rows(self.cur, 'tanaman', ['nama ILIKE %s'], ['%a%'])
+        self.assertEqual(total, (250000, 'estimate'))
+        self.assertTrue(self.cur.execute.call_args[0][0].startswith('EXPLAIN'))
+
+    def test_small_filtered_count_is_exact(self):
+        """Below the threshold auto mode falls back to COUNT(*)"""
+        self.cur.fetchone.side_effect = [([{"Plan": {"Plan Rows": 3}}],), (2,)]
+        total = self.counting.count_rows(self.cur, 'jadwal', ['kegiatan ILIKE %s'], ['%x%'])
+        self.assertEqual(total, (2, 'exact'))
+
+    def test_count_none_skips_the_query(self):
+        """count=none never touches the database"""
+        self.assertEqual(self.counting.count_rows(self.cur, 'jadwal', [], [], 'none'), (None, 'none'))
+        self.cur.execute.assert_not_called()
+
+class TestSearch(unittest.TestCase):
+
+    def test_search_escapes_like_wildcards(self):
+        """User input cannot inject % or _ wildcards into the ILIKE pattern"""
+        import queries
+        clause, params = queries.search_clause(('nama', 'jenis'), '50%_off')
+        self.assertEqual(clause, '(nama ILIKE %s OR jenis ILIKE %s)')
+        self.assertEqual(params, ['%50\\%\\_off%'] * 2)
+
+    def test_relevance_sort_ranks_by_word_similarity(self):
+        """sort=relevance orders by trigram similarity before the default order"""
+        import queries
+        where, params = queries.tanaman_filters('mons')
+        sql, page_params = queries.tanaman_page_query(where, params, 10, offset=20, rank_term='mons')
+        self.assertIn('ORDER BY GREATEST(word_similarity(%s, nama)', sql)
+        self.assertEqual(page_params, ['%mons%'] * 3 + ['mons'] * 3 + [11, 20])
+
+    def test_unknown_sort_is_rejected(self):
+        """Invalid sort values are a 400"""
+        response = views.get_tanaman(testing.DummyRequest(params={'sort': 'random'}))
+        self.assertEqual(response.status_code, 400)
+
+class TestBulkEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @patch('bulk.execute_values')
+    @patch('views.get_db_conn')
+    def test_bulk_add_tanaman_reports_per_item_results(self, mock_get_db_conn, mock_execute_values):
+        """Valid items are inserted in one statement, invalid ones reported by index"""
+        # Returned rows carry their batch index, whatever order they come back in
+        mock_execute_values.return_value = [
+            (2, 2, 'Plant2', None, None, '2023-05-01'),
+            (0, 1, 'Plant1', 'Indoor', 'Room', '2023-05-01'),
+        ]
+        request = testing.DummyRequest(json_body={'items': [
+            {'nama': 'Plant1', 'jenis': 'Indoor', 'lokasi': 'Room'},
+            {'jenis': 'No name'},
+            {'nama': 'Plant2'},
+        ]})
+        response = views.bulk_add_tanaman(request)
+
+        self.assertEqual(response['summary'], {'created': 2, 'invalid': 1})
+        self.assertEqual([r['status'] for r in response['results']], ['created', 'invalid', 'created'])
+        self.assertEqual(mock_execute_values.call_count, 1)
+        self.assertEqual(mock_execute_values.call_args[0][2], [[0, 'Plant1', 'Indoor', 'Room'], [2, 'Plant2', None, None]])
+        self.assertEqual(response['results'][0]['item']['nama'], 'Plant1')
+        self.assertEqual(response['results'][2]['item']['id'], 2)
+        mock_get_db_conn.return_value.commit.assert_called_once()
+
+    @patch('views.get_db_conn')
+    def test_bulk_delete_jadwal(self, mock_get_db_conn):
+        """Deletes by id list and reports ids that did not exist"""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [(1,)]
+        mock_get_db_conn.return_value.cursor.return_value = mock_cursor
+
+        response = views.bulk_delete_jadwal(testing.DummyRequest(json_body={'ids': [1, 2, 'x']}))
+
+        self.assertEqual(response['summary'], {'deleted': 1, 'not_found': 1, 'invalid': 1})
+        self.assertIn('id = ANY(%s)', mock_cursor.execute.call_args[0][0])
+
+    def test_bulk_rejects_oversized_batch(self):
+        """Batches above plantcare.bulk.max_items are refused up front"""
+        self.config.registry.settings['plantcare.bulk.max_items'] = '2'
+        request = testing.DummyRequest(json_body=[{'nama': 'a'}] * 3)
+        response = views.bulk_add_tanaman(request)
+        self.assertEqual(response.status_code, 400)
+
+class TestExport(unittest.TestCase):
+
+    def _conn(self, batches):
+        conn = MagicMock()
+        conn.cursor.return_value.fetchmany.side_effect = batches + [[]]
+        return conn
+
+    @patch('views.get_db_conn')
+    def test_export_tanaman_streams_csv_from_named_cursor(self, mock_get_db_conn):
+        """Rows are streamed batch by batch through a server-side cursor"""
+        conn = self._conn([
+            [(1, 'Plant1', 'Indoor', 'Room', '2023-05-01')],
+            [(2, 'Plant2', 'Outdoor', 'Garden', '2023-05-02')],
+        ])
+        mock_get_db_conn.return_value = conn
+
+        with patch('views.return_db_conn') as mock_release:
+            response = views.export_tanaman(testing.DummyRequest(params={'format': 'csv'}))
+            chunks = list(response.app_iter)
+            mock_release.assert_called_once_with(conn)
+
+        self.assertEqual(len(chunks), 2)
+        body = b''.join(chunks).decode().splitlines()
+        self.assertEqual(body[0], 'id,nama,jenis,lokasi,created_at')
+        self.assertEqual(body[2], '2,Plant2,Outdoor,Garden,2023-05-02')
+        self.assertIn('name', conn.cursor.call_args[1])
+
+    @patch('views.get_db_conn')
+    def test_empty_csv_export_has_header(self, mock_get_db_conn):
+        """A search that matches nothing still yields the CSV header"""
+        mock_get_db_conn.return_value = self._conn([])
+        with patch('views.return_db_conn'):
+            response = views.export_jadwal(testing.DummyRequest(params={'format': 'csv', 'search': 'none'}))
+            body = b''.join(response.app_iter).decode()
+        self.assertEqual(body.splitlines(), ['id,namaTanaman,kegiatan,tanggal,waktu,status'])
+
+    def test_export_routes_answer_preflight(self):
+        """Browsers can preflight the export and import routes"""
+        import re
+        from pyramid.config import Configurator
+        from pyramid.request import Request
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')) as f:
+            routes = re.findall(r"add_route\('(\w+)', '([^']+)'\)", f.read())
+        with Configurator() as config:
+            for name, path in routes:
+                config.add_route(name, path)
+            config.scan(views)
+            app = config.make_wsgi_app()
+        for path in ('/tanaman/export', '/tanaman/import', '/jadwal/export', '/jadwal/import'):
+            response = Request.blank(path, method='OPTIONS').get_response(app)
+            self.assertEqual(response.status_code, 200, path)
+
+    def test_ndjson_stream_released_when_closed_early(self):
+        """Closing the app_iter before iteration still returns the connection"""
+        import export
+        conn = self._conn([])
+        release = MagicMock()
+        stream = export.ExportStream(conn, release, 'SELECT 1', [], dict, 'ndjson')
+        stream.close()
+        stream.close()
+        release.assert_called_once_with(conn)
+
+    def test_unknown_format_rejected(self):
+        """Unsupported export formats are a 400"""
+        response = views.export_jadwal(testing.DummyRequest(params={'format': 'xml'}))
+        self.assertEqual(response.status_code, 400)
+
+class TestImport(unittest.TestCase):
+
+    def test_csv_import_copies_valid_rows_in_chunks(self):
+        """Valid rows go through COPY in chunks, invalid ones are counted"""
+        import io
+        import importer
+        copied = []
+        conn = MagicMock()
+        conn.cursor.return_value.copy_expert.side_effect = lambda sql, buf: copied.append(buf.read())
+        data = io.BytesIO(b'nama,jenis,lokasi\nPlant1,Indoor,Room\n,Missing,Name\nPlant2,,Garden\nPlant3,Hias,\n')
+
+        report = importer.import_stream(conn, 'tanaman', data, 'csv', chunk_rows=2)
+
+        self.assertEqual((report['imported'], report['rejected']), (3, 1))
+        self.assertEqual(report['errors'], [{"line": 3, "msg": "nama is required"}])
+        self.assertEqual(copied, ['Plant1,Indoor,Room\r\nPlant2,,Garden\r\n', 'Plant3,Hias,\r\n'])
+        self.assertIn('COPY tanaman (nama, jenis, lokasi) FROM STDIN',
+                      conn.cursor.return_value.copy_expert.call_args[0][0])
+        conn.commit.assert_called_once()
+
+    def test_ndjson_import_accepts_column_names(self):
+        """NDJSON records may use API keys or column names"""
+        import io
+        import importer
+        conn = MagicMock()
+        data = io.BytesIO(b'{"nama_tanaman": "Plant1", "kegiatan": "Siram", "tanggal": "2025-01-01"}\n'
+                          b'not json\n'
+                          b'{"namaTanaman": "Plant2", "kegiatan": "Pupuk", "tanggal": "01/02/2025"}\n')
+
+        report = importer.import_stream(conn, 'jadwal', data, 'ndjson')
+
+        self.assertEqual((report['imported'], report['rejected']), (1, 2))
+        self.assertEqual([e['line'] for e in report['errors']], [2, 3])
+
+    def test_cli_import_invalidates_shared_cache(self):
+        """import_data.py bumps the table's tag in the servers' sqlite cache after committing"""
+        import tempfile
+        import caching
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        try:
+            import import_data
+        finally:
+            sys.path.pop(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, 'cache.sqlite3')
+            ini = os.path.join(tmp, 'test.ini')
+            with open(ini, 'w') as f:
+                f.write(f"[app:main]\nplantcare.cache.backend = sqlite\nplantcare.cache.path = {cache_path}\n")
+            data = os.path.join(tmp, 'plants.csv')
+            with open(data, 'w') as f:
+                f.write('nama\nPlant1\n')
+            server_cache = caching.SQLiteCache(path=cache_path)
+            before = server_cache.tag_versions(['tanaman'])
+            previous = import_data.caching.cache
+            try:
+                with patch('import_data.psycopg2.connect'), \
+                        patch('import_data.import_stream', return_value={"imported": 1, "rejected": 0}), \
+                        patch('builtins.print'):
+                    self.assertEqual(import_data.main(['tanaman', data, '--ini', ini]), 0)
+            finally:
+                import_data.caching.set_cache_backend(previous)
+            self.assertNotEqual(server_cache.tag_versions(['tanaman']), before)
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        import db_pool
+        from psycopg2 import extensions
+        self.db_pool = db_pool
+        self.extensions = extensions
+        patcher = patch('db_pool.psycopg2.connect', side_effect=self._connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _connect(self, **kwargs):
+        conn = MagicMock()
+        conn.closed = 0
+        conn.info.transaction_status = self.extensions.TRANSACTION_STATUS_IDLE
+        return conn
+
+    def test_checkout_times_out_when_exhausted(self):
+        """getconn waits up to the timeout, then raises PoolTimeout"""
+        pool = self.db_pool.ConnectionPool(minconn=0, maxconn=2, timeout=0.05, prefill=False)
+        pool.getconn()
+        pool.getconn()
+        with self.assertRaises(self.db_pool.PoolTimeout):
+            pool.getconn()
+        stats = pool.stats()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['exhausted'], 1)
+
+    def test_failed_on_connect_hook_closes_the_connection(self):
+        """A raising on_connect hook closes the new connection and frees its slot"""
+        opened = []
+
+        def connect(**kwargs):
+            opened.append(self._connect())
+            return opened[-1]
+
+        def broken_hook(conn):
+            raise RuntimeError("SET failed")
+
+        self.db_pool.psycopg2.connect.side_effect = connect
+        pool = self.db_pool.ConnectionPool(minconn=0, maxconn=1, timeout=0.05, prefill=False, on_connect=[broken_hook])
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                pool.getconn()
+        self.assertEqual(len(opened), 2)
+        for conn in opened:
+            conn.close.assert_called_once()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_waiter_receives_returned_connection(self):
+        """A blocked checkout is served as soon as a connection is returned"""
+        import threading
+        pool = self.db_pool.ConnectionPool(minconn=0, maxconn=1, timeout=5, prefill=False)
+        conn = pool.getconn()
+        received = []
+        waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+        waiter.start()
+        time.sleep(0.05)
+        pool.putconn(conn)
+        waiter.join(5)
+        self.assertEqual(received, [conn])
+        self.assertGreater(pool.stats()['wait_time_max'], 0)
+
+    def test_dead_connection_is_recycled(self):
+        """A closed idle connection is replaced on checkout"""
+        pool = self.db_pool.ConnectionPool(minconn=1, maxconn=1, timeout=0.05)
+        dead = pool.getconn()
+        pool.putconn(dead)
+        dead.closed = 1
+        conn = pool.getconn()
+        self.assertIsNot(conn, dead)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_validation_failure_is_recycled(self):
+        """Connections idle past validate_after are checked with SELECT 1"""
+        pool = self.db_pool.ConnectionPool(minconn=1, maxconn=1, validate_after=0)
+        stale = pool.getconn()
+        pool.putconn(stale)
+        stale.cursor.return_value.execute.side_effect = Exception("server closed the connection")
+        conn = pool.getconn()
+        self.assertIsNot(conn, stale)
+        self.assertEqual(pool.stats()['validation_failures'], 1)
+
+    def test_returned_transaction_is_rolled_back(self):
+        """Connections returned mid-transaction are rolled back before reuse"""
+        pool = self.db_pool.ConnectionPool(minconn=0, maxconn=1, prefill=False)
+        conn = pool.getconn()
+        conn.info.transaction_status = self.extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_pool_settings_from_ini(self):
+        """Sizing and connection parameters come from plantcare.db.* settings"""
+        kwargs = self.db_pool.pool_settings({
+            'plantcare.db.pool_min': '1',
+            'plantcare.db.pool_max': '8',
+            'plantcare.db.pool_timeout': '2.5',
+            'plantcare.db.host': 'db.internal',
+        })
+        self.assertEqual((kwargs['minconn'], kwargs['maxconn'], kwargs['timeout']), (1, 8, 2.5))
+        self.assertEqual(kwargs['host'], 'db.internal')
+        self.assertEqual(kwargs['dbname'], 'plantcare_db')
+
+    @patch('views.get_db_conn')
+    def test_list_view_returns_503_when_exhausted(self, mock_get_db_conn):
+        """Pool exhaustion surfaces as 503 instead of dummy data"""
+        import caching
+        caching.clear_all_cache()
+        mock_get_db_conn.side_effect = self.db_pool.PoolTimeout("no connection available")
+        response = views.get_tanaman(testing.DummyRequest())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        import server
+        self.server = server
+
+    def test_server_settings_defaults(self):
+        """Unset options fall back to threaded mode on port 6543"""
+        opts = self.server.server_settings({'plantcare.server.threads': '4'})
+        self.assertEqual(opts['mode'], 'threaded')
+        self.assertEqual(opts['port'], 6543)
+        self.assertIsNone(opts['worker_pool_max'])
+        self.assertGreaterEqual(opts['workers'], 1)
+        with self.assertRaises(ValueError):
+            self.server.server_settings({'plantcare.server.mode': 'async'})
+
+    def test_worker_settings_size_the_pool(self):
+        """Each prefork worker's pool is capped at worker_pool_max"""
+        opts = self.server.server_settings({'plantcare.server.mode': 'prefork', 'plantcare.server.worker_pool_max': '3'})
+        settings = self.server.worker_settings({'plantcare.db.pool_min': '5', 'plantcare.db.pool_max': '20'}, opts)
+        self.assertEqual(settings['plantcare.db.pool_max'], '3')
+        self.assertEqual(settings['plantcare.db.pool_min'], '3')
+
+    def test_worker_settings_keep_an_explicit_pool_max(self):
+        """Threaded mode keeps plantcare.db.pool_max; only an unset pool is sized to the threads"""
+        opts = self.server.server_settings({'plantcare.server.threads': '4', 'plantcare.server.worker_pool_max': '3'})
+        settings = self.server.worker_settings({'plantcare.db.pool_max': '20'}, opts)
+        self.assertEqual(settings['plantcare.db.pool_max'], '20')
+        self.assertEqual(self.server.worker_settings({}, opts)['plantcare.db.pool_max'], '4')
+
+    def test_load_settings_reads_app_section(self):
+        """Settings are read from [app:main] of development.ini"""
+        settings = self.server.load_settings(os.path.join(current_dir, 'development.ini'))
+        self.assertEqual(settings['plantcare.server.mode'], 'threaded')
+        self.assertIn('plantcare.db.pool_max', settings)
+
+    @unittest.skipIf(not getattr(__import__('server'), 'waitress', None), "waitress not installed")
+    def test_shutdown_finishes_requests_on_keep_alive_connections(self):
+        """Draining runs queued and in-flight requests to completion, then closes the idle connections"""
+        import threading
+        import http.client
+
+        def app(environ, start_response):
+            time.sleep(0.2)
+            start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+            return [b'ok']
+
+        sock = self.server.bind_socket('127.0.0.1', 0)
+        # One thread, so the second request waits in the task queue
+        httpd = self.server.waitress.create_server(app, sockets=[sock], threads=1)
+        conns = [http.client.HTTPConnection('127.0.0.1', sock.getsockname()[1], timeout=5) for _ in range(2)]
+        responses = []
+
+        def client(conn):
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            responses.append((response.status, response.read()))
+
+        threads = [threading.Thread(target=client, args=(conn,)) for conn in conns]
+        for thread in threads:
+            thread.start()
+        try:
+            deadline = time.time() + 5
+            while (sum(bool(channel.requests) for channel in httpd.active_channels.values()) < 2
+                   and time.time() < deadline):
+                httpd.asyncore.loop(timeout=0.05, map=httpd._map, count=1)
+            self.server.drain_waitress(httpd, 5)
+            for thread in threads:
+                thread.join(5)
+            self.assertEqual(responses, [(200, b'ok')] * 2)
+            self.assertEqual(httpd.active_channels, {})
+        finally:
+            for conn in conns:
+                conn.close()
+            sock.close()
+
+    def test_thread_pool_server_serves_concurrently(self):
+        """The wsgiref fallback handles slow requests in parallel"""
+        import threading
+        import urllib.request
+
+        def app(environ, start_response):
+            time.sleep(0.2)
+            start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+            return [b'ok']
+
+        sock = self.server.bind_socket('127.0.0.1', 0)
+        httpd = self.server.ThreadPoolWSGIServer(sock, threads=4)
+        httpd.set_app(app)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{sock.getsockname()[1]}/'
+        try:
+            start = time.time()
+            clients = [threading.Thread(target=lambda: urllib.request.urlopen(url).read()) for _ in range(4)]
+            for t in clients:
+                t.start()
+            for t in clients:
+                t.join(5)
+            self.assertLess(time.time() - start, 0.6)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+class TestASGIApp(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import counting
+        import asgi_app
+        self.asgi_app = asgi_app
+        caching.clear_all_cache()
+        counting.row_counter.invalidate()
+        self.conn = MagicMock()
+        self.app = asgi_app.create_app({})
+        self.app.acquire = MagicMock(return_value=self._acquire())
+
+    def _acquire(self):
+        conn = self.conn
+
+        class Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+    def _async(self, value):
+        async def result(*args):
+            return value
+        return MagicMock(side_effect=result)
+
+    def _call(self, method, path, query=b'', body=b''):
+        """Drive the ASGI app once and return (status, headers, json body)"""
+        import asyncio
+        import json
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': []}
+        asyncio.run(self.app(scope, receive, send))
+        payload = sent[1]['body']
+        return sent[0]['status'], dict(sent[0]['headers']), json.loads(payload) if payload else None
+
+    def test_placeholders_are_converted(self):
+        """psycopg2 placeholders become numbered asyncpg parameters"""
+        import queries
+        sql = queries.to_dollar_params("SELECT 1 WHERE a ILIKE %s AND (d, id) > (%s::date, %s) AND b LIKE 'x%%'")
+        self.assertEqual(sql, "SELECT 1 WHERE a ILIKE $1 AND (d, id) > ($2::text::date, $3) AND b LIKE 'x%'")
+
+    def test_list_shares_response_shape(self):
+        """GET /tanaman returns the same shape as the WSGI view"""
+        self.conn.fetch = self._async([
+            (2, 'Plant2', 'Indoor', 'Room', '2023-05-02'),
+            (1, 'Plant1', 'Indoor', 'Room', '2023-05-01'),
+        ])
+        self.conn.fetchval = self._async(2)
+        status, headers, body = self._call('GET', '/tanaman', b'limit=10&count=exact')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['tanaman'][0], {"id": 2, "nama": "Plant2", "jenis": "Indoor", "lokasi": "Room", "created_at": "2023-05-02"})
+        self.assertEqual(body['pagination']['total'], 2)
+        self.assertIsNone(body['pagination']['next_cursor'])
+        self.assertIn(b'access-control-allow-origin', headers)
+        sql = self.conn.fetch.call_args[0][0]
+        self.assertIn('LIMIT $1 OFFSET $2', sql)
+
+    def test_update_missing_row_is_404(self):
+        """PUT on an unknown id answers 404 like the WSGI view"""
+        self.conn.fetchrow = self._async(None)
+        status, _, body = self._call('PUT', '/jadwal/99', body=b'{"namaTanaman": "Monstera", "kegiatan": "Siram"}')
+        self.assertEqual(status, 404)
+        self.assertEqual(body['status'], 'fail')
+
+    def _wsgi_response(self, view, json_body, **matchdict):
+        """Run a WSGI view against a database that fails every statement; return (status, body)"""
+        conn = MagicMock()
+        conn.cursor.return_value.execute.side_effect = Exception("connection lost")
+        request = testing.DummyRequest(json_body=json_body)
+        request.matchdict = matchdict
+        with patch('views.get_db_conn', return_value=conn):
+            response = view(request)
+        if isinstance(response, dict):
+            return 200, response
+        return response.status_code, response.json_body
+
+    def _asgi_failing(self, method, path, body):
+        """Drive the ASGI app against a database that fails every statement; return (status, body)"""
+        import json
+
+        async def fails(*args):
+            raise Exception("connection lost")
+        self.conn.fetchrow = MagicMock(side_effect=fails)
+        self.conn.execute = MagicMock(side_effect=fails)
+        status, _, payload = self._call(method, path, body=json.dumps(body).encode())
+        return status, payload
+
+    def test_write_errors_match_wsgi(self):
+        """A failed write answers 200 {"status": "error"} like views.py"""
+        data = {'nama': 'Monstera', 'namaTanaman': 'Monstera', 'kegiatan': 'Siram'}
+        for method, path, view, matchdict in [
+            ('POST', '/tanaman', views.add_tanaman, {}),
+            ('PUT', '/tanaman/1', views.update_tanaman, {'id': '1'}),
+            ('DELETE', '/tanaman/1', views.delete_tanaman, {'id': '1'}),
+            ('POST', '/jadwal', views.add_jadwal, {}),
+            ('PUT', '/jadwal/1', views.update_jadwal, {'id': '1'}),
+            ('DELETE', '/jadwal/1', views.delete_jadwal, {'id': '1'}),
+        ]:
+            with self.subTest(method=method, path=path):
+                expected = self._wsgi_response(view, data, **matchdict)
+                self.assertEqual(self._asgi_failing(method, path, data), expected)
+                self.assertEqual(expected, (200, {"status": "error", "msg": "connection lost"}))
+
+    def test_register_errors_match_wsgi(self):
+        """A failed register answers 401 "Registration failed" like views.py"""
+        data = {'username': 'newuser', 'password': 'password123'}
+        expected = self._wsgi_response(views.register_view, data)
+        self.assertEqual(self._asgi_failing('POST', '/register', data), expected)
+        self.assertEqual(expected, (401, {"status": "error", "msg": "Registration failed"}))
+
+    def test_invalid_cursor_is_400(self):
+        """Malformed cursors are rejected before any query runs"""
+        status, _, body = self._call('GET', '/jadwal', b'cursor=not-a-cursor')
+        self.assertEqual(status, 400)
+        self.assertEqual(body['status'], 'fail')
+
+    def test_pool_timeout_is_503(self):
+        """An exhausted asyncpg pool surfaces as 503 with Retry-After"""
+        import asyncio
+
+        class Exhausted:
+            async def __aenter__(self):
+                raise asyncio.TimeoutError()
+
+            async def __aexit__(self, *exc):
+                return False
+
+        self.app.acquire = MagicMock(return_value=Exhausted())
+        status, headers, _ = self._call('GET', '/dashboard')
+        self.assertEqual(status, 503)
+        self.assertEqual(headers[b'retry-after'], b'1')
+
+    def test_cached_reads_use_configured_backend(self):
+        """Cached handlers follow the backend chosen by configure_cache"""
+        import caching
+        previous = caching.cache
+        caching.set_cache_backend(caching.LRUCache())
+        try:
+            self.conn.fetch = self._async([(1, 'Plant1', 'Indoor', 'Room', '2023-05-01')])
+            self.conn.fetchval = self._async(1)
+            self._call('GET', '/tanaman', b'limit=5')
+            self.assertEqual(caching.cache.stats()['entries'], 1)
+        finally:
+            caching.set_cache_backend(previous)
+
+    def test_cancelled_leader_releases_waiters(self):
+        """A waiter whose leading request is cancelled runs the query itself"""
+        import asyncio
+        calls = []
+
+        async def handler(request, db):
+            calls.append(request)
+            if len(calls) == 1:
+                await asyncio.sleep(10)
+            return {"n": len(calls)}
+
+        cached = self.asgi_app.async_cached(expiry=60)(handler)
+        request = self.asgi_app.Request({'method': 'GET', 'path': '/x', 'query_string': b'a=1'})
+
+        async def scenario():
+            leader = asyncio.ensure_future(cached(request, None))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(cached(request, None))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await asyncio.wait_for(waiter, 1)
+
+        result = asyncio.run(scenario())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(result, {"n": 2})
+
+    def test_error_results_are_not_shared(self):
+        """Waiters on a leader whose result is not cacheable query for themselves"""
+        import asyncio
+        calls = []
+
+        async def handler(request, db):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return self.asgi_app.fail(503, "busy")
+
+        cached = self.asgi_app.async_cached(expiry=60)(handler)
+        request = self.asgi_app.Request({'method': 'GET', 'path': '/x', 'query_string': b''})
+
+        async def scenario():
+            return await asyncio.gather(*(cached(request, None) for _ in range(3)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len({id(r) for r in results}), 3)
+
+    def test_waiters_are_bounded(self):
+        """Waiters stop waiting on a stuck leader after wait_timeout"""
+        import asyncio
+        release = []
+
+        async def handler(request, db):
+            if not release:
+                release.append(True)
+                await asyncio.sleep(10)
+            return {"ok": True}
+
+        cached = self.asgi_app.async_cached(expiry=60, wait_timeout=0.05)(handler)
+        request = self.asgi_app.Request({'method': 'GET', 'path': '/x', 'query_string': b''})
+
+        async def scenario():
+            leader = asyncio.ensure_future(cached(request, None))
+            await asyncio.sleep(0)
+            try:
+                return await asyncio.wait_for(cached(request, None), 1)
+            finally:
+                leader.cancel()
+
+        self.assertEqual(asyncio.run(scenario()), {"ok": True})
+
+    def test_sqlite_cache_runs_off_the_event_loop(self):
+        """File-backed cache calls go through the executor, not the loop thread"""
+        import asyncio
+        import tempfile
+        import threading
+        import caching
+        previous = caching.cache
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = caching.SQLiteCache(path=os.path.join(tmp, 'cache.sqlite3'))
+            threads = []
+            lookup = backend.lookup
+
+            def spy(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return lookup(*args, **kwargs)
+
+            backend.lookup = spy
+            caching.set_cache_backend(backend)
+            try:
+                self.conn.fetch = self._async([(1, 'Plant1', 'Indoor', 'Room', '2023-05-01')])
+                self.conn.fetchval = self._async(1)
+                status, _, _ = self._call('GET', '/tanaman', b'limit=5')
+            finally:
+                caching.set_cache_backend(previous)
+        self.assertEqual(status, 200)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+class TestPreparedStatements(unittest.TestCase):
+
+    def setUp(self):
+        import statements
+        self.statements = statements
+        self.registry = statements.StatementRegistry()
+        self.conn = MagicMock()
+        self.cur = self.conn.cursor.return_value
+        self.cur.connection = self.conn
+
+    def executed(self):
+        return [c[0][0] for c in self.cur.execute.call_args_list]
+
+    def test_prepared_once_per_connection(self):
+        """The first call PREPAREs, later calls only EXECUTE"""
+        sql = 'SELECT id FROM tanaman WHERE nama ILIKE %s LIMIT %s'
+        self.registry.execute(self.cur, sql, ['%a%', 10], name='tanaman_page')
+        self.registry.execute(self.cur, sql, ['%b%', 10], name='tanaman_page')
+        executed = self.executed()
+        self.assertEqual(len(executed), 3)
+        self.assertRegex(executed[0], r'^PREPARE pc_tanaman_page_\w+ AS SELECT id FROM tanaman WHERE nama ILIKE \$1 LIMIT \$2$')
+        self.assertRegex(executed[1], r'^EXECUTE pc_tanaman_page_\w+ \(%s, %s\)$')
+        self.assertEqual(self.cur.execute.call_args[0][1], ['%b%', 10])
+        stats = list(self.registry.stats().values())[0]
+        self.assertEqual((stats['executions'], stats['prepares']), (2, 1))
+
+    def test_eager_statements_prepared_on_connect(self):
+        """prepare_all is the pool hook that prepares named statements"""
+        self.registry.register('login', 'SELECT username FROM users WHERE username = %s')
+        self.registry.prepare_all(self.conn)
+        self.assertEqual(self.executed(), ['PREPARE pc_login AS SELECT username FROM users WHERE username = $1'])
+        self.conn.commit.assert_called_once()
+        self.registry.execute(self.cur, 'SELECT username FROM users WHERE username = %s', ['admin'])
+        self.assertEqual(self.executed()[-1], 'EXECUTE pc_login (%s)')
+
+    def test_lost_statement_is_prepared_again(self):
+        """InvalidSqlStatementName triggers a re-PREPARE and a retry"""
+        from psycopg2 import errors
+        self.registry.register('login', 'SELECT 1 WHERE %s')
+        self.registry.prepare_all(self.conn)
+        self.cur.execute.side_effect = [errors.InvalidSqlStatementName('gone'), None, None]
+        self.registry.execute(self.cur, 'SELECT 1 WHERE %s', [True])
+        self.assertEqual(self.executed()[-2:], ['PREPARE pc_login AS SELECT 1 WHERE $1', 'EXECUTE pc_login (%s)'])
+        self.assertEqual(self.registry.stats()['pc_login']['reprepares'], 1)
+
+    def test_disabled_or_full_registry_runs_plain_sql(self):
+        """Beyond max_statements (or when disabled) SQL runs unprepared"""
+        self.registry.max_statements = 0
+        self.registry.execute(self.cur, 'SELECT %s', [1])
+        self.registry.enabled = False
+        self.registry.execute(self.cur, 'SELECT %s', [2])
+        self.assertEqual(self.executed(), ['SELECT %s', 'SELECT %s'])
+
+    def test_hot_statements_registered(self):
+        """The dashboard and login statements are prepared on new connections"""
+        import queries
+        names = {stmt.sql: stmt.name for stmt in self.statements.registry._eager}
+        self.assertEqual(names[queries.DASHBOARD_QUERY], 'pc_dashboard')
+        self.assertEqual(names[queries.LOGIN_QUERY], 'pc_login')
+
+class TestDashboardSummary(unittest.TestCase):
+
+    def setUp(self):
+        import queries
+        self.queries = queries
+        self.summary = queries.dashboard_summary
+        self.summary.mark_present()
+        self.cur = MagicMock()
+
+    def tearDown(self):
+        self.summary.mark_present()
+
+    def test_reads_summary_tables(self):
+        """The dashboard reads the trigger-maintained aggregates, not COUNT(*)"""
+        self.cur.fetchone.return_value = (10, 5, 2, [], [], [])
+        with patch('views.statements.registry.execute') as execute:
+            row = views.fetch_dashboard_row(self.cur)
+        self.assertEqual(row, (10, 5, 2, [], [], []))
+        self.assertIs(execute.call_args[0][1], self.queries.DASHBOARD_SUMMARY_QUERY)
+        self.assertNotIn('COUNT(', self.queries.DASHBOARD_SUMMARY_QUERY)
+        # Today's count is looked up at read time, so it rolls over at midnight
+        self.assertIn('WHERE tanggal = CURRENT_DATE', self.queries.DASHBOARD_SUMMARY_QUERY)
+
+    def test_missing_tables_fall_back_to_full_query(self):
+        """Without dashboard_summary.sql the CTE is used and the tables are not retried every call"""
+        from psycopg2 import errors
+        with patch('views.statements.registry.execute') as execute:
+            execute.side_effect = [errors.UndefinedTable('no dashboard_totals'), None, None]
+            views.fetch_dashboard_row(self.cur)
+            views.fetch_dashboard_row(self.cur)
+        self.cur.connection.rollback.assert_called_once()
+        used = [c[0][1] for c in execute.call_args_list]
+        self.assertEqual(used, [self.queries.DASHBOARD_SUMMARY_QUERY,
+                                self.queries.DASHBOARD_QUERY, self.queries.DASHBOARD_QUERY])
+
+        # Retried once the recheck interval has passed
+        self.summary.missing_since -= self.summary.recheck_interval
+        self.assertTrue(self.summary.available())
+
+    def test_prepare_failure_does_not_block_other_statements(self):
+        """A statement over a missing table is skipped by prepare_all, the rest are prepared"""
+        import statements
+        from psycopg2 import errors
+        registry = statements.StatementRegistry()
+        registry.register('dashboard_summary', 'SELECT row_count FROM dashboard_totals')
+        registry.register('login', 'SELECT username FROM users WHERE username = %s')
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        cur.connection = conn
+        cur.execute.side_effect = [errors.UndefinedTable('no dashboard_totals'), None]
+        registry.prepare_all(conn)
+        self.assertEqual(registry._prepared_on(conn), {'pc_login'})
+        conn.rollback.assert_called_once()
+
+    def test_cache_key_rolls_over_at_midnight(self):
+        """Results keyed with today_key are recomputed on a new day, even within the expiry"""
+        import caching
+        import datetime
+        calls = []
+
+        @caching.cached(expiry=300, stale=60, vary=caching.today_key)
+        def today_count(request):
+            calls.append(1)
+            return {"today": len(calls)}
+
+        request = testing.DummyRequest()
+        with patch('caching.datetime') as fake:
+            fake.date.today.return_value = datetime.date(2024, 1, 1)
+            self.assertEqual(today_count(request), {"today": 1})
+            self.assertEqual(today_count(request), {"today": 1})
+            fake.date.today.return_value = datetime.date(2024, 1, 2)
+            self.assertEqual(today_count(request), {"today": 2})
+        today_count.clear_cache()
+
+    def test_trigger_branches_read_only_declared_transition_tables(self):
+        """INSERT branches never mention old_rows, DELETE branches never mention new_rows"""
+        import re
+        path = os.path.join(current_dir, '..', '..', 'dashboard_summary.sql')
+        with open(path, encoding='utf-8') as f:
+            sql = f.read()
+        declared = {'INSERT': {'new_rows'}, 'DELETE': {'old_rows'}, 'UPDATE': {'new_rows', 'old_rows'}}
+        for table in ('tanaman', 'jadwal'):
+            for op, names in declared.items():
+                trigger = re.search(rf'CREATE TRIGGER {table}_summary_{op.lower()} AFTER {op} ON {table}\s+'
+                                    rf'(REFERENCING [^\n]*)', sql).group(1)
+                self.assertEqual(set(re.findall(r'\w+_rows', trigger)), names)
+
+            body = re.search(rf'FUNCTION {table}_summary_apply\(\).*?\$\$(.*?)\$\$', sql, re.S).group(1)
+            branches = re.split(r"(?:ELS)?IF TG_OP = '(\w+)' THEN", body)
+            # Text outside the INSERT/DELETE/UPDATE branches must not touch transition tables
+            self.assertNotRegex(branches[0], r'\b(new|old)_rows\b')
+            seen = set()
+            for op, text in zip(branches[1::2], branches[2::2]):
+                if op == 'TRUNCATE':
+                    text = text.split('END IF;')[0]
+                    self.assertNotRegex(text, r'\b(new|old)_rows\b')
+                    continue
+                text, _, after = text.partition('END IF;')
+                self.assertNotRegex(after, r'\b(new|old)_rows\b')
+                self.assertEqual(set(re.findall(r'\b(?:new|old)_rows\b', text)), declared[op], f"{table} {op}")
+                seen.add(op)
+            self.assertEqual(seen, set(declared))
+
+class TestEncodedResponses(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import rendering
+        self.caching = caching
+        self.rendering = rendering
+        caching.clear_all_cache()
+        self.calls = 0
+
+        @caching.cached(key_prefix='encoded:', expiry=300, tags=('tanaman',), encode=True)
+        def view(request):
+            self.calls += 1
+            return {"calls": self.calls, "nama": "Monstera"}
+        self.view = view
+
+    def test_dumps_handles_database_types(self):
+        """Dates and numerics from psycopg2 encode the same with or without orjson"""
+        import datetime
+        import decimal
+        import json
+        value = {"tanggal": datetime.date(2023, 5, 1), "jumlah": decimal.Decimal('2.5'), 1: "x"}
+        self.assertEqual(json.loads(self.rendering.dumps(value)), {"tanggal": "2023-05-01", "jumlah": 2.5, "1": "x"})
+        self.assertEqual(self.rendering._default(datetime.date(2023, 5, 1)), "2023-05-01")
+
+    def test_hit_returns_stored_bytes_without_encoding(self):
+        """A cache hit is a Response over the bytes encoded on the miss"""
+        from pyramid.response import Response
+        request = testing.DummyRequest()
+        first = self.view(request)
+        self.assertEqual(first, {"calls": 1, "nama": "Monstera"})
+
+        with patch('rendering.dumps') as dumps:
+            second = self.view(testing.DummyRequest())
+        dumps.assert_not_called()
+        self.assertIsInstance(second, Response)
+        self.assertEqual(second.content_type, 'application/json')
+        self.assertEqual(second.body, self.rendering.dumps(first))
+        self.assertEqual(self.calls, 1)
+
+    def test_renderer_reuses_bytes_encoded_on_miss(self):
+        """On a miss the renderer sends the bytes the cache just stored"""
+        request = testing.DummyRequest()
+        result = self.view(request)
+        renderer = self.rendering.JSONRenderer(None)
+        with patch('rendering.dumps') as dumps:
+            body = renderer(result, {'request': request})
+        dumps.assert_not_called()
+        self.assertEqual(body, self.rendering.dumps(result))
+        self.assertEqual(request.response.content_type, 'application/json')
+        # Any other value is encoded normally
+        self.assertEqual(renderer({"status": "ok"}, {'request': request}), b'{"status":"ok"}')
+
+    def test_encoded_entries_survive_the_sqlite_backend(self):
+        """The shared cache stores encoded responses as their bytes and headers"""
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+        backend = self.caching.SQLiteCache(path=path)
+        entry = self.rendering.EncodedBody(b'{"a":1}', headers=[('X-Test', '1')])
+        backend.set('k', entry, 60)
+        value, state = backend.lookup('k')
+        self.assertEqual(state, self.caching.FRESH)
+        self.assertEqual((value.body, value.headers), (b'{"a":1}', (('X-Test', '1'),)))
+
+    def test_asgi_hit_sends_stored_bytes(self):
+        """The ASGI app caches encoded bodies in the same backend"""
+        import asyncio
+        import asgi_app
+        import counting
+        counting.row_counter.invalidate()
+        app = asgi_app.create_app({})
+        conn = MagicMock()
+
+        async def fetch(*args):
+            return [(1, 'Plant1', 'Indoor', 'Room', '2023-05-01')]
+
+        async def fetchval(*args):
+            return 1
+
+        conn.fetch = MagicMock(side_effect=fetch)
+        conn.fetchval = fetchval
+
+        class Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        app.acquire = lambda: Acquire()
+        bodies = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                bodies.append(message['body'])
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/tanaman', 'query_string': b'limit=5', 'headers': []}
+        asyncio.run(app(scope, receive, send))
+        with patch('asgi_app.dumps') as dumps:
+            asyncio.run(app(scope, receive, send))
+        dumps.assert_not_called()
+        self.assertEqual(conn.fetch.call_count, 1)
+        self.assertEqual(bodies[0], bodies[1])
+
+class TestConditionalGet(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import rendering
+        self.caching = caching
+        self.rendering = rendering
+        caching.clear_all_cache()
+        self.calls = 0
+
+        @caching.cached(key_prefix='etag:', expiry=300, tags=('jadwal',), encode=True)
+        def view(request):
+            self.calls += 1
+            return {"jadwal": [{"id": 1, "kegiatan": "Siram"}]}
+        self.view = view
+
+    def first_etag(self):
+        request = testing.DummyRequest()
+        result = self.view(request)
+        self.rendering.JSONRenderer(None)(result, {'request': request})
+        return request.response.headers['ETag']
+
+    def test_etag_comparison(self):
+        """If-None-Match uses weak comparison and accepts lists and *"""
+        matches = self.rendering.etag_matches
+        self.assertTrue(matches('W/"abc"', 'W/"abc"'))
+        self.assertTrue(matches('"abc"', 'W/"abc"'))
+        self.assertTrue(matches('"x", W/"abc"', 'W/"abc"'))
+        self.assertTrue(matches('*', 'W/"abc"'))
+        self.assertFalse(matches('W/"abd"', 'W/"abc"'))
+        self.assertFalse(matches(None, 'W/"abc"'))
+
+    def test_unchanged_poll_is_304_without_calling_the_view(self):
+        """A cached entry whose ETag the client holds answers 304 with no body"""
+        etag = self.first_etag()
+        self.assertTrue(etag.startswith('W/"'))
+        response = self.view(testing.DummyRequest(headers={'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.calls, 1)
+
+    def test_changed_data_gets_a_new_etag(self):
+        """After a write the client's ETag no longer matches and the full body is sent"""
+        etag = self.first_etag()
+        self.caching.invalidate_tags('jadwal')
+        self.view = self.caching.cached(key_prefix='etag:', expiry=300, tags=('jadwal',), encode=True)(
+            lambda request: {"jadwal": []})
+        request = testing.DummyRequest(headers={'If-None-Match': etag})
+        result = self.view(request)
+        body = self.rendering.JSONRenderer(None)(result, {'request': request})
+        self.assertEqual(body, b'{"jadwal":[]}')
+        self.assertNotEqual(request.response.headers['ETag'], etag)
+
+    def test_recomputed_but_identical_content_is_304(self):
+        """ETags hash the content, so a recompute after invalidation can still answer 304"""
+        etag = self.first_etag()
+        self.caching.invalidate_tags('jadwal')
+        request = testing.DummyRequest(headers={'If-None-Match': etag})
+        result = self.view(request)
+        body = self.rendering.JSONRenderer(None)(result, {'request': request})
+        self.assertEqual((request.response.status_code, body), (304, b''))
+        self.assertEqual(self.calls, 2)
+
+    @patch('views.get_db_conn')
+    def test_recomputed_jadwal_page_keeps_its_etag(self, mock_get_db_conn):
+        """queryTime differs on every recompute but is not part of the ETag"""
+        import itertools
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [(1, 'Monstera', 'Siram', '2025-01-01')]
+        mock_cursor.fetchone.return_value = (1,)
+        mock_get_db_conn.return_value.cursor.return_value = mock_cursor
+        # Growing steps, so each computation measures a different queryTime
+        clock = itertools.accumulate(itertools.count(0.1, 0.05))
+
+        def render(headers=None):
+            request = testing.DummyRequest(params={'limit': '10', 'count': 'exact'}, headers=headers or {})
+            with patch('views.time.time', side_effect=lambda: next(clock)):
+                result = views.get_jadwal(request)
+            return request, self.rendering.JSONRenderer(None)(result, {'request': request})
+
+        request, first = render()
+        etag = request.response.headers['ETag']
+        self.caching.invalidate_tags('jadwal')
+        request, body = render({'If-None-Match': etag})
+        self.assertEqual((request.response.status_code, body), (304, b''))
+        self.assertEqual(mock_cursor.fetchall.call_count, 2)
+
+        # The timing really changed; only the data is hashed
+        self.caching.invalidate_tags('jadwal')
+        request, again = render()
+        self.assertNotEqual(first, again)
+        self.assertEqual(request.response.headers['ETag'], etag)
+
+    def test_cors_exposes_etag(self):
+        """Browsers may only read ETag and send If-None-Match cross-origin if CORS allows it"""
+        from pyramid.response import Response
+        tween = views.cors_tween_factory(lambda request: Response(), None)
+        headers = tween(testing.DummyRequest()).headers
+        self.assertIn('ETag', headers['Access-Control-Expose-Headers'])
+        self.assertIn('If-None-Match', headers['Access-Control-Allow-Headers'])
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import compression
+        self.caching = caching
+        self.compression = compression
+        caching.clear_all_cache()
+        self.body = b'{"jadwal":[' + b','.join(b'{"id":%d,"kegiatan":"Siram"}' % i for i in range(200)) + b']}'
+
+    def tween(self, response, **settings):
+        registry = MagicMock()
+        registry.settings = settings
+        return self.compression.compression_tween_factory(lambda request: response, registry)
+
+    def json_response(self, body, **headers):
+        from pyramid.response import Response
+        response = Response(body=body, content_type='application/json', charset=None)
+        response.headers.update(headers)
+        return response
+
+    def test_negotiation(self):
+        """Accept-Encoding q-values pick the coding; q=0 refuses it"""
+        negotiate = self.compression.negotiate
+        self.assertEqual(negotiate('gzip, deflate', ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('gzip;q=0.5, br', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate('br;q=0, *', ('br', 'gzip')), 'gzip')
+        self.assertIsNone(negotiate('identity', ('br', 'gzip')))
+        self.assertIsNone(negotiate(None))
+
+    def test_large_json_is_gzipped(self):
+        """Bodies above min_size are compressed for clients that accept gzip"""
+        import gzip
+        tween = self.tween(self.json_response(self.body))
+        response = tween(testing.DummyRequest(headers={'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.body), self.body)
+        self.assertLess(len(response.body), len(self.body))
+
+    def test_small_and_streamed_bodies_are_left_alone(self):
+        """Below min_size, without Accept-Encoding or when streamed, the body is untouched"""
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        small = self.tween(self.json_response(b'{"status":"ok"}'))(request)
+        self.assertNotIn('Content-Encoding', small.headers)
+        plain = self.tween(self.json_response(self.body))(testing.DummyRequest())
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        from pyramid.response import Response
+        streamed = Response(app_iter=iter([self.body]), content_type='application/x-ndjson')
+        self.assertNotIn('Content-Encoding', self.tween(streamed)(request).headers)
+
+    def test_variants_of_cached_responses_are_reused(self):
+        """A response with an ETag is compressed once per coding"""
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        with patch('compression.compress', wraps=self.compression.compress) as compress:
+            for _ in range(3):
+                self.tween(self.json_response(self.body, ETag='W/"abc"'))(request)
+            self.tween(self.json_response(self.body))(request)
+        self.assertEqual(compress.call_count, 2)
+
+    def test_disabled(self):
+        """plantcare.compress.enabled = false removes the tween"""
+        response = self.json_response(self.body)
+        tween = self.tween(response, **{'plantcare.compress.enabled': 'false'})
+        self.assertIs(tween(testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})), response)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+class TestSessions(unittest.TestCase):
+
+    def setUp(self):
+        import caching
+        import sessions
+        self.sessions = sessions
+        self.config = testing.setUp()
+        caching.clear_all_cache()
+        sessions.configure_sessions({'plantcare.session.secret': 'test-secret', 'plantcare.session.max_age': '60'})
+        self.manager = sessions.manager
+
+    def tearDown(self):
+        testing.tearDown()
+        self.sessions.configure_sessions({'plantcare.session.secret': 'test-secret'})
+
+    def test_token_round_trip(self):
+        """A token verifies to its claims with no stored state"""
+        token = self.manager.issue('admin', now=1000)
+        claims = self.manager.verify(token, now=1010)
+        self.assertEqual((claims['sub'], claims['exp']), ('admin', 1060))
+
+    def test_tampered_expired_or_foreign_tokens_are_rejected(self):
+        """Signature, expiry and secret are all checked"""
+        token = self.manager.issue('admin', now=1000)
+        payload, signature = token.split('.')
+        forged = self.sessions._b64encode(b'{"sub":"root","iat":1000,"exp":9999999999,"jti":"x"}')
+        self.assertIsNone(self.manager.verify(f"{forged}.{signature}", now=1010))
+        self.assertIsNone(self.manager.verify(token, now=1060))
+        other = self.sessions.SessionManager(secret='other-secret')
+        self.assertIsNone(other.verify(token, now=1010))
+        self.assertIsNone(self.manager.verify('not-a-token'))
+
+    def test_placeholder_secret_is_refused(self):
+        """The example secret is public, so it would let anyone forge a session"""
+        with self.assertRaises(ValueError):
+            self.sessions.configure_sessions({'plantcare.session.secret': 'change-me-in-production'})
+        self.sessions.configure_sessions({'plantcare.session.secret': ''})
+        self.assertIsNotNone(self.sessions.manager.verify(self.sessions.manager.issue('admin')))
+
+    def test_non_ascii_token_is_rejected_not_an_error(self):
+        """A crafted header with non-ASCII characters is just an invalid session"""
+        token = self.manager.issue('admin')
+        payload, signature = token.split('.')
+        for crafted in ('é.abc', f'{payload}é.{signature}', f'{payload}.{signature}é'):
+            self.assertIsNone(self.manager.verify(crafted))
+        request = testing.DummyRequest(headers={'Authorization': 'Bearer é.abc'})
+        self.assertIsNone(self.sessions.session_claims(request))
+
+    def test_revoked_token_is_rejected(self):
+        """Logout revokes the token id until the token would have expired"""
+        token = self.manager.issue('admin')
+        claims = self.manager.verify(token)
+        self.manager.revoke(claims)
+        self.assertIsNone(self.manager.verify(token))
+        self.assertIsNotNone(self.manager.verify(self.manager.issue('admin')))
+
+    def test_revocation_survives_cache_churn(self):
+        """Filling, evicting and clearing the response cache never revives a revoked token"""
+        import caching
+        token = self.manager.issue('admin')
+        self.manager.revoke(self.manager.verify(token))
+        small = caching.LRUCache(max_entries=8)
+        with patch('caching.cache', small):
+            for i in range(100):
+                caching.cache.set(f"view:{i}", {"rows": list(range(50))}, 300)
+            caching.clear_all_cache()
+            caching.invalidate_tags('tanaman', 'jadwal')
+        caching.clear_all_cache()
+        self.assertIsNone(self.manager.verify(token))
+        self.assertEqual(self.manager.revocations.stats()['entries'], 1)
+
+    def test_revocations_expire_with_their_tokens(self):
+        """Entries are dropped only once the token itself has expired"""
+        store = self.sessions.RevocationStore()
+        store.add('a', exp=1100, now=1000)
+        store.add('b', exp=2000, now=1000)
+        self.assertTrue(store.contains('a', now=1099))
+        self.assertFalse(store.contains('a', now=1100))
+        store.add('c', exp=3000, now=1000 + self.sessions.REVOCATION_PRUNE_INTERVAL + 200)
+        self.assertEqual(len(store), 2)
+        self.assertTrue(store.contains('b', now=1500))
+
+    def test_sqlite_revocations_shared_between_stores(self):
+        """Every worker opening the same file sees a logout"""
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'revoked.sqlite3')
+            one = self.sessions.SQLiteRevocationStore(path)
+            two = self.sessions.SQLiteRevocationStore(path)
+            one.add('jti-1', exp=time.time() + 60)
+            self.assertTrue(two.contains('jti-1'))
+            self.assertFalse(two.contains('jti-2'))
+            self.assertEqual(two.stats()['entries'], 1)
+
+    def test_login_required_carries_cors_headers(self):
+        """The session tween sits under CORS, so cross-origin clients can read the 401"""
+        import re
+        from pyramid.response import Response
+        self.manager.require_auth = True
+        chain = views.cors_tween_factory(self.sessions.session_tween_factory(lambda r: Response(), None), None)
+        response = chain(testing.DummyRequest(path='/tanaman'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json_body['msg'], 'Login required')
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'http://localhost:3000')
+
+        # Tweens added earlier sit closer to the views
+        for path in ('app.py', os.path.join('..', '..', 'run_pyramid.py')):
+            with open(os.path.join(current_dir, path), encoding='utf-8') as f:
+                tweens = re.findall(r"add_tween\((?:__name__ \+ )?'([\w.]+)'\)", f.read())
+            names = [name.rsplit('.', 1)[-1] for name in tweens]
+            self.assertLess(names.index('session_tween_factory'), names.index('cors_tween_factory'), path)
+
+    def test_token_from_bearer_or_cookie(self):
+        """Authorization: Bearer wins over the session cookie"""
+        self.assertEqual(self.manager.token_from('Bearer abc.def', 'plantcare_session=ghi.jkl'), 'abc.def')
+        self.assertEqual(self.manager.token_from(None, 'theme=dark; plantcare_session=ghi.jkl'), 'ghi.jkl')
+        self.assertIsNone(self.manager.token_from(None, 'theme=dark'))
+
+    def test_login_sets_cookie_and_logout_revokes_it(self):
+        """login_view issues an HttpOnly cookie; logout_view revokes the token it carries"""
+        request = testing.DummyRequest(json_body={'username': 'admin', 'password': 'sainsdata'})
+        self.assertEqual(views.login_view(request), {"status": "success", "user": "admin"})
+        cookie = request.response.headers['Set-Cookie']
+        self.assertIn('HttpOnly', cookie)
+        token = cookie.split(';')[0].split('=', 1)[1]
+        self.assertEqual(self.manager.verify(token)['sub'], 'admin')
+
+        logout = testing.DummyRequest(json_body={'username': 'someone-else'},
+                                      headers={'Cookie': f'plantcare_session={token}'})
+        self.assertEqual(views.logout_view(logout), {"status": "logout"})
+        self.assertIn('Max-Age=0', logout.response.headers['Set-Cookie'])
+        self.assertIsNone(self.manager.verify(token))
+
+    def test_tween_requires_auth_when_configured(self):
+        """require_auth rejects requests without a valid token outside the public paths"""
+        self.sessions.configure_sessions({'plantcare.session.secret': 'test-secret',
+                                          'plantcare.session.require_auth': 'true'})
+        tween = self.sessions.session_tween_factory(lambda request: 'ok', None)
+        anonymous = testing.DummyRequest(path='/tanaman')
+        self.assertEqual(tween(anonymous).status_code, 401)
+        self.assertEqual(tween(testing.DummyRequest(path='/login')), 'ok')
+        token = self.sessions.manager.issue('admin')
+        request = testing.DummyRequest(path='/tanaman', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(tween(request), 'ok')
+        self.assertEqual(self.sessions.authenticated_user(request), 'admin')
+
+class TestPasswordHashing(unittest.TestCase):
+
+    def setUp(self):
+        import threading
+        import hashing
+        self.hashing = hashing
+        self.release = threading.Event()
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        self.release.set()
+        testing.tearDown()
+
+    def blocked(self):
+        self.release.wait(5)
+        return True
+
+    def test_runs_on_pool_and_reports_metrics(self):
+        """Calls run on the bcrypt threads and are timed"""
+        import threading
+        hasher = self.hashing.PasswordHasher(workers=2, max_queue=1)
+        name = hasher.run(lambda: threading.current_thread().name)
+        self.assertTrue(name.startswith('bcrypt'))
+        stats = hasher.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['running'], stats['queued']), (1, 1, 0, 0))
+
+    def test_saturated_pool_rejects(self):
+        """Beyond workers + max_queue pending calls, submit sheds load"""
+        hasher = self.hashing.PasswordHasher(workers=1, max_queue=1)
+        hasher.submit(self.blocked)
+        hasher.submit(self.blocked)
+        with self.assertRaises(self.hashing.HasherBusy):
+            hasher.submit(self.blocked)
+        self.assertEqual(hasher.stats()['rejected'], 1)
+
+    def test_timeout_frees_queued_slot(self):
+        """A queued call that times out is cancelled and stops counting as pending"""
+        hasher = self.hashing.PasswordHasher(workers=1, max_queue=1, timeout=0.05)
+        hasher.submit(self.blocked)
+        with self.assertRaises(self.hashing.HasherBusy):
+            hasher.run(self.blocked)
+        stats = hasher.stats()
+        self.assertEqual((stats['timeouts'], stats['queued']), (1, 0))
+
+    @patch('views.get_db_conn')
+    def test_login_sheds_load_with_503(self, mock_get_db_conn):
+        """login_view answers 503 + Retry-After when the hashing pool is saturated"""
+        mock_get_db_conn.return_value.cursor.return_value.fetchone.return_value = ('user', '$2b$12$hash')
+        busy = self.hashing.PasswordHasher(workers=1, max_queue=0)
+        busy.submit(self.blocked)
+        with patch('hashing.hasher', busy):
+            request = testing.DummyRequest(json_body={'username': 'user', 'password': 'secret'})
+            response = views.login_view(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    @patch('views.get_db_conn')
+    def test_login_burst_leaves_serving_threads_free(self, mock_get_db_conn):
+        """threads + N concurrent logins get 503s while another request is still served"""
+        from concurrent.futures import ThreadPoolExecutor, wait
+        mock_get_db_conn.return_value.cursor.return_value.fetchone.return_value = ('user', '$2b$12$hash')
+        threads, extra = 4, 3
+        self.hashing.configure_hashing({'plantcare.server.threads': str(threads), 'plantcare.auth.hash_workers': '1',
+                                        'plantcare.auth.hash_queue': '16', 'plantcare.auth.hash_timeout': '5'})
+        self.assertEqual(self.hashing.hasher.max_pending, threads - self.hashing.RESERVED_THREADS)
+
+        def login(i):
+            request = testing.DummyRequest(json_body={'username': f'burst{i}', 'password': 'secret'})
+            return views.login_view(request)
+
+        serving = ThreadPoolExecutor(max_workers=threads)
+        try:
+            with patch('views.bcrypt.checkpw', side_effect=lambda *a: self.blocked()):
+                logins = [serving.submit(login, i) for i in range(threads + extra)]
+                other = serving.submit(views.home_view, testing.DummyRequest())
+                self.assertEqual(other.result(timeout=2), {"message": "Welcome to PlantCare Pyramid API!"})
+                done, waiting = wait(logins, timeout=2)
+                self.assertEqual([f.result().status_code for f in done], [503] * (threads + extra - self.hashing.hasher.max_pending))
+                self.assertEqual(len(waiting), self.hashing.hasher.max_pending)
+                self.release.set()
+                self.assertEqual([f.result(timeout=2)['status'] for f in waiting], ['success'] * len(waiting))
+        finally:
+            self.release.set()
+            serving.shutdown(wait=True)
+            self.hashing.configure_hashing({})
+
+class TestCredentialCache(unittest.TestCase):
+
+    def setUp(self):
+        import credentials
+        self.credentials = credentials
+        self.cache = credentials.CredentialCache(secret='test-secret', ttl=60, max_entries=2)
+
+    def test_invalidated_users_do_not_accumulate(self):
+        """Per-user tag versions are dropped once no cached login refers to them"""
+        import caching
+        # Entries outlive the retention, so alice's stays referenced
+        self.cache = self.credentials.CredentialCache(secret='test-secret', ttl=caching.TAG_RETENTION * 2)
+        self.cache.store('alice', 'hunter22')
+        start = time.time()
+        for i in range(500):
+            self.cache.invalidate_user(f'user{i}')
+        self.cache.invalidate_user('alice')
+        self.cache.store('alice', 'new-password')
+        backend = self.cache.backend
+        self.assertEqual(len(backend._tag_versions), 501)
+        with patch('caching.time.time', return_value=start + caching.TAG_RETENTION + 1):
+            backend.sweep_expired()
+        # alice's current entry still depends on her bumped version
+        self.assertEqual(list(backend._tag_versions), ['auth-user:alice'])
+        self.assertFalse(self.cache.check('alice', 'hunter22'))
+
+    def test_sqlite_tag_versions_are_pruned(self):
+        """The shared backend forgets unreferenced tags the same way"""
+        import caching
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = caching.SQLiteCache(path=os.path.join(tmp, 'cache.sqlite3'))
+            backend.bump_tags(['auth-user:bob', 'auth-user:carol'])
+            backend.set('k', 'carol', caching.TAG_RETENTION * 2, tags=backend.tag_versions(['auth-user:carol']))
+            with patch('caching.time.time', return_value=time.time() + caching.TAG_RETENTION + 1):
+                backend.sweep_expired()
+            tags = [row[0] for row in backend._conn().execute('SELECT tag FROM cache_tags')]
+            self.assertEqual(tags, ['auth-user:carol'])
+
+    def test_verified_login_is_remembered(self):
+        """Only the exact username/password pair that was stored hits"""
+        self.cache.store('alice', 'hunter22')
+        self.assertTrue(self.cache.check('alice', 'hunter22'))
+        self.assertFalse(self.cache.check('alice', 'wrong'))
+        self.assertFalse(self.cache.check('bob', 'hunter22'))
+
+    def test_keys_are_stable_and_keyed(self):
+        """Keys match across instances sharing the secret and reveal nothing without it"""
+        other = self.credentials.CredentialCache(secret='test-secret')
+        self.assertEqual(self.cache._key('alice', 'pw'), other._key('alice', 'pw'))
+        foreign = self.credentials.CredentialCache(secret='another-secret')
+        self.assertNotEqual(self.cache._key('alice', 'pw'), foreign._key('alice', 'pw'))
+        self.assertNotIn('pw', self.cache._key('alice', 'pw'))
+
+    def test_size_cap_and_ttl(self):
+        """Entries beyond max_entries are evicted and expired ones swept"""
+        for name in ('a', 'b', 'c'):
+            self.cache.store(name, 'password')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertFalse(self.cache.check('a', 'password'))
+
+        with patch('caching.time.time', return_value=time.time() + 61):
+            self.assertFalse(self.cache.check('c', 'password'))
+            self.cache._local.sweep_expired()
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_invalidate_user(self):
+        """A password change or re-registration drops every cached login of that user"""
+        self.cache.store('alice', 'old-password')
+        self.cache.store('bob', 'password')
+        self.cache.invalidate_user('alice')
+        self.assertFalse(self.cache.check('alice', 'old-password'))
+        self.assertTrue(self.cache.check('bob', 'password'))
+
+    @patch('views.get_db_conn')
+    def test_repeat_login_skips_bcrypt(self, mock_get_db_conn):
+        """The second login with the same password neither queries nor runs bcrypt"""
+        testing.setUp()
+        self.addCleanup(testing.tearDown)
+        mock_get_db_conn.return_value.cursor.return_value.fetchone.return_value = ('carol', '$2b$12$hash')
+        with patch('credentials.credential_cache', self.cache), \
+                patch('views.bcrypt.checkpw', return_value=True) as checkpw:
+            for _ in range(2):
+                request = testing.DummyRequest(json_body={'username': 'carol', 'password': 'secret1'})
+                self.assertEqual(views.login_view(request)['status'], 'success')
+        self.assertEqual(checkpw.call_count, 1)
+        self.assertEqual(mock_get_db_conn.call_count, 1)
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        import metrics
+        self.metrics = metrics
+        metrics.request_metrics.reset()
+
+    def test_histogram_buckets_and_quantiles(self):
+        """Observations land in cumulative buckets; quantiles interpolate within them"""
+        histogram = self.metrics.Histogram(buckets=(0.1, 0.2, 0.4))
+        for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(0.1, 1), (0.2, 3), (0.4, 4), (float('inf'), 5)])
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.175)
+        self.assertEqual(histogram.quantile(0.99), 0.4)
+        self.assertIsNone(self.metrics.Histogram().quantile(0.5))
+
+    def test_tween_records_route_method_and_status(self):
+        """The tween times each request under its matched route"""
+        from pyramid.response import Response
+        request = testing.DummyRequest()
+        request.matched_route = MagicMock()
+        request.matched_route.name = 'tanaman'
+        tween = self.metrics.metrics_tween_factory(lambda r: Response(status=201), None)
+        tween(request)
+
+        failing = self.metrics.metrics_tween_factory(MagicMock(side_effect=RuntimeError), None)
+        with self.assertRaises(RuntimeError):
+            failing(testing.DummyRequest(method='POST'))
+
+        latency, responses, in_flight = self.metrics.request_metrics.snapshot()
+        self.assertEqual(latency[('tanaman', 'GET')][2], 1)
+        self.assertEqual(responses, {('tanaman', 'GET', 201): 1, ('unmatched', 'POST', 500): 1})
+        self.assertEqual(in_flight, 0)
+
+    def test_unknown_methods_share_one_label(self):
+        """Arbitrary request methods are recorded as OTHER, not as new series"""
+        from pyramid.response import Response
+        tween = self.metrics.metrics_tween_factory(lambda r: Response(status=404), None)
+        for method in ('FOO', 'PROPFIND', 'get'):
+            tween(testing.DummyRequest(method=method))
+        _, responses, _ = self.metrics.request_metrics.snapshot()
+        self.assertEqual(responses, {('unmatched', 'OTHER', 404): 3})
+
+    def test_prometheus_text(self):
+        """render() emits histogram series, quantiles and component gauges"""
+        self.metrics.request_metrics.started()
+        self.metrics.request_metrics.finished('dashboard_summary', 'GET', 200, 0.03)
+        text = self.metrics.render({'db_pool': {'in_use': 2, 'wait_time_avg': 0.5}},
+                                   {'pc_login': {'executions': 3, 'total_ms': 12.0}})
+        self.assertIn('plantcare_http_request_duration_seconds_bucket'
+                      '{route="dashboard_summary",method="GET",le="0.05"} 1', text)
+        self.assertIn('plantcare_http_request_duration_seconds_count{route="dashboard_summary",method="GET"} 1', text)
+        self.assertIn('quantile="0.99"', text)
+        self.assertIn('plantcare_http_responses_total{route="dashboard_summary",method="GET",status="200"} 1', text)
+        self.assertIn('plantcare_db_pool_in_use 2', text)
+        self.assertIn('plantcare_statement_executions_total{statement="pc_login"} 3', text)
+
+    def tearDown(self):
+        self.metrics.access = self.metrics.ScrapeAccess()
+
+    def test_metrics_view(self):
+        """GET /metrics includes cache, pool and hashing stats"""
+        self.metrics.configure_metrics({'plantcare.metrics.token': 's3cret'})
+        request = testing.DummyRequest(headers={'Authorization': 'Bearer s3cret'})
+        with patch('views.pg_pool') as pool:
+            pool.stats.return_value = {'size': 4, 'in_use': 1}
+            response = views.metrics_view(request)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('plantcare_db_pool_size 4', response.text)
+        self.assertIn('plantcare_cache_hits', response.text)
+        self.assertIn('plantcare_hasher_rejected', response.text)
+
+    def test_metrics_need_token_or_session(self):
+        """Anonymous scrapes are refused unless plantcare.metrics.public is set"""
+        self.metrics.configure_metrics({'plantcare.metrics.token': 's3cret'})
+        for headers in ({}, {'Authorization': 'Bearer wrong'}):
+            response = views.metrics_view(testing.DummyRequest(headers=headers))
+            self.assertEqual(response.status_code, 401)
+        token = views.sessions.manager.issue('admin')
+        with patch('views.pg_pool', None):
+            response = views.metrics_view(testing.DummyRequest(headers={'Authorization': f'Bearer {token}'}))
+            self.assertEqual(response.status_code, 200)
+            self.metrics.configure_metrics({'plantcare.metrics.public': 'true'})
+            self.assertEqual(views.metrics_view(testing.DummyRequest()).status_code, 200)
+
+class TestQueryTracing(unittest.TestCase):
+
+    def setUp(self):
+        import tracing
+        self.tracing = tracing
+        self.log = tracing.QueryLog(slow_ms=100)
+
+    def cursor(self, rowcount=1):
+        cur = MagicMock()
+        cur.rowcount = rowcount
+        return cur
+
+    def test_normalize_sql(self):
+        """Literals and placeholders become ?, IN lists collapse, whitespace folds"""
+        sql = "SELECT *  FROM tanaman\n WHERE nama = 'Mawar' AND id IN (1, 2, 3) LIMIT %s"
+        self.assertEqual(self.tracing.normalize_sql(sql),
+                         "SELECT * FROM tanaman WHERE nama = ? AND id IN (...) LIMIT ?")
+        self.assertEqual(self.tracing.describe_params(['secret', 5]), 'str, int')
+
+    def test_request_totals_and_server_timing(self):
+        """Statements are counted against the running request"""
+        request_queries = self.tracing.RequestQueries()
+        token = self.tracing._current.set(request_queries)
+        try:
+            self.log.record(self.cursor(), 'SELECT 1', None, 0.002)
+            self.log.record(self.cursor(), 'SELECT 2', None, 0.003)
+        finally:
+            self.tracing._current.reset(token)
+        self.assertEqual(request_queries.count, 2)
+        self.assertEqual(request_queries.server_timing(0.01), 'db;dur=5.0;desc="2 queries", app;dur=10.0')
+        self.assertEqual(self.log.stats()['queries'], 2)
+
+    def test_slow_query_logged_without_values(self):
+        """Slow statements are logged normalized, with parameter types only"""
+        with self.assertLogs('tracing', level='WARNING') as logs:
+            self.log.record(self.cursor(3), 'SELECT * FROM users WHERE password = %s', ['hunter2'], 0.25)
+        self.assertIn('WHERE password = ? [params: str]', logs.output[0])
+        self.assertNotIn('hunter2', logs.output[0])
+        self.assertEqual(self.log.stats()['slow_queries'], 1)
+        self.assertEqual(self.log.slowest()[0]['count'], 1)
+        self.assertEqual(self.log.recent_slow()[0]['row_count'], 3)
+
+    def test_prepared_statement_resolved(self):
+        """EXECUTE of a registered statement is reported as its SQL"""
+        stmt = self.tracing.statements.registry.find('pc_login')
+        sql, params = self.tracing.resolve('EXECUTE pc_login (%s)', ['admin'])
+        self.assertEqual(sql, stmt.sql)
+        self.assertEqual(params, ['admin'])
+
+    def test_explain_only_read_only_and_rate_limited(self):
+        """EXPLAIN ANALYZE runs for slow SELECTs, once per interval, in a rolled back transaction"""
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [('Seq Scan on tanaman',)]
+        checkin = MagicMock()
+        log = self.tracing.QueryLog(slow_ms=100, explain=True, connections=(lambda: conn, checkin))
+        with self.assertLogs('tracing', level='WARNING'):
+            log.record(self.cursor(), 'SELECT * FROM tanaman', None, 0.5)
+            log.record(self.cursor(), 'SELECT * FROM tanaman', None, 0.5)
+            log.record(self.cursor(), 'UPDATE tanaman SET nama = %s', ['x'], 0.5)
+            log._executor.shutdown(wait=True)
+        executed = [c.args[0] for c in conn.cursor.return_value.execute.call_args_list]
+        self.assertEqual(executed.count('EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM tanaman'), 1)
+        self.assertFalse(any('UPDATE' in sql for sql in executed))
+        conn.rollback.assert_called()
+        checkin.assert_called_once_with(conn)
+        self.assertIn('Seq Scan', log.slowest()[0]['plan'])
+
+    def test_tween_sets_server_timing(self):
+        """The tween adds Server-Timing with the request's query count"""
+        from pyramid.response import Response
+
+        def handler(request):
+            self.tracing.query_log.record(self.cursor(), 'SELECT 1', None, 0.001)
+            return Response()
+
+        tween = self.tracing.query_timing_tween_factory(handler, None)
+        response = tween(testing.DummyRequest())
+        self.assertTrue(response.headers['Server-Timing'].startswith('db;dur='))
+        self.assertIn('desc="1 queries"', response.headers['Server-Timing'])
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def setUp(self):
+        import performance_monitor
+        self.pm = performance_monitor
+
+    def test_parse_scale(self):
+        self.assertEqual(self.pm.parse_scale('10k'), 10_000)
+        self.assertEqual(self.pm.parse_scale('10M'), 10_000_000)
+        self.assertEqual(self.pm.parse_scale('2500'), 2500)
+        with self.assertRaises(ValueError):
+            self.pm.parse_scale('lots')
+
+    def test_summarize_percentiles(self):
+        """Latency percentiles are interpolated and reported in milliseconds"""
+        timings = [i / 1000.0 for i in range(1, 101)]  # 1..100 ms
+        result = self.pm.summarize(timings, rows=50)
+        self.assertEqual(result['min_ms'], 1.0)
+        self.assertEqual(result['median_ms'], 50.5)
+        self.assertEqual(result['p95_ms'], 95.05)
+        self.assertEqual(result['p99_ms'], 99.01)
+        self.assertEqual(result['iterations'], 100)
+        self.assertAlmostEqual(result['rows_per_sec'], 50 * 100 / sum(timings), places=0)
+
+    def test_run_case_warms_up_then_times(self):
+        """Warmup runs are excluded from the timings"""
+        suite = self.pm.BenchmarkSuite({}, iterations=10, warmup=3)
+        suite.connection = MagicMock()
+        registry = MagicMock()
+        cur = MagicMock()
+        cur.fetchall.return_value = [(1,), (2,)]
+        result = suite.run_case(registry, cur, 'login', 'SELECT 1', [])
+        self.assertEqual(registry.execute.call_count, 13)
+        self.assertEqual(result['iterations'], 10)
+        self.assertEqual(result['rows_per_iteration'], 2)
+
+    def test_generate_reuses_matching_dataset(self):
+        """A dataset with the same size and seed is not generated again"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        spec = {"tanaman": 1000, "jadwal": 2000, "users": self.pm.BENCH_USERS, "seed": 0.42, "summary": True}
+        cur.fetchone.side_effect = [[True], [self.pm.json.dumps(spec)]]
+        self.assertEqual(self.pm.generate_dataset(conn, 1000), spec)
+        self.assertFalse(any('INSERT' in c.args[0] for c in cur.execute.call_args_list))
+
+    def test_foreign_schema_comment_regenerates(self):
+        """A schema comment that is not a dataset spec means generate, not crash"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        cur.fetchone.side_effect = [[False], ['benchmark data, do not touch']]
+        cur.fetchall.return_value = []
+        spec = self.pm.generate_dataset(conn, 1000)
+        self.assertFalse(spec['summary'])
+        executed = [c.args[0] for c in cur.execute.call_args_list]
+        self.assertTrue(any(sql.startswith('INSERT INTO plantcare_bench.tanaman') for sql in executed))
+        self.assertFalse(any(sql.startswith(('CREATE TABLE plantcare_bench.dashboard_totals',
+                                             'INSERT INTO plantcare_bench.dashboard_totals'))
+                             for sql in executed))
+
+    def test_compare_flags_regressions(self):
+        """Only slowdowns beyond the threshold and the noise floor count as regressions"""
+        def doc(**medians):
+            return {"results": {name: {"median_ms": ms, "p95_ms": ms} for name, ms in medians.items()}}
+        comparison = self.pm.compare_results(doc(dashboard=10.0, login=0.2, jadwal_page=5.0),
+                                             doc(dashboard=15.0, login=0.4, jadwal_page=5.1))
+        flagged = {entry['case']: entry['regression'] for entry in comparison}
+        self.assertEqual(flagged, {'dashboard': True, 'login': False, 'jadwal_page': False})
+        self.assertEqual(comparison[0]['median_ms']['change'], 0.5)
+
+class TestPlanRegression(unittest.TestCase):
+
+    INDEX_PLAN = {"Node Type": "Limit", "Plans": [
+        {"Node Type": "Index Scan", "Relation Name": "tanaman", "Index Name": "idx_tanaman_created_at_id",
+         "Total Cost": 4.2}]}
+    SEQ_PLAN = {"Node Type": "Limit", "Plans": [
+        {"Node Type": "Sort", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "tanaman"}]}]}
+
+    def setUp(self):
+        import performance_monitor
+        self.pm = performance_monitor
+
+    def explain(self, root):
+        cur = MagicMock()
+        cur.fetchone.return_value = [self.pm.json.dumps([{"Plan": root}])]
+        return self.pm.explain_plan(cur, 'SELECT 1', [])
+
+    def test_plan_shape_ignores_costs(self):
+        plan = self.explain(self.INDEX_PLAN)
+        self.assertEqual(plan['shape'], ['Limit', '  Index Scan on tanaman using idx_tanaman_created_at_id'])
+        self.assertEqual(plan['access'], {'tanaman': ['Index Scan']})
+
+    def test_index_to_seq_scan_is_a_regression(self):
+        """Losing index access is flagged even when latency did not move"""
+        def doc(root):
+            return {"results": {"tanaman_page": {"median_ms": 1.0, "p95_ms": 1.0, "plan": self.explain(root)}}}
+        entry = self.pm.compare_results(doc(self.INDEX_PLAN), doc(self.SEQ_PLAN))[0]
+        self.assertTrue(entry['regression'])
+        self.assertTrue(entry['plan']['changed'])
+        self.assertEqual(entry['plan']['downgrades'], ['tanaman: Index Scan -> Seq Scan'])
+
+        improved = self.pm.compare_results(doc(self.SEQ_PLAN), doc(self.INDEX_PLAN))[0]
+        self.assertTrue(improved['plan']['changed'])
+        self.assertFalse(improved['regression'])
+
+    def test_unchanged_plan(self):
+        plan = self.explain(self.INDEX_PLAN)
+        self.assertEqual(self.pm.diff_plans(plan, plan),
+                         {"changed": False, "downgrades": [], "diff": [], "added": [], "removed": []})
+
+    def test_new_and_dropped_relations_are_reported(self):
+        """Tables a plan starts or stops reading count as plan changes"""
+        join = {"Node Type": "Nested Loop", "Join Type": "Inner", "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "tanaman"},
+            {"Node Type": "Seq Scan", "Relation Name": "jadwal"}]}
+        diff = self.pm.diff_plans(self.explain(self.INDEX_PLAN), self.explain(join))
+        self.assertTrue(diff['changed'])
+        self.assertEqual((diff['added'], diff['removed']), (['jadwal'], []))
+        diff = self.pm.diff_plans(self.explain(join), self.explain(self.INDEX_PLAN))
+        self.assertEqual((diff['added'], diff['removed']), ([], ['jadwal']))
+
+    def test_prepared_runs_explain_the_executed_statement(self):
+        """With prepare on, the recorded plan comes from EXPLAIN EXECUTE"""
+        registry = self.pm.StatementRegistry()
+        cur = MagicMock()
+        cur.fetchone.return_value = [self.pm.json.dumps([{"Plan": self.INDEX_PLAN}])]
+        self.pm.explain_plan(cur, 'SELECT * FROM tanaman WHERE id = %s', [1], registry, 'tanaman_page')
+        executed = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertTrue(executed[0].startswith('PREPARE pc_tanaman_page_'))
+        self.assertRegex(executed[-1], r'^EXPLAIN \(FORMAT JSON\) EXECUTE pc_tanaman_page_\w+ \(%s\)$')
+
+        unprepared = MagicMock()
+        unprepared.fetchone.return_value = cur.fetchone.return_value
+        self.pm.explain_plan(unprepared, 'SELECT 1', [], self.pm.StatementRegistry(enabled=False))
+        unprepared.execute.assert_called_once_with('EXPLAIN (FORMAT JSON) SELECT 1', None)
+
 if __name__ == '__main__':
     unittest.main()
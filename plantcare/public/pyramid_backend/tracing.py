@@ -0,0 +1,299 @@
+"""
+Per-request SQL instrumentation
+
+Pooled connections hand out TimingCursor cursors, which time every
+statement and add it to the current request's totals.
+query_timing_tween_factory reports those totals in a Server-Timing
+header (db;dur=<ms>;desc="<n> queries") and warns when a single request
+issues more than plantcare.sql.max_queries statements.
+
+Statements slower than plantcare.sql.slow_ms are logged with literals
+and parameters normalized away (parameter values never reach the log,
+only their types). With plantcare.sql.explain, read-only slow
+statements are also run through EXPLAIN (ANALYZE, BUFFERS) on a
+background thread, at most once per plantcare.sql.explain_interval
+seconds per normalized statement and always in a rolled back
+transaction.
+"""
+import re
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import extensions
+
+try:
+    from . import statements
+except ImportError:
+    import statements
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_MS = 200.0
+DEFAULT_MAX_QUERIES = 20  # per request before an N+1 warning
+DEFAULT_EXPLAIN_INTERVAL = 600  # seconds between EXPLAINs of the same statement
+DEFAULT_EXPLAIN_TIMEOUT_MS = 5000
+DEFAULT_MAX_TRACKED = 200  # distinct normalized statements kept in the totals
+MAX_PENDING_EXPLAINS = 4
+RECENT_SLOW = 50
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXECUTE = re.compile(r"^EXECUTE\s+(\w+)", re.IGNORECASE)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|FOR\s+UPDATE|FOR\s+SHARE)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Statement text with whitespace collapsed and literals and placeholders replaced by ?"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _STRING_LITERAL.sub('?', str(sql))
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def describe_params(params):
+    """Parameter types only, so values (passwords, search terms) stay out of the logs"""
+    if not params:
+        return ''
+    values = params.values() if isinstance(params, dict) else params
+    return ', '.join(type(value).__name__ for value in values)
+
+
+def resolve(sql, params):
+    """Map EXECUTE of a registered prepared statement back to its SQL text"""
+    text = sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else str(sql)
+    match = _EXECUTE.match(text.lstrip())
+    if match:
+        stmt = statements.registry.find(match.group(1))
+        if stmt is not None:
+            return stmt.sql, params
+    return text, params
+
+
+def is_read_only(sql):
+    """True for a plain SELECT/WITH query that EXPLAIN ANALYZE may safely run"""
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    return head in ('SELECT', 'WITH') and not _WRITES.search(sql)
+
+
+class RequestQueries:
+    """Statement count and DB time for one request"""
+
+    __slots__ = ('count', 'time', 'slow')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.slow = 0
+
+    def server_timing(self, total=None):
+        entries = [f'db;dur={self.time * 1000:.1f};desc="{self.count} queries"']
+        if total is not None:
+            entries.append(f'app;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_current = contextvars.ContextVar('plantcare_request_queries', default=None)
+
+
+def current_queries():
+    """The running request's RequestQueries, or None outside a request"""
+    return _current.get()
+
+
+class QueryLog:
+    """Slow-query detection, per-statement totals and EXPLAIN capture"""
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, explain=False, explain_interval=DEFAULT_EXPLAIN_INTERVAL,
+                 explain_timeout_ms=DEFAULT_EXPLAIN_TIMEOUT_MS, max_queries=DEFAULT_MAX_QUERIES,
+                 max_tracked=DEFAULT_MAX_TRACKED, connections=None):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.explain_timeout_ms = explain_timeout_ms
+        self.max_queries = max_queries
+        self.max_tracked = max_tracked
+        # (checkout, checkin) callables used by the EXPLAIN worker
+        self.connections = connections
+        self._lock = threading.Lock()
+        self._statements = {}  # normalized sql -> totals
+        self._explained = {}  # normalized sql -> time of last EXPLAIN
+        self._recent = deque(maxlen=RECENT_SLOW)
+        self._executor = None
+        self._pending = 0
+        self._metrics = {'queries': 0, 'query_time_total': 0.0, 'slow_queries': 0,
+                         'explains': 0, 'explains_skipped': 0, 'explain_failures': 0}
+
+    def record(self, cursor, sql, params, elapsed):
+        """Called by TimingCursor after every statement"""
+        request = _current.get()
+        if request is not None:
+            request.count += 1
+            request.time += elapsed
+        slow = elapsed * 1000 >= self.slow_ms
+        if not slow:
+            with self._lock:
+                self._metrics['queries'] += 1
+                self._metrics['query_time_total'] += elapsed
+            return
+
+        source, source_params = resolve(sql, params)
+        normalized = normalize_sql(source)
+        rows = cursor.rowcount
+        if request is not None:
+            request.slow += 1
+        with self._lock:
+            m = self._metrics
+            m['queries'] += 1
+            m['query_time_total'] += elapsed
+            m['slow_queries'] += 1
+            totals = self._statements.get(normalized)
+            if totals is None and len(self._statements) < self.max_tracked:
+                totals = self._statements[normalized] = {'count': 0, 'total_time': 0.0, 'max_time': 0.0}
+            if totals is not None:
+                totals['count'] += 1
+                totals['total_time'] += elapsed
+                totals['max_time'] = max(totals['max_time'], elapsed)
+            self._recent.append({
+                "query": normalized[:100] + "..." if len(normalized) > 100 else normalized,
+                "execution_time": elapsed,
+                "row_count": rows,
+                "timestamp": time.time(),
+            })
+        types = describe_params(source_params)
+        logger.warning(f"Slow query detected: {elapsed * 1000:.1f}ms, {rows} rows - {normalized}"
+                       + (f" [params: {types}]" if types else ''))
+        if self.explain and is_read_only(source):
+            self._schedule_explain(normalized, source, source_params)
+
+    def _schedule_explain(self, normalized, sql, params):
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(normalized)
+            if (last is not None and now - last < self.explain_interval) or self.connections is None:
+                return
+            if self._pending >= MAX_PENDING_EXPLAINS:
+                self._metrics['explains_skipped'] += 1
+                return
+            if len(self._explained) >= self.max_tracked:
+                self._explained.clear()
+            self._explained[normalized] = now
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+            executor = self._executor
+        executor.submit(self._explain, normalized, sql, params)
+
+    def _explain(self, normalized, sql, params):
+        checkout, checkin = self.connections
+        conn = None
+        try:
+            conn = checkout()
+            # A plain cursor, so the EXPLAIN itself is not timed or explained again
+            cur = conn.cursor(cursor_factory=extensions.cursor)
+            try:
+                cur.execute(f'SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}')
+                cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params or None)
+                plan = '\n'.join(row[0] for row in cur.fetchall())
+            finally:
+                cur.close()
+                # ANALYZE really runs the statement; never keep its effects
+                conn.rollback()
+            with self._lock:
+                self._metrics['explains'] += 1
+                totals = self._statements.get(normalized)
+                if totals is not None:
+                    totals['plan'] = plan
+            logger.warning(f"EXPLAIN (ANALYZE, BUFFERS) for slow query {normalized}:\n{plan}")
+        except Exception as e:
+            with self._lock:
+                self._metrics['explain_failures'] += 1
+            logger.warning(f"Could not EXPLAIN slow query: {e}")
+        finally:
+            if conn is not None:
+                checkin(conn)
+            with self._lock:
+                self._pending -= 1
+
+    def finished_request(self, request_queries, route=None):
+        if request_queries.count > self.max_queries:
+            logger.warning(f"{route or 'Request'} issued {request_queries.count} queries "
+                           f"({request_queries.time * 1000:.1f}ms); check for N+1 access")
+
+    def slowest(self, limit=10):
+        """Slow statements by total time, with their last captured plan"""
+        with self._lock:
+            ranked = sorted(self._statements.items(), key=lambda item: item[1]['total_time'], reverse=True)
+            return [dict(totals, query=sql) for sql, totals in ranked[:limit]]
+
+    def recent_slow(self):
+        with self._lock:
+            return list(self._recent)
+
+    def stats(self):
+        with self._lock:
+            m = dict(self._metrics)
+            m['query_time_avg'] = m['query_time_total'] / m['queries'] if m['queries'] else 0.0
+            m['slow_ms'] = self.slow_ms
+            return m
+
+
+query_log = QueryLog()
+
+
+class TimingCursor(extensions.cursor):
+    """psycopg2 cursor that reports every statement to query_log"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            query_log.record(self, query, vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            query_log.record(self, query, None, time.perf_counter() - start)
+
+
+def configure_tracing(settings, connections=None):
+    """Apply plantcare.sql.* settings; connections is the (checkout, checkin) pair for EXPLAIN"""
+    global query_log
+    query_log = QueryLog(
+        slow_ms=float(settings.get('plantcare.sql.slow_ms', DEFAULT_SLOW_MS)),
+        explain=settings.get('plantcare.sql.explain', 'false').lower() in ('true', '1', 'yes', 'on'),
+        explain_interval=float(settings.get('plantcare.sql.explain_interval', DEFAULT_EXPLAIN_INTERVAL)),
+        explain_timeout_ms=int(settings.get('plantcare.sql.explain_timeout_ms', DEFAULT_EXPLAIN_TIMEOUT_MS)),
+        max_queries=int(settings.get('plantcare.sql.max_queries', DEFAULT_MAX_QUERIES)),
+        connections=connections,
+    )
+    logger.info(f"SQL tracing: slow queries over {query_log.slow_ms:.0f}ms, "
+                f"EXPLAIN {'on' if query_log.explain else 'off'}")
+
+
+def query_timing_tween_factory(handler, registry):
+    def query_timing_tween(request):
+        request_queries = RequestQueries()
+        token = _current.set(request_queries)
+        start = time.perf_counter()
+        try:
+            response = handler(request)
+        finally:
+            _current.reset(token)
+        response.headers['Server-Timing'] = request_queries.server_timing(time.perf_counter() - start)
+        route = request.matched_route.name if getattr(request, 'matched_route', None) else None
+        query_log.finished_request(request_queries, route)
+        return response
+    return query_timing_tween
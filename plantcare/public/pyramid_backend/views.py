@@ -9,61 +9,74 @@ import bcrypt
 import time
 from psycopg2 import pool
 try:
-    from .caching import cached, clear_all_cache
+    from .caching import cached, clear_all_cache, invalidate_tags, today_key
 except ImportError:
     # For testing purposes, create dummy decorators
-    def cached(key_prefix="", expiry=300):
+    def cached(key_prefix="", expiry=300, tags=(), stale=0, wait_timeout=10, encode=False, vary=None):
         def decorator(func):
             return func
         return decorator
     def clear_all_cache():
         pass
+    def invalidate_tags(*tags):
+        pass
+    def today_key():
+        return ''
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Enhanced session management with cache for authentication performance
-SESSIONS = set()
-# Simple auth cache to avoid repeated database lookups
-AUTH_CACHE = {}
-AUTH_CACHE_TTL = 300  # 5 minutes cache for successful authentications
-
+# Verified-login cache to avoid repeated database lookups and bcrypt (see credentials.py)
 def is_auth_cached(username, password):
-    """Check if authentication is cached and still valid"""
-    cache_key = f"{username}:{hash(password)}"
-    cached_entry = AUTH_CACHE.get(cache_key)
-    if cached_entry and time.time() - cached_entry['timestamp'] < AUTH_CACHE_TTL:
+    """Check if this username/password was verified recently"""
+    if credentials.credential_cache.check(username, password):
         logger.info(f"Auth cache hit for user: {username}")
         return True
     return False
 
 def cache_auth(username, password):
-    """Cache successful authentication"""
-    cache_key = f"{username}:{hash(password)}"
-    AUTH_CACHE[cache_key] = {
-        'timestamp': time.time(),
-        'username': username
-    }
+    """Remember a login bcrypt just verified"""
+    credentials.credential_cache.store(username, password)
     logger.info(f"Auth cached for user: {username}")
 
-# Create a connection pool
+try:
+    from .db_pool import PoolTimeout, create_pool
+    from . import statements
+    from . import tracing
+except ImportError:
+    from db_pool import PoolTimeout, create_pool
+    import statements
+    import tracing
+
+# Create a connection pool with default sizing; includeme() rebuilds it
+# from the plantcare.db.* settings. Connections are opened on first use
+# and get the hot statements prepared (see statements.py). Their cursors
+# time every statement for the request's Server-Timing (see tracing.py).
 pg_pool = None
 try:
-    pg_pool = pool.SimpleConnectionPool(
-        minconn=2,  # Increased minimum connections
-        maxconn=20,  # Increased maximum connections for better concurrency
-        dbname='plantcare_db',
-        user='postgres',
-        password='jeremiaz',
-        host='localhost'
-    )
-    logger.info("Database connection pool created successfully (2-20 connections)")
+    pg_pool = create_pool({}, prefill=False, on_connect=[statements.registry.prepare_all],
+                          cursor_factory=tracing.TimingCursor)
 except Exception as e:
     logger.error(f"Error creating connection pool: {e}")
 
+def fetch_dashboard_row(cur):
+    """Dashboard row from the trigger-maintained summary tables, or the full CTE if they are missing"""
+    if queries.dashboard_summary.available():
+        try:
+            statements.registry.execute(cur, queries.DASHBOARD_SUMMARY_QUERY)
+            queries.dashboard_summary.mark_present()
+            return cur.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            cur.connection.rollback()
+            queries.dashboard_summary.mark_missing()
+            logger.warning("Dashboard summary tables missing (run dashboard_summary.sql), using the full query")
+    statements.registry.execute(cur, queries.DASHBOARD_QUERY)
+    return cur.fetchone()
+
 @view_config(route_name='dashboard_summary', renderer='json', request_method='GET')
-@cached(expiry=60)  # Cache for 60 seconds since dashboard data changes less frequently
+# Invalidated by writes, refreshed in background; keyed by date for totalJadwalHariIni
+@cached(expiry=300, tags=('tanaman', 'jadwal'), stale=60, encode=True, vary=today_key)
 def dashboard_summary_view(request):
     conn = None
     try:
@@ -71,100 +84,14 @@ def dashboard_summary_view(request):
         cur = conn.cursor()
         
         # Single optimized query to get all dashboard data
-        dashboard_query = """
-        WITH 
-        tanaman_counts AS (
-            SELECT 
-                COUNT(*) as total_tanaman,
-                COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE - INTERVAL '7 days') as recent_count
-            FROM tanaman
-        ),
-        jadwal_counts AS (
-            SELECT 
-                COUNT(*) as total_jadwal,
-                COUNT(*) FILTER (WHERE tanggal = CURRENT_DATE) as total_jadwal_hari_ini,
-                COUNT(*) FILTER (WHERE tanggal >= CURRENT_DATE) as upcoming_count
-            FROM jadwal
-        ),
-        recent_plants AS (
-            SELECT 
-                json_agg(
-                    json_build_object(
-                        'id', id,
-                        'nama', nama, 
-                        'jenis', jenis,
-                        'lokasi', lokasi,
-                        'created_at', created_at::text
-                    ) ORDER BY created_at DESC
-                ) as plants
-            FROM (
-                SELECT id, nama, jenis, lokasi, created_at 
-                FROM tanaman 
-                ORDER BY created_at DESC 
-                LIMIT 5
-            ) t
-        ),
-        upcoming_schedules AS (
-            SELECT 
-                json_agg(
-                    json_build_object(
-                        'id', id,
-                        'namaTanaman', nama_tanaman,
-                        'kegiatan', kegiatan,
-                        'tanggal', tanggal::text
-                    ) ORDER BY tanggal ASC
-                ) as schedules
-            FROM (
-                SELECT id, nama_tanaman, kegiatan, tanggal 
-                FROM jadwal 
-                WHERE tanggal >= CURRENT_DATE 
-                ORDER BY tanggal ASC 
-                LIMIT 5
-            ) s
-        ),
-        plant_stats AS (
-            SELECT 
-                json_agg(
-                    json_build_object(
-                        'jenis', jenis,
-                        'jumlah', count
-                    )
-                ) as stats
-            FROM (
-                SELECT jenis, COUNT(*) as count
-                FROM tanaman 
-                GROUP BY jenis
-                ORDER BY count DESC
-            ) ps
-        )
-        SELECT 
-            tc.total_tanaman,
-            jc.total_jadwal,
-            jc.total_jadwal_hari_ini,
-            COALESCE(rp.plants, '[]'::json) as recent_plants,
-            COALESCE(us.schedules, '[]'::json) as upcoming_schedules,
-            COALESCE(ps.stats, '[]'::json) as plant_stats
-        FROM tanaman_counts tc
-        CROSS JOIN jadwal_counts jc
-        CROSS JOIN recent_plants rp
-        CROSS JOIN upcoming_schedules us
-        CROSS JOIN plant_stats ps;
-        """
-        
         start_time = time.time()
-        cur.execute(dashboard_query)
-        result = cur.fetchone()
+        result = fetch_dashboard_row(cur)
         query_time = time.time() - start_time
         
         logger.info(f"Dashboard query executed in {query_time:.3f} seconds")
         
         if result:
-            total_tanaman, total_jadwal, total_jadwal_hari_ini, recent_plants_json, upcoming_schedules_json, plant_stats_json = result
-            
-            # Convert JSON strings to Python objects
-            recent_plants = recent_plants_json if recent_plants_json else []
-            upcoming_schedules = upcoming_schedules_json if upcoming_schedules_json else []
-            plant_stats = plant_stats_json if plant_stats_json else []
+            total_tanaman, total_jadwal, total_jadwal_hari_ini, recent_plants, upcoming_schedules, plant_stats = result
         else:
             # Fallback to individual queries if the optimized query fails
             logger.warning("Optimized dashboard query returned no results, falling back to individual queries")
@@ -178,31 +105,12 @@ def dashboard_summary_view(request):
             upcoming_schedules = []
             plant_stats = []
         
-        # System status (cached static data)
-        system_status = {
-            "status": "online",
-            "version": "1.0.0",
-            "lastUpdate": None,
-            "queryTime": f"{query_time:.3f}s" if 'query_time' in locals() else "unknown",
-            "weather": {
-                "condition": "sunny",
-                "temperature": 29,
-                "humidity": 70,
-                "ideal_for_plants": True
-            }
-        }
-        
         logger.info(f"Dashboard data retrieved successfully - Plants: {total_tanaman}, Schedules: {total_jadwal}")
         
-        return {
-            "totalTanaman": total_tanaman,
-            "totalJadwal": total_jadwal,
-            "totalJadwalHariIni": total_jadwal_hari_ini,
-            "recentPlants": recent_plants,
-            "upcomingSchedules": upcoming_schedules,
-            "plantStats": plant_stats,
-            "systemStatus": system_status
-        }
+        return queries.dashboard_to_dict(total_tanaman, total_jadwal, total_jadwal_hari_ini,
+                                         recent_plants, upcoming_schedules, plant_stats, query_time)
+    except PoolTimeout as e:
+        return pool_exhausted(e)
     except Exception as e:
         logger.error(f"Error in dashboard_summary_view: {e}")
         return {"error": str(e)}
@@ -211,17 +119,41 @@ def dashboard_summary_view(request):
             return_db_conn(conn)
 from pyramid.events import NewRequest
 from pyramid.view import view_config
-from pyramid.httpexceptions import HTTPFound, HTTPUnauthorized, HTTPNotFound, HTTPOk
+from pyramid.httpexceptions import HTTPFound, HTTPUnauthorized, HTTPNotFound, HTTPOk, HTTPBadRequest, HTTPServiceUnavailable
 import json
 import psycopg2
 import logging
 from psycopg2 import pool
 try:
     # Try relative import first (for normal app operation)
-    from .caching import cached, clear_all_cache
+    from .caching import cached, clear_all_cache, configure_cache, get_cache_stats, invalidate_tags
+    from . import queries
+    from . import bulk
+    from .export import EXPORT_FORMATS, ExportStream
+    from .importer import IMPORT_FORMATS, import_stream
+    from .counting import COUNT_MODES, configure_counting, count_rows, row_counter
+    from .rendering import JSONRenderer
+    from . import sessions
+    from .sessions import authenticated_user, configure_sessions, forget, remember
+    from . import hashing
+    from .hashing import HasherBusy, configure_hashing
+    from . import credentials
+    from . import metrics
 except ImportError:
     # Fall back to absolute import (for testing)
-    from caching import cached, clear_all_cache
+    from caching import cached, clear_all_cache, configure_cache, get_cache_stats, invalidate_tags
+    import queries
+    import bulk
+    from export import EXPORT_FORMATS, ExportStream
+    from importer import IMPORT_FORMATS, import_stream
+    from counting import COUNT_MODES, configure_counting, count_rows, row_counter
+    from rendering import JSONRenderer
+    import sessions
+    from sessions import authenticated_user, configure_sessions, forget, remember
+    import hashing
+    from hashing import HasherBusy, configure_hashing
+    import credentials
+    import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -234,8 +166,9 @@ def cors_tween_factory(handler, registry):
         response.headers.update({
             'Access-Control-Allow-Origin': 'http://localhost:3000',
             'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization,If-None-Match',
             'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Expose-Headers': 'ETag',
         })
         return response
     return cors_tween
@@ -246,21 +179,42 @@ def add_cors_headers_response_callback(event):
         response.headers.update({
             'Access-Control-Allow-Origin': 'http://localhost:3000',
             'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization,If-None-Match',
             'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Expose-Headers': 'ETag',
         })
     event.request.add_response_callback(cors_headers)
 
 def includeme(config):
     config.add_subscriber(add_cors_headers_response_callback, NewRequest)
+    # orjson-backed renderer for every renderer='json' view
+    config.add_renderer('json', JSONRenderer)
+    configure_cache(config.registry.settings)
+    configure_counting(config.registry.settings)
+    configure_sessions(config.registry.settings)
+    configure_hashing(config.registry.settings)
+    credentials.configure_credentials(config.registry.settings)
+    metrics.configure_metrics(config.registry.settings)
+    # request.authenticated_user: username from the signed session token, or None
+    config.add_request_method(authenticated_user, 'authenticated_user', reify=True)
+    statements.configure_statements(config.registry.settings)
+    configure_database(config.registry.settings)
+    # Slow statements are EXPLAINed on pooled connections
+    tracing.configure_tracing(config.registry.settings, connections=(get_db_conn, return_db_conn))
 
 # Handler for preflight OPTIONS requests
 @view_config(route_name='login', request_method='OPTIONS')
 @view_config(route_name='dashboard_summary', request_method='OPTIONS')
 @view_config(route_name='tanaman', request_method='OPTIONS')
 @view_config(route_name='tanaman_detail', request_method='OPTIONS')
+@view_config(route_name='tanaman_bulk', request_method='OPTIONS')
+@view_config(route_name='tanaman_export', request_method='OPTIONS')
+@view_config(route_name='tanaman_import', request_method='OPTIONS')
 @view_config(route_name='jadwal', request_method='OPTIONS')
 @view_config(route_name='jadwal_detail', request_method='OPTIONS')
+@view_config(route_name='jadwal_bulk', request_method='OPTIONS')
+@view_config(route_name='jadwal_export', request_method='OPTIONS')
+@view_config(route_name='jadwal_import', request_method='OPTIONS')
 def options_view(request):
     return Response()
 
@@ -275,13 +229,39 @@ def get_db_conn():
                 dbname='plantcare_db',
                 user='postgres',
                 password='jeremiaz',
-                host='localhost'
+                host='localhost',
+                cursor_factory=tracing.TimingCursor
             )
             return conn
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
         
+def configure_database(settings):
+    """Rebuild the connection pool from plantcare.db.* settings"""
+    global pg_pool
+    old_pool = pg_pool
+    pg_pool = create_pool(settings, on_connect=[statements.registry.prepare_all],
+                          cursor_factory=tracing.TimingCursor)
+    if old_pool:
+        old_pool.closeall()
+
+def pool_exhausted(e):
+    """503 asking the client to retry when no connection was free in time"""
+    logger.warning(f"Database connection pool exhausted: {e}")
+    return HTTPServiceUnavailable(
+        json_body={"status": "fail", "msg": "Server is busy, please retry"},
+        headers={'Retry-After': '1'}
+    )
+
+def hasher_busy(e):
+    """503 shedding login/register load while the bcrypt pool is saturated"""
+    logger.warning(f"Password hashing pool busy: {e}")
+    return HTTPServiceUnavailable(
+        json_body={"status": "fail", "msg": "Server is busy, please retry"},
+        headers={'Retry-After': str(hashing.hasher.retry_after)}
+    )
+
 # Function to return connection to pool        
 def return_db_conn(conn):
     if pg_pool and conn:
@@ -294,8 +274,27 @@ def return_db_conn(conn):
         except Exception as e:
             logger.error(f"Error closing database connection: {e}")
 
-# Session management (temporary solution)
-SESSIONS = set()
+def table_changed(table, delta=0):
+    """Invalidate cached reads of a table after a committed write and keep its row count current"""
+    invalidate_tags(table)
+    if delta:
+        row_counter.adjust(table, delta)
+
+@view_config(route_name='metrics', request_method='GET')
+def metrics_view(request):
+    """Prometheus scrape endpoint: request metrics plus cache, pool, statement and hashing stats"""
+    if not metrics.access.allows(request.headers.get('Authorization'), authenticated_user(request)):
+        return HTTPUnauthorized(json_body={"status": "fail", "msg": "Login or metrics token required"})
+    components = {
+        'cache': get_cache_stats(),
+        'db_pool': pg_pool.stats() if pg_pool else {},
+        'hasher': hashing.hasher.stats(),
+        'credential_cache': credentials.credential_cache.stats(),
+        'session_revocations': sessions.manager.revocations.stats(),
+        'sql': tracing.query_log.stats(),
+    }
+    return Response(body=metrics.render(components, statements.registry.stats()).encode('utf-8'),
+                    content_type=metrics.CONTENT_TYPE, charset='utf-8')
 
 @view_config(route_name='home', renderer='json', request_method='GET')
 def home_view(request):
@@ -322,14 +321,14 @@ def login_view(request):
         if username == 'admin' and password == 'sainsdata':
             elapsed = time.time() - start_time
             logger.info(f"Login successful for admin via hardcoded credentials ({elapsed:.3f}s)")
-            SESSIONS.add(username)
+            remember(request, username)
             return {"status": "success", "user": username}
             
         # Check cache first to avoid database hit
         if is_auth_cached(username, password):
             elapsed = time.time() - start_time
             logger.info(f"Login successful for {username} via auth cache ({elapsed:.3f}s)")
-            SESSIONS.add(username)
+            remember(request, username)
             return {"status": "success", "user": username}
         
         # Only check database if not admin (avoid unnecessary DB calls)
@@ -338,17 +337,21 @@ def login_view(request):
             cur = conn.cursor()
             
             # Optimized query with explicit SELECT and potential for index usage
-            cur.execute('SELECT username, password_hash FROM users WHERE username = %s LIMIT 1', [username])
+            statements.registry.execute(cur, queries.LOGIN_QUERY, [username])
             user_data = cur.fetchone()
+            # Hand the connection back before the slow bcrypt check
+            return_db_conn(conn)
+            conn = None
             
             if user_data:
                 stored_username, stored_password_hash = user_data
                 
-                # BCrypt check (this is inherently slow for security - ~100-300ms)
-                if bcrypt.checkpw(password.encode('utf-8'), stored_password_hash.encode('utf-8')):
+                # BCrypt check (this is inherently slow for security - ~100-300ms),
+                # run on the bounded hashing pool instead of this serving thread
+                if hashing.hasher.run(bcrypt.checkpw, password.encode('utf-8'), stored_password_hash.encode('utf-8')):
                     elapsed = time.time() - start_time
                     logger.info(f"Login successful for {username} via database ({elapsed:.3f}s)")
-                    SESSIONS.add(username)
+                    remember(request, username)
                     # Cache the successful authentication
                     cache_auth(username, password)
                     return {"status": "success", "user": username}
@@ -359,6 +362,8 @@ def login_view(request):
                 elapsed = time.time() - start_time
                 logger.warning(f"User not found: {username} ({elapsed:.3f}s)")
                 
+        except HasherBusy as e:
+            return hasher_busy(e)
         except Exception as db_error:
             elapsed = time.time() - start_time
             logger.error(f"Database error during login: {db_error} ({elapsed:.3f}s)")
@@ -378,9 +383,10 @@ def login_view(request):
 @view_config(route_name='logout', renderer='json', request_method='POST')
 def logout_view(request):
     try:
-        data = request.json_body
-        username = data.get('username')
-        SESSIONS.discard(username)
+        # The session comes from the signed token, not from the request body
+        username = forget(request)
+        if username:
+            logger.info(f"Logged out {username}")
         return {"status": "logout"}
     except Exception as e:
         logger.error(f"Logout error: {e}")
@@ -416,21 +422,22 @@ def register_view(request):
         cur = conn.cursor()
         
         # Check if user already exists
-        cur.execute('SELECT username FROM users WHERE username = %s', [username])
+        cur.execute(queries.USER_EXISTS_QUERY, [username])
         if cur.fetchone():
             return HTTPUnauthorized(json_body={"status": "fail", "msg": "Username already exists"})
         
         # Hash password and create user
-        password_hash = hash_password(password)
-        cur.execute(
-            'INSERT INTO users (username, password_hash) VALUES (%s, %s)',
-            [username, password_hash]
-        )
+        password_hash = hashing.hasher.run(hash_password, password)
+        cur.execute(queries.USER_INSERT, [username, password_hash])
         conn.commit()
+        # Drop logins cached for an earlier account or password of this name
+        credentials.credential_cache.invalidate_user(username)
         
         logger.info(f"User registered successfully: {username}")
         return {"status": "success", "msg": "User registered successfully"}
         
+    except HasherBusy as e:
+        return hasher_busy(e)
     except Exception as e:
         logger.error(f"Registration error: {e}")
         if conn:
@@ -442,7 +449,7 @@ def register_view(request):
 
 # --- CRUD TANAMAN ---
 @view_config(route_name='tanaman', renderer='json', request_method='GET')
-@cached(expiry=60)  # Increased cache time for better performance
+@cached(expiry=300, tags=('tanaman',), encode=True)  # Invalidated by tanaman writes
 def get_tanaman(request):
     conn = None
     try:
@@ -458,6 +465,13 @@ def get_tanaman(request):
         limit = request.params.get('limit', '50')  # Reduced default limit for better performance
         offset = request.params.get('offset', '0')  # Default offset to 0
         
+        # Opaque keyset cursor (preferred over offset for deep pages)
+        cursor = request.params.get('cursor')
+        # Counting strategy: auto, exact, estimate or none
+        count_mode = request.params.get('count', 'auto')
+        # Result order: default, or relevance to rank search matches
+        sort = request.params.get('sort', 'default')
+        
         # Validate inputs to prevent SQL injection
         try:
             limit = int(limit)
@@ -467,60 +481,53 @@ def get_tanaman(request):
         except ValueError:
             limit = 50
             offset = 0
+        try:
+            cursor = queries.decode_cursor(cursor) if cursor else None
+        except queries.InvalidCursor as e:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": str(e)})
+        if count_mode not in COUNT_MODES:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": f"count must be one of {', '.join(COUNT_MODES)}"})
+        if sort not in queries.SORT_MODES:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": f"sort must be one of {', '.join(queries.SORT_MODES)}"})
+        rank_term = search if sort == 'relevance' else None
             
-        # Build optimized query with indexed columns
-        base_query = 'SELECT id, nama, jenis, lokasi, created_at FROM tanaman'
-        count_query = 'SELECT COUNT(*) FROM tanaman'
-        params = []
-        
-        if search:
-            # Use indexed columns for faster search
-            search_param = f'%{search}%'
-            where_clause = ' WHERE nama ILIKE %s OR jenis ILIKE %s OR lokasi ILIKE %s'
-            base_query += where_clause
-            count_query += where_clause
-            params = [search_param, search_param, search_param]
-        
-        # Add ordering by indexed column and pagination
-        base_query += ' ORDER BY created_at DESC LIMIT %s OFFSET %s'
-        
-        # Execute main query with performance monitoring
+        # Build optimized query; search is served by the pg_trgm indexes
+        where_clauses, params = queries.tanaman_filters(search)
+        base_query, page_params = queries.tanaman_page_query(where_clauses, params, limit, offset, cursor, rank_term)
+        
+        # Execute main query (prepared per connection) with performance monitoring
         query_start = time.time()
-        if params:
-            cur.execute(base_query, params + [limit, offset])
-        else:
-            cur.execute(base_query, [limit, offset])
+        statements.registry.execute(cur, base_query, page_params, name='tanaman_page')
 
-        rows = cur.fetchall()
-        tanaman = [
-            {"id": r[0], "nama": r[1], "jenis": r[2], "lokasi": r[3], "created_at": str(r[4])}
-            for r in rows
-        ]
+        rows, next_cursor = queries.split_page(cur.fetchall(), limit, sort_index=4)
+        if rank_term:
+            next_cursor = None  # Ranked pages are offset-only
+        tanaman = [queries.tanaman_to_dict(r) for r in rows]
 
         # Get total count for pagination
         count_start = time.time()
-        if params:
-            cur.execute(count_query, params)
-        else:
-            cur.execute(count_query)
-        total_count = cur.fetchone()[0]
+        total_count, count_method = count_rows(cur, 'tanaman', where_clauses, params, count_mode)
         count_time = time.time() - count_start
         query_time = time.time() - query_start
         total_time = time.time() - start_time
 
         # Log performance metrics
-        logger.info(f"GET /tanaman - Query: {query_time:.3f}s, Count: {count_time:.3f}s, Total: {total_time:.3f}s, Rows: {len(tanaman)} (total: {total_count})")
+        logger.info(f"GET /tanaman - Query: {query_time:.3f}s, Count ({count_method}): {count_time:.3f}s, Total: {total_time:.3f}s, Rows: {len(tanaman)} (total: {total_count})")
         if total_time > 0.2:
             logger.warning(f"Slow tanaman endpoint: {total_time:.3f}s")
         return {
             "tanaman": tanaman,
             "pagination": {
                 "total": total_count,
+                "countMethod": count_method,
                 "limit": limit,
                 "offset": offset,
+                "next_cursor": next_cursor,
                 "queryTime": f"{query_time:.3f}s"
             }
         }
+    except PoolTimeout as e:
+        return pool_exhausted(e)
     except Exception as e:
         logger.error(f"Error getting tanaman: {e}")
         # Fallback to dummy data if database fails
@@ -541,15 +548,13 @@ def add_tanaman(request):
         data = request.json_body
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO tanaman (nama, jenis, lokasi) VALUES (%s, %s, %s) RETURNING id, nama, jenis, lokasi, created_at',
-            (data.get('nama'), data.get('jenis'), data.get('lokasi'))
-        )
+        cur.execute(queries.TANAMAN_INSERT, (data.get('nama'), data.get('jenis'), data.get('lokasi')))
         row = cur.fetchone()
         conn.commit()
+        table_changed('tanaman', 1)
         
         logger.info(f"Added new tanaman: {row[1]}")
-        return {"id": row[0], "nama": row[1], "jenis": row[2], "lokasi": row[3], "created_at": str(row[4])}
+        return queries.tanaman_to_dict(row)
     except Exception as e:
         if conn:
             conn.rollback()
@@ -567,16 +572,14 @@ def update_tanaman(request):
         data = request.json_body
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute(
-            'UPDATE tanaman SET nama = %s, jenis = %s, lokasi = %s WHERE id = %s RETURNING id, nama, jenis, lokasi, created_at',
-            (data.get('nama'), data.get('jenis'), data.get('lokasi'), id)
-        )
+        cur.execute(queries.TANAMAN_UPDATE, (data.get('nama'), data.get('jenis'), data.get('lokasi'), id))
         row = cur.fetchone()
         conn.commit()
         
         if row:
+            table_changed('tanaman')
             logger.info(f"Updated tanaman id {id}: {row[1]}")
-            return {"id": row[0], "nama": row[1], "jenis": row[2], "lokasi": row[3], "created_at": str(row[4])}
+            return queries.tanaman_to_dict(row)
         return HTTPNotFound(json_body={"status": "fail", "msg": f"Tanaman with id {id} not found"})
     except Exception as e:
         if conn:
@@ -594,11 +597,12 @@ def delete_tanaman(request):
         id = request.matchdict['id']
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute('DELETE FROM tanaman WHERE id = %s RETURNING id', (id,))
+        cur.execute(queries.TANAMAN_DELETE, (id,))
         row = cur.fetchone()
         conn.commit()
         
         if row:
+            table_changed('tanaman', -1)
             logger.info(f"Deleted tanaman id {id}")
             return {"status": "success", "msg": f"Tanaman with id {id} deleted"}
         return HTTPNotFound(json_body={"status": "fail", "msg": f"Tanaman with id {id} not found"})
@@ -613,7 +617,7 @@ def delete_tanaman(request):
 
 # --- CRUD JADWAL ---
 @view_config(route_name='jadwal', renderer='json', request_method='GET')
-@cached(expiry=60)  # Increased cache time
+@cached(expiry=300, tags=('jadwal',), encode=True)  # Invalidated by jadwal writes
 def get_jadwal(request):
     conn = None
     try:
@@ -631,6 +635,13 @@ def get_jadwal(request):
         limit = request.params.get('limit', '50')  # Reduced default limit
         offset = request.params.get('offset', '0')  # Default offset to 0
         
+        # Opaque keyset cursor (preferred over offset for deep pages)
+        cursor = request.params.get('cursor')
+        # Counting strategy: auto, exact, estimate or none
+        count_mode = request.params.get('count', 'auto')
+        # Result order: default, or relevance to rank search matches
+        sort = request.params.get('sort', 'default')
+        
         # Validate inputs to prevent SQL injection
         try:
             limit = int(limit)
@@ -639,112 +650,54 @@ def get_jadwal(request):
         except ValueError:
             limit = 50
             offset = 0
+        try:
+            cursor = queries.decode_cursor(cursor) if cursor else None
+        except queries.InvalidCursor as e:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": str(e)})
+        if count_mode not in COUNT_MODES:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": f"count must be one of {', '.join(COUNT_MODES)}"})
+        if sort not in queries.SORT_MODES:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": f"sort must be one of {', '.join(queries.SORT_MODES)}"})
+        rank_term = search if sort == 'relevance' else None
         
         # Build optimized query with actual table columns
-        base_query = 'SELECT id, nama_tanaman, kegiatan, tanggal FROM jadwal'
-        count_query = 'SELECT COUNT(*) FROM jadwal'
-        params = []
-        
-        where_clauses = []
-        
-        # Add search functionality
-        if search:
-            where_clauses.append('(nama_tanaman ILIKE %s OR kegiatan ILIKE %s)')
-            search_param = f'%{search}%'
-            params.extend([search_param, search_param])
-        
-        if tanaman_filter:
-            where_clauses.append('nama_tanaman ILIKE %s')
-            params.append(f'%{tanaman_filter}%')
+        where_clauses, params = queries.jadwal_filters(search, tanaman_filter, tanggal_filter)
+        base_query, page_params = queries.jadwal_page_query(where_clauses, params, limit, offset, cursor, rank_term)
         
-        if tanggal_filter:
-            where_clauses.append('tanggal::text = %s')
-            params.append(tanggal_filter)
-        
-        # Apply WHERE clauses
-        if where_clauses:
-            where_clause = ' WHERE ' + ' AND '.join(where_clauses)
-            base_query += where_clause
-            count_query += where_clause
-        
-        # Add sorting by available columns and pagination
-        base_query += ' ORDER BY tanggal ASC, id ASC LIMIT %s OFFSET %s'
-        
-        # Execute main query with performance monitoring
+        # Execute main query (prepared per connection) with performance monitoring
         query_start = time.time()
-        if params:
-            cur.execute(base_query, params + [limit, offset])
-        else:
-            cur.execute(base_query, [limit, offset])
-
-        rows = cur.fetchall()
-        jadwal = [
-            {
-                "id": r[0], 
-                "namaTanaman": r[1], 
-                "kegiatan": r[2], 
-                "tanggal": str(r[3]),
-                "waktu": None,  # Column doesn't exist in current schema
-                "status": "pending"  # Default status since column doesn't exist
-            }
-            for r in rows
-        ]
+        statements.registry.execute(cur, base_query, page_params, name='jadwal_page')
 
-        # Get total count for pagination
+        rows, next_cursor = queries.split_page(cur.fetchall(), limit, sort_index=3)
+        if rank_term:
+            next_cursor = None  # Ranked pages are offset-only
+        jadwal = [queries.jadwal_to_dict(r) for r in rows]
+
+        # Get total count for pagination (filters only, never limit/offset)
         count_start = time.time()
-        if params[:-2]:  # Exclude limit and offset from count query
-            cur.execute(count_query, params[:-2])
-        else:
-            cur.execute(count_query)
-        total_count = cur.fetchone()[0]
+        total_count, count_method = count_rows(cur, 'jadwal', where_clauses, params, count_mode)
         count_time = time.time() - count_start
         query_time = time.time() - query_start
         total_time = time.time() - start_time
 
-        logger.info(f"GET /jadwal - Query: {query_time:.3f}s, Count: {count_time:.3f}s, Total: {total_time:.3f}s, Rows: {len(jadwal)} (total: {total_count})")
+        # Log performance metrics
+        logger.info(f"GET /jadwal - Query: {query_time:.3f}s, Count ({count_method}): {count_time:.3f}s, Total: {total_time:.3f}s, Rows: {len(jadwal)} (total: {total_count})")
         if total_time > 0.2:
             logger.warning(f"Slow jadwal endpoint: {total_time:.3f}s")
-            cur.execute(count_query, params[:-2])
-        else:
-            cur.execute(count_query)
-        
-        total_count = cur.fetchone()[0]
-        query_time = time.time() - start_time
-        
-        # Log performance metrics
-        if query_time > 0.1:
-            logger.warning(f"Slow jadwal query: {query_time:.3f}s")
-        
-        logger.info(f"GET /jadwal - Retrieved {len(jadwal)} schedules (total: {total_count}) in {query_time:.3f}s")
         
         return {
             "jadwal": jadwal,
             "pagination": {
                 "total": total_count,
+                "countMethod": count_method,
                 "limit": limit,
                 "offset": offset,
+                "next_cursor": next_cursor,
                 "queryTime": f"{query_time:.3f}s"
             }
         }
-        
-        # Get total count for pagination
-        count_query = 'SELECT COUNT(*) FROM jadwal'
-        if where_clauses:
-            count_query += ' WHERE ' + ' AND '.join(where_clauses)
-            
-        cur.execute(count_query, tuple(params[:-2]) if params else None)
-        total_count = cur.fetchone()[0]
-        
-        logger.info(f"GET /jadwal - Retrieved {len(jadwal)} schedules from database (total: {total_count})")
-        # Return in format expected by frontend with pagination info
-        return {
-            "jadwal": jadwal,
-            "pagination": {
-                "total": total_count,
-                "limit": limit,
-                "offset": offset
-            }
-        }
+    except PoolTimeout as e:
+        return pool_exhausted(e)
     except Exception as e:
         logger.error(f"Error getting jadwal: {e}")
         # Fallback to dummy data if database fails
@@ -764,15 +717,13 @@ def add_jadwal(request):
         data = request.json_body
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO jadwal (nama_tanaman, kegiatan, tanggal) VALUES (%s, %s, %s) RETURNING id, nama_tanaman, kegiatan, tanggal',
-            (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal'))
-        )
+        cur.execute(queries.JADWAL_INSERT, (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal')))
         row = cur.fetchone()
         conn.commit()
+        table_changed('jadwal', 1)
         
         logger.info(f"Added new jadwal for {row[1]}")
-        return {"id": row[0], "namaTanaman": row[1], "kegiatan": row[2], "tanggal": str(row[3])}
+        return queries.jadwal_write_to_dict(row)
     except Exception as e:
         if conn:
             conn.rollback()
@@ -790,16 +741,14 @@ def update_jadwal(request):
         data = request.json_body
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute(
-            'UPDATE jadwal SET nama_tanaman = %s, kegiatan = %s, tanggal = %s WHERE id = %s RETURNING id, nama_tanaman, kegiatan, tanggal',
-            (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal'), id)
-        )
+        cur.execute(queries.JADWAL_UPDATE, (data.get('namaTanaman'), data.get('kegiatan'), data.get('tanggal'), id))
         row = cur.fetchone()
         conn.commit()
         
         if row:
+            table_changed('jadwal')
             logger.info(f"Updated jadwal id {id} for {row[1]}")
-            return {"id": row[0], "namaTanaman": row[1], "kegiatan": row[2], "tanggal": str(row[3])}
+            return queries.jadwal_write_to_dict(row)
         return HTTPNotFound(json_body={"status": "fail", "msg": f"Jadwal with id {id} not found"})
     except Exception as e:
         if conn:
@@ -817,11 +766,12 @@ def delete_jadwal(request):
         id = request.matchdict['id']
         conn = get_db_conn()
         cur = conn.cursor()
-        cur.execute('DELETE FROM jadwal WHERE id = %s RETURNING id', (id,))
+        cur.execute(queries.JADWAL_DELETE, (id,))
         row = cur.fetchone()
         conn.commit()
         
         if row:
+            table_changed('jadwal', -1)
             logger.info(f"Deleted jadwal id {id}")
             return {"status": "success", "msg": f"Jadwal with id {id} deleted"}
         return HTTPNotFound(json_body={"status": "fail", "msg": f"Jadwal with id {id} not found"})
@@ -833,3 +783,145 @@ def delete_jadwal(request):
     finally:
         if conn:
             return_db_conn(conn)
+
+# --- BULK TANAMAN / JADWAL ---
+def run_bulk(request, table, action):
+    """Apply a batch create/update/delete to table in one transaction"""
+    conn = None
+    try:
+        start_time = time.time()
+        settings = request.registry.settings or {}
+        max_items = int(settings.get('plantcare.bulk.max_items', bulk.DEFAULT_MAX_ITEMS))
+        items = bulk.read_items(request.json_body, key='ids' if action == 'delete' else 'items', max_items=max_items)
+        
+        conn = get_db_conn()
+        cur = conn.cursor()
+        if action == 'create':
+            results = bulk.bulk_insert(cur, table, items)
+        elif action == 'update':
+            results = bulk.bulk_update(cur, table, items)
+        else:
+            results = bulk.bulk_delete(cur, table, items)
+        conn.commit()
+        
+        summary = bulk.summarize(results)
+        if summary.get('created') or summary.get('updated') or summary.get('deleted'):
+            table_changed(table, summary.get('created', 0) - summary.get('deleted', 0))
+        query_time = time.time() - start_time
+        logger.info(f"Bulk {action} {table}: {len(items)} items {summary} in {query_time:.3f}s")
+        return {"status": "success", "summary": summary, "results": results, "queryTime": f"{query_time:.3f}s"}
+    except bulk.BulkRequestError as e:
+        return HTTPBadRequest(json_body={"status": "fail", "msg": str(e)})
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error in bulk {action} {table}: {e}")
+        return {"status": "error", "msg": str(e)}
+    finally:
+        if conn:
+            return_db_conn(conn)
+
+@view_config(route_name='tanaman_bulk', renderer='json', request_method='POST')
+def bulk_add_tanaman(request):
+    return run_bulk(request, 'tanaman', 'create')
+
+@view_config(route_name='tanaman_bulk', renderer='json', request_method='PUT')
+def bulk_update_tanaman(request):
+    return run_bulk(request, 'tanaman', 'update')
+
+@view_config(route_name='tanaman_bulk', renderer='json', request_method='DELETE')
+def bulk_delete_tanaman(request):
+    return run_bulk(request, 'tanaman', 'delete')
+
+@view_config(route_name='jadwal_bulk', renderer='json', request_method='POST')
+def bulk_add_jadwal(request):
+    return run_bulk(request, 'jadwal', 'create')
+
+@view_config(route_name='jadwal_bulk', renderer='json', request_method='PUT')
+def bulk_update_jadwal(request):
+    return run_bulk(request, 'jadwal', 'update')
+
+@view_config(route_name='jadwal_bulk', renderer='json', request_method='DELETE')
+def bulk_delete_jadwal(request):
+    return run_bulk(request, 'jadwal', 'delete')
+
+# --- EXPORT TANAMAN / JADWAL ---
+def export_table(request, table):
+    """Stream every matching row of table as CSV or NDJSON"""
+    fmt = request.params.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HTTPBadRequest(json_body={"status": "fail", "msg": f"format must be one of {', '.join(EXPORT_FORMATS)}"})
+    
+    search = request.params.get('search', '').strip()
+    if table == 'tanaman':
+        where_clauses, params = queries.tanaman_filters(search)
+        sql, params = queries.tanaman_export_query(where_clauses, params)
+        to_dict, fields = queries.tanaman_to_dict, queries.TANAMAN_FIELDS
+    else:
+        where_clauses, params = queries.jadwal_filters(
+            search, request.params.get('tanaman', ''), request.params.get('tanggal', ''))
+        sql, params = queries.jadwal_export_query(where_clauses, params)
+        to_dict, fields = queries.jadwal_to_dict, queries.JADWAL_FIELDS
+    
+    try:
+        conn = get_db_conn()
+    except Exception as e:
+        logger.error(f"Error starting {table} export: {e}")
+        return Response(json_body={"status": "error", "msg": str(e)}, status=503)
+    
+    logger.info(f"GET /{table}/export - Streaming {fmt}")
+    response = Response(
+        app_iter=ExportStream(conn, return_db_conn, sql, params, to_dict, fmt,
+                              name=f"export_{table}", fields=fields),
+        content_type=EXPORT_FORMATS[fmt],
+        charset='utf-8',
+    )
+    response.content_disposition = f'attachment; filename="{table}.{fmt}"'
+    return response
+
+@view_config(route_name='tanaman_export', request_method='GET')
+def export_tanaman(request):
+    return export_table(request, 'tanaman')
+
+@view_config(route_name='jadwal_export', request_method='GET')
+def export_jadwal(request):
+    return export_table(request, 'jadwal')
+
+# --- IMPORT TANAMAN / JADWAL ---
+def import_table(request, table):
+    """Load an uploaded CSV/NDJSON file into table with COPY"""
+    conn = None
+    try:
+        upload = request.POST.get('file') if request.content_type == 'multipart/form-data' else None
+        if upload is not None and hasattr(upload, 'file'):
+            fileobj, filename = upload.file, upload.filename or ''
+        else:
+            fileobj, filename = request.body_file, ''
+        
+        fmt = request.params.get('format')
+        if not fmt:
+            is_ndjson = filename.endswith('.ndjson') or request.content_type in ('application/x-ndjson', 'application/json')
+            fmt = 'ndjson' if is_ndjson else 'csv'
+        if fmt not in IMPORT_FORMATS:
+            return HTTPBadRequest(json_body={"status": "fail", "msg": f"format must be one of {', '.join(IMPORT_FORMATS)}"})
+        
+        conn = get_db_conn()
+        report = import_stream(conn, table, fileobj, fmt)
+        if report['imported']:
+            table_changed(table, report['imported'])
+        report['status'] = 'success'
+        return report
+    except Exception as e:
+        logger.error(f"Error importing {table}: {e}")
+        return {"status": "error", "msg": str(e)}
+    finally:
+        if conn:
+            return_db_conn(conn)
+
+@view_config(route_name='tanaman_import', renderer='json', request_method='POST')
+def import_tanaman(request):
+    return import_table(request, 'tanaman')
+
+@view_config(route_name='jadwal_import', renderer='json', request_method='POST')
+def import_jadwal(request):
+    return import_table(request, 'jadwal')
@@ -1,4 +1,3 @@
-from wsgiref.simple_server import make_server
 import sys
 import os
 
@@ -9,6 +8,7 @@ from pyramid.config import Configurator
 from pyramid.response import Response
 # Import directly from local path instead of as a module
 import pyramid_backend.views as views
+from pyramid_backend.server import load_settings, serve
 
 # Define cors_tween_factory if it doesn't exist
 try:
@@ -27,25 +27,46 @@ except:
             return response
         return cors_tween
 
-if __name__ == '__main__':
-    with Configurator() as config:
+def make_app(settings):
+    """Build the WSGI app; called once per worker process in prefork mode"""
+    with Configurator(settings=settings) as config:
+        # Verifies the signed session token (plantcare.session.*); added
+        # first so it sits under CORS and its 401s carry the CORS headers
+        config.add_tween('pyramid_backend.sessions.session_tween_factory')
         # Register CORS tween directly
         config.add_tween(__name__ + '.cors_tween_factory')
+        # Query count and DB time per request in Server-Timing (plantcare.sql.*)
+        config.add_tween('pyramid_backend.tracing.query_timing_tween_factory')
+        # gzip/brotli for large JSON bodies (plantcare.compress.*)
+        config.add_tween('pyramid_backend.compression.compression_tween_factory')
+        # Per-route latency histograms for GET /metrics
+        config.add_tween('pyramid_backend.metrics.metrics_tween_factory')
         # Add CORS subscriber
         config.include(views.includeme)
         config.include('pyramid_jinja2')
         config.add_route('home', '/')
         config.add_route('tanaman', '/tanaman')
+        # Bulk/export/import routes must precede the {id} routes they would otherwise match
+        config.add_route('tanaman_bulk', '/tanaman/bulk')
+        config.add_route('tanaman_export', '/tanaman/export')
+        config.add_route('tanaman_import', '/tanaman/import')
         config.add_route('tanaman_detail', '/tanaman/{id}')
         config.add_route('jadwal', '/jadwal')
+        config.add_route('jadwal_bulk', '/jadwal/bulk')
+        config.add_route('jadwal_export', '/jadwal/export')
+        config.add_route('jadwal_import', '/jadwal/import')
         config.add_route('jadwal_detail', '/jadwal/{id}')
         config.add_route('login', '/login')
         config.add_route('logout', '/logout')
         config.add_route('register', '/register')
         config.add_route('dashboard_summary', '/dashboard')
+        config.add_route('metrics', '/metrics')
         config.scan('pyramid_backend.views')
         app = config.make_wsgi_app()
-    
-    server = make_server('0.0.0.0', 6543, app)
-    print('Pyramid app running on http://localhost:6543')
-    server.serve_forever()
+    return app
+
+if __name__ == '__main__':
+    # Serving mode, workers and threads come from plantcare.server.* in the ini file
+    ini_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'public', 'pyramid_backend', 'development.ini')
+    serve(make_app, load_settings(ini_path), reload_settings=lambda: load_settings(ini_path))